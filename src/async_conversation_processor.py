@@ -0,0 +1,302 @@
+# slack_ai_assistant/async_conversation_processor.py
+import asyncio
+import json
+import logging
+import time
+from file_utils import async_open_uploaded_file, clean_up_file, file_sha256
+from openai_config import get_async_ai_client
+from logging_config import logger, log_sampled
+from config import Config
+from openai_utils import *
+from thread_cache import ts_key
+from history_compactor import compact_history
+from image_utils import get_image_variant, prepare_image_data_url, image_url_part, make_thumbnail
+from tool_registry import get_tool, get_tool_timeout, async_tool_executor
+from metrics import metrics
+from scheduler import is_cancelled
+from transcription import async_transcribe_audio, slack_audio_duration
+from semantic_cache import semantic_cache, single_turn_question, to_vector, record_hit
+from conversation_processor import ai_client, thread_cache, attachment_cache, is_image_file, is_audio_file, is_status_message, is_streaming_placeholder
+
+async_ai_client = get_async_ai_client()
+# Created on first use so it binds to the running event loop
+attachment_limit = None
+
+async def process_conversation(client, message, tools, reply=None):
+    # The placeholder goes up before history, attachments and compaction, so the user sees the bot working at once
+    if reply is not None and not reply.started:
+        await reply.start()
+    conversation_history = await get_conversation_history(client, message)
+    question = single_turn_question(conversation_history) if semantic_cache else None
+    cached_answer, question_vector = await find_semantic_answer(question)
+    if cached_answer is not None:
+        if reply is not None:
+            await reply.finish(cached_answer)
+            return None
+        return cached_answer
+    thread_key = (message["channel"], message["thread_ts"]) if "thread_ts" in message else None
+    # Token counting and the optional summary call are blocking, keep them off the event loop
+    conversation_history = await asyncio.to_thread(compact_history, ai_client, Config.SYSTEM_PROMPT, conversation_history, thread_cache if Config.THREAD_CACHE_ENABLED else None, thread_key)
+    iterations = 0
+    completion_started_at = time.monotonic()
+    while True:
+        if reply is not None:
+            result = await async_get_gpt_response_stream(async_ai_client, Config.GPT_MODEL, Config.SYSTEM_PROMPT, conversation_history, tools, reply.update)
+        else:
+            result = await async_get_gpt_response(async_ai_client, Config.GPT_MODEL, Config.SYSTEM_PROMPT, conversation_history, tools)
+        log_sampled("gpt_response", logging.INFO, 'GPT response: %s', result)
+        if is_cancelled():
+            logger.info("Run for %s/%s superseded by a newer message, dropping its answer", message['channel'], message['ts'])
+            metrics.incr("conversation.superseded")
+            if reply is not None:
+                await reply.finish("")
+            return None
+        tool_calls = getattr(result, "tool_calls", None)
+        # Text next to tool calls is the model thinking out loud; the tools still have to run
+        if not tool_calls:
+            response = result.content
+            break
+        outputs = await execute_tool_calls(client, message, tool_calls)
+        iterations += 1
+        if iterations >= Config.AGENT_MAX_ITERATIONS:
+            response = "\n\n".join(output for output in outputs if output) or None
+            break
+        conversation_history = conversation_history + [tool_calls_message(result)] + [tool_result_message(call, output) for call, output in zip(tool_calls, outputs)]
+    metrics.observe("agent.iterations", iterations)
+    if question_vector is not None and iterations == 0 and response and not response.startswith("[ERROR]"):
+        semantic_cache.add(question, question_vector, response, time.monotonic() - completion_started_at)
+    if reply is not None:
+        await reply.finish(response)
+        return None
+    return response
+
+async def find_semantic_answer(question):
+    # Returns the cached answer (or None) and the question's embedding so a fresh answer can be stored under it
+    if not question:
+        return None, None
+    started_at = time.monotonic()
+    try:
+        question_vector = to_vector(await async_get_embedding(async_ai_client, Config.EMBEDDING_MODEL, question))
+    except Exception as e:
+        logger.warning("Semantic cache lookup skipped: %s", e)
+        return None, None
+    hit = semantic_cache.search(question_vector)
+    if hit is None:
+        metrics.incr("semantic_cache.misses")
+        return None, question_vector
+    record_hit(hit[1], started_at)
+    return hit[0], None
+
+async def execute_tool_calls(client, message, tool_calls):
+    return await asyncio.gather(*[execute_tool_call_with_timeout(client, message, tool_call) for tool_call in tool_calls])
+
+async def execute_tool_call_with_timeout(client, message, tool_call):
+    timeout = get_tool_timeout(tool_call.function.name)
+    try:
+        return await asyncio.wait_for(execute_tool_call(client, message, tool_call), timeout)
+    except asyncio.TimeoutError:
+        metrics.incr(f"tool.{tool_call.function.name}.timeouts")
+        response = f'[ERROR] {tool_call.function.name} did not finish within {timeout:g}s'
+        logger.error(response)
+        return response
+
+async def execute_tool_call(client, message, tool_call):
+    function_name = tool_call.function.name
+    tool = get_tool(function_name)
+    if tool is None or tool.async_executor is None:
+        logger.warning("Model called unknown or disabled tool: %s", function_name)
+        return None
+    started_at = time.monotonic()
+    try:
+        arguments = json.loads(tool_call.function.arguments or "{}")
+        logger.info('Tool called: %s with arguments: %s', function_name, arguments)
+        return await tool.async_executor(client, message, arguments)
+    except Exception as e:
+        metrics.incr(f"tool.{function_name}.errors")
+        logger.error("Tool %s failed: %s", function_name, e)
+        return f'[ERROR] Problem running {function_name}:\n {e}'
+    finally:
+        metrics.observe(f"tool.{function_name}.seconds", time.monotonic() - started_at)
+
+@async_tool_executor("generate_image")
+async def run_generate_image(client, message, arguments):
+    description = arguments["description"]
+    size = arguments.get("size", "square")
+    variants = min(max(int(arguments.get("variants") or 1), 1), Config.IMAGE_MAX_VARIANTS)
+    started_at = time.monotonic()
+    on_image = image_preview(client, message, description, started_at) if Config.IMAGE_THUMBNAIL_PREVIEW else None
+    try:
+        images = await async_generate_image_variants(async_ai_client, Config.IMAGE_MODEL, description, size, variants, on_image)
+        # The bytes go straight to Slack, nothing is downloaded again or written to disk
+        if len(images) == 1:
+            await client.files_upload_v2(channel=message["channel"], thread_ts=message["ts"], content=images[0], filename="image.png", title=description)
+        else:
+            file_uploads = [{"content": image, "filename": f"image_{index + 1}.png", "title": description} for index, image in enumerate(images)]
+            await client.files_upload_v2(channel=message["channel"], thread_ts=message["ts"], file_uploads=file_uploads)
+        metrics.observe("image.time_to_upload_seconds", time.monotonic() - started_at)
+        return None
+    except Exception as e:
+        return f'[ERROR] Problem generating image using DALL-E:\n {e}'
+
+def image_preview(client, message, description, started_at):
+    # Uploads a thumbnail of whichever image is ready first, ahead of the full-size files
+    posted = []
+    async def on_image(image):
+        if posted:
+            return
+        posted.append(True)
+        try:
+            thumbnail = await asyncio.to_thread(make_thumbnail, image)
+            if thumbnail:
+                await client.files_upload_v2(channel=message["channel"], thread_ts=message["ts"], content=thumbnail, filename="preview.jpg", title=f"Preview: {description}")
+                metrics.observe("image.time_to_preview_seconds", time.monotonic() - started_at)
+        except Exception as e:
+            logger.warning("Could not post image preview: %s", e)
+    return on_image
+
+@async_tool_executor("generate_tts")
+async def run_generate_tts(client, message, arguments):
+    input_text = arguments["input_text"]
+    started_at = time.monotonic()
+    try:
+        if Config.IN_MEMORY_ATTACHMENTS:
+            speech_content = await async_generate_tts_bytes(async_ai_client, Config.TTS_MODEL, Config.TTS_VOICE, input_text)
+            metrics.observe("tts.synthesis_seconds", time.monotonic() - started_at)
+            await client.files_upload_v2(channel=message["channel"], thread_ts=message["ts"], content=speech_content, filename="speech.mp3", title="Text To Speech")
+        else:
+            generated_file = await async_generate_tts(async_ai_client, Config.TEMP_FILES_FOLDER, Config.TTS_MODEL, Config.TTS_VOICE, input_text)
+            metrics.observe("tts.synthesis_seconds", time.monotonic() - started_at)
+            try:
+                await client.files_upload_v2(channel=message["channel"], thread_ts=message["ts"], file=generated_file, title="Text To Speech")
+            finally:
+                clean_up_file(generated_file)
+        metrics.observe("tts.time_to_upload_seconds", time.monotonic() - started_at)
+        logger.info("Speech for %d characters uploaded in %.2fs", len(input_text), time.monotonic() - started_at)
+        return None
+    except Exception as e:
+        return f'[ERROR] Problem converting from text to speech:\n {e}'
+
+@async_tool_executor("generate_stt")
+async def run_generate_stt(client, message, arguments):
+    try:
+        transcripts = await get_audio_transcripts(message.get("files", []))
+        if not transcripts:
+            raise ValueError("No audio file attached")
+        transcript = "\n\n".join(transcripts)
+        response = f'Transcript of the audio:\n{transcript}'
+        logger.info("Audio processed and response generated: %s", response)
+    except Exception as e:
+        response = f'[ERROR] Problem converting from speech to text:\n {e}'
+        logger.error(response)
+    return response
+
+async def get_conversation_history(client, message):
+    result = []
+    if "thread_ts" in message:
+        result = await get_thread_history(client, message["channel"], message["thread_ts"])
+    else:
+        gpt_message = await create_gpt_user_message_from_slack_message(message)
+        result.append(gpt_message)
+    return result
+
+async def get_thread_history(client, channel, thread_ts):
+    key = (channel, thread_ts)
+    cached = thread_cache.get(key) if Config.THREAD_CACHE_ENABLED else None
+    if cached:
+        result, last_ts = cached
+        conversation = await client.conversations_replies(channel=channel, ts=thread_ts, oldest=last_ts)
+    else:
+        result, last_ts = [], None
+        conversation = await client.conversations_replies(channel=channel, ts=thread_ts)
+    newest_ts = last_ts
+    new_messages = []
+    if "messages" in conversation:
+        for msg in conversation["messages"]:
+            if last_ts is not None and ts_key(msg["ts"]) <= ts_key(last_ts):
+                continue
+            if newest_ts is None or ts_key(msg["ts"]) > ts_key(newest_ts):
+                newest_ts = msg["ts"]
+            new_messages.append(msg)
+    # Attachments of different replies are converted concurrently, then appended in thread order
+    converted = await asyncio.gather(*[convert_thread_message(msg) for msg in new_messages])
+    # As in the sync version, the cache stops just before a reply that is still streaming
+    cut = next((index for index, msg in enumerate(new_messages) if is_streaming_placeholder(msg)), None)
+    cacheable = None
+    for index, gpt_messages in enumerate(converted):
+        if index == cut:
+            cacheable = (list(result), new_messages[index - 1]["ts"] if index else last_ts)
+        result.extend(gpt_messages)
+    cached_messages, cached_ts = cacheable or (result, newest_ts)
+    if Config.THREAD_CACHE_ENABLED and cached_ts is not None:
+        thread_cache.put(key, cached_messages, cached_ts)
+    logger.info("Thread history %s/%s: %d new messages, cache %s %s", channel, thread_ts, len(new_messages), 'hit' if cached else 'miss', thread_cache.stats())
+    return result
+
+async def convert_thread_message(msg):
+    result = []
+    if "client_msg_id" in msg:
+        result.append(await create_gpt_user_message_from_slack_message(msg))
+    if "bot_id" in msg and not is_status_message(msg["text"]):
+        result.append({"role": "assistant", "content": msg["text"]})
+    return result
+
+async def create_gpt_user_message_from_slack_message(slack_message):
+    files = [file for file in slack_message.get("files", []) if is_image_file(file) or is_audio_file(file)]
+    if not files:
+        return {"role": "user", "content": slack_message["text"]}
+    return {"role": "user", "content": [{"type": "text", "text": slack_message["text"]}] + await map_attachments(get_attachment_part, files)}
+
+async def get_attachment_part(file):
+    if is_image_file(file):
+        return image_url_part(await get_image_data_url(file))
+    return {"type": "text", "text": f"Transcript of the audio:\n{await get_audio_transcript(file)}"}
+
+async def get_audio_transcripts(files, on_partial=None):
+    # on_partial(file, text) receives each file's transcript so far while long recordings are still being transcribed
+    async def transcribe(file):
+        return await get_audio_transcript(file, on_partial and (lambda text: on_partial(file, text)))
+    return await map_attachments(transcribe, [file for file in files if is_audio_file(file)])
+
+async def map_attachments(convert, files):
+    # The semaphore is shared with every other message, so replies of a whole thread never download more than ATTACHMENT_WORKERS files at once
+    global attachment_limit
+    if attachment_limit is None:
+        attachment_limit = asyncio.Semaphore(Config.ATTACHMENT_WORKERS)
+    async def bounded(file):
+        async with attachment_limit:
+            return await convert(file)
+    started_at = time.monotonic()
+    results = await asyncio.gather(*[bounded(file) for file in files])
+    if len(files) > 1:
+        metrics.observe("attachments.batch_seconds", time.monotonic() - started_at)
+        logger.info("Processed %d attachments in %.2fs", len(files), time.monotonic() - started_at)
+    return list(results)
+
+async def get_audio_transcript(file, on_partial=None):
+    def convert(audio_file):
+        return async_transcribe_audio(async_ai_client, (f'{file.get("id", "audio")}.{file["filetype"]}', audio_file), Config.STT_MODEL, on_partial, file.get("size"), slack_audio_duration(file))
+    return await get_cached_attachment("transcript", file, convert)
+
+async def get_image_data_url(file):
+    async def convert(image_file):
+        # Decoding and resizing is CPU bound, keep it off the event loop
+        return await asyncio.to_thread(prepare_image_data_url, image_file, file["filetype"])
+    return await get_cached_attachment(get_image_variant(), file, convert)
+
+async def get_cached_attachment(kind, file, convert):
+    file_id = file.get("id")
+    if attachment_cache and file_id:
+        payload = attachment_cache.get(kind, file_id)
+        if payload is not None:
+            logger.info("Attachment cache hit (%s) for file %s", kind, file_id)
+            return payload
+    async with async_open_uploaded_file(file, Config.SLACK_BOT_USER_TOKEN) as attached_file:
+        if not attachment_cache:
+            return await convert(attached_file)
+        digest = file_sha256(attached_file)
+        payload = attachment_cache.get_by_hash(kind, digest)
+        if payload is None:
+            logger.info("Processing %s attachment: %s", kind, file_id)
+            payload = await convert(attached_file)
+        attachment_cache.put(kind, file_id or digest, digest, payload)
+        return payload
@@ -0,0 +1,253 @@
+# slack_ai_assistant/async_event_handlers.py
+import asyncio
+import logging
+import time
+from slack_sdk.web.async_client import AsyncWebClient
+from slack_sdk.errors import SlackApiError
+from async_conversation_processor import process_conversation, get_audio_transcripts
+from conversation_processor import is_image_file, is_audio_file, invalidate_thread_history
+from slack_reply import AsyncSlackReply
+from rate_limiter import AsyncThrottledSlackClient
+from scheduler import AsyncWorkScheduler, QueueFullError, is_cancelled
+from event_router import route_message
+from event_dedupe import deduplicator, event_keys
+from job_queue import EventJob, job_queue, record_stage
+from coordination import coordinator
+from metrics import metrics
+from logging_config import logger, log_sampled, HANDLED_MESSAGE_LEVEL, BOT_RESPONSE_LEVEL
+from config import Config
+from tool_registry import get_tools
+
+slack_client = AsyncWebClient(token=Config.SLACK_BOT_USER_TOKEN)
+scheduler = AsyncWorkScheduler("async_scheduler", Config.SCHEDULER_WORKERS, Config.SCHEDULER_MAX_QUEUE, Config.SCHEDULER_PER_USER, Config.SCHEDULER_PER_CHANNEL, Config.THREAD_SERIALIZE, Config.THREAD_COALESCE)
+
+async def dispatch(event, route, thread_ts=None, event_id=None):
+    # Stage one runs inside the Bolt listener: it only records the job and hands it to the workers, so the ack is never held up
+    job = EventJob(route, event, thread_ts, event_id)
+    keys = event_keys(event, event_id)
+    if deduplicator and not await deduplicator.async_begin(keys):
+        logger.info("Dropping duplicate event %s (%s/%s)", event_id, event.get('channel'), event.get('ts'))
+        return
+    # The coordination and queue calls are sqlite writes that can wait on other processes, so they run off the event loop
+    if coordinator:
+        owner = await asyncio.to_thread(coordinator.pin_thread, job.thread_key)
+        if owner != coordinator.worker_id:
+            # The thread belongs to another worker, which picks the job up from the shared queue
+            await asyncio.to_thread(job_queue.put, job, owner)
+            if deduplicator:
+                await asyncio.to_thread(deduplicator.finish, keys, True)
+            metrics.incr("coordination.forwarded")
+            record_stage("ack", job.received_at)
+            return
+    await asyncio.to_thread(job_queue.put, job)
+    await submit_job(job)
+    record_stage("ack", job.received_at)
+
+async def submit_job(job):
+    client = AsyncThrottledSlackClient(slack_client)
+    event = job.event
+    try:
+        position = await scheduler.submit(lambda: run_job(client, job), event.get("user"), event.get("channel"), job.thread_key)
+    except QueueFullError as e:
+        logger.warning("Rejecting event %s in %s: %s", event.get('ts'), event.get('channel'), e)
+        await finish_job(job, False)
+        await post_status_message(client, event["channel"], job.thread_ts, Config.BUSY_MESSAGE)
+        return
+    if position and Config.QUEUED_MESSAGE:
+        await post_status_message(client, event["channel"], job.thread_ts, Config.QUEUED_MESSAGE.format(position=position))
+
+async def run_job(client, job):
+    # Stage two runs on a scheduler worker
+    record_stage("queue", job.received_at)
+    started_at = time.time()
+    succeeded = False
+    try:
+        if is_cancelled():
+            # A newer message in the same thread arrived while this one was queued; that run answers both
+            logger.info("Skipping job %s, superseded by a newer message in %s", job.job_id, job.thread_key)
+            succeeded = True
+            return
+        await ROUTE_HANDLERS[job.route](client, job.event)
+        succeeded = True
+    finally:
+        record_stage("run", started_at)
+        record_stage("total", job.received_at)
+        await finish_job(job, succeeded)
+
+async def finish_job(job, succeeded):
+    await asyncio.to_thread(job_queue.ack, job)
+    if deduplicator:
+        await asyncio.to_thread(deduplicator.finish, event_keys(job.event, job.event_id), succeeded)
+
+async def start_job_workers():
+    live_workers = await asyncio.to_thread(coordinator.live_workers) if coordinator else None
+    for job in await asyncio.to_thread(job_queue.recover, live_workers):
+        logger.info("Resuming job %s (%s, attempt %d) left over from the last run", job.job_id, job.route, job.attempts + 1)
+        await submit_job(job)
+    if coordinator:
+        loop = asyncio.get_running_loop()
+        coordinator.start(job_queue, lambda job: asyncio.run_coroutine_threadsafe(submit_job(job), loop).result())
+
+# Same as the sync handlers: a replayed job may find its reaction already added or already gone
+IGNORED_REACTION_ERRORS = ("already_reacted", "no_reaction")
+
+async def add_reaction(client, event):
+    try:
+        await client.reactions_add(channel=event["channel"], timestamp=event["ts"], name="sparkles")
+    except SlackApiError as e:
+        if e.response.get("error") not in IGNORED_REACTION_ERRORS:
+            raise
+
+async def remove_reaction(client, event):
+    try:
+        await client.reactions_remove(channel=event["channel"], timestamp=event["ts"], name="sparkles")
+    except SlackApiError as e:
+        if e.response.get("error") not in IGNORED_REACTION_ERRORS:
+            raise
+
+async def post_status_message(client, channel, thread_ts, text):
+    message_kwargs = {"channel": channel, "text": text}
+    if thread_ts:
+        message_kwargs["thread_ts"] = thread_ts
+    await client.chat_postMessage(**message_kwargs)
+
+def new_reply(client, channel, thread_ts=None, prefix=""):
+    if not Config.STREAMING_ENABLED:
+        return None
+    return AsyncSlackReply(client, channel, thread_ts, prefix)
+
+async def handle_audio_and_respond(client, event, thread_ts=None):
+    log_sampled("audio", logging.INFO, "handle_audio_and_respond called with event: %s", event)
+    thread_ts = thread_ts or event.get("thread_ts")
+    files = event.get("files", [])
+    audio_files = [file for file in files if is_audio_file(file)]
+    if not audio_files:
+        return False  # No audio file processed
+    reply = new_reply(client, event["channel"], thread_ts, "Transcribing the audio...\n")
+    try:
+        logger.info("Processing %d audio files", len(audio_files))
+        on_partial = None
+        if reply is not None:
+            # Long recordings stream their transcript into the reply as chunks finish; the answer then follows in the same message
+            await reply.start()
+            on_partial = transcript_progress(reply, audio_files)
+        transcript = "\n\n".join(await get_audio_transcripts(audio_files, on_partial))
+        prefix = f'Transcript of the audio:\n{transcript}\n\nResponse:\n'
+        if reply is not None:
+            reply.prefix = prefix
+        # Images shared next to the voice notes go into the same user message
+        other_files = [file for file in files if not is_audio_file(file)]
+        response_text = await process_conversation(client, {"text": transcript, "channel": event["channel"], "ts": event["ts"], "files": other_files}, get_tools(), reply)
+        response = None if reply else f'{prefix}{response_text}'
+        logger.info("Audio processed and response generated: %s", response)
+    except Exception as e:
+        response = f'[ERROR] Problem converting from speech to text:\n {e}'
+        logger.error(response)
+
+    if response:
+        if reply is not None and reply.started:
+            reply.prefix = ""
+            await reply.finish(response)
+        else:
+            await post_status_message(client, event["channel"], thread_ts, response)
+
+    logger.log(BOT_RESPONSE_LEVEL, 'Audio response sent: %s', response)
+    return True  # Indicates that the audio files were processed
+
+def transcript_progress(reply, audio_files):
+    partials = {file["id"]: "" for file in audio_files}
+    async def on_partial(file, text):
+        partials[file["id"]] = text
+        await reply.update("\n\n".join(partial for partial in partials.values() if partial))
+    return on_partial
+
+async def handle_message_events(client, body):
+    event = body.get('event', {})
+    invalidate_thread_history(event)
+    route, thread_ts = route_message(event)
+    if route:
+        await dispatch(event, route, thread_ts, body.get("event_id"))
+
+async def handle_app_mention_events(client, body):
+    event = body.get('event', {})
+    await dispatch(event, "app_mention", event["ts"], body.get("event_id"))
+
+async def handle_dm_file_share(client, event):
+    logger.info("Received file share in DM %s/%s", event["channel"], event["ts"])
+    log_sampled("dm_file_share", logging.INFO, "File share event: %s", event)
+    await add_reaction(client, event)
+
+    # Every image and audio file is converted into the one user message
+    if any(is_image_file(file) or is_audio_file(file) for file in event.get("files", [])):
+        try:
+            response = await process_conversation(client, event, get_tools(), new_reply(client, event["channel"]))
+            logger.info("Files processed and response generated: %s", response)
+        except Exception as e:
+            response = f'[ERROR] Problem processing file:\n {e}'
+            logger.error(response)
+
+        if response:
+            await client.chat_postMessage(channel=event["channel"], text=response)
+        logger.log(BOT_RESPONSE_LEVEL, 'File response sent: %s', response)
+        await remove_reaction(client, event)
+
+async def handle_dm(client, event):
+    await add_reaction(client, event)
+    logger.log(HANDLED_MESSAGE_LEVEL, 'Handling DM %s/%s from %s', event["channel"], event["ts"], event.get("user"))
+    log_sampled("dm", logging.INFO, "DM event: %s", event)
+    response = await process_conversation(client, event, get_tools(), new_reply(client, event["channel"], event.get("thread_ts")))
+    if response:
+        message_kwargs = {
+            "channel": event["channel"],
+            "text": response
+        }
+        if "thread_ts" in event:
+            message_kwargs["thread_ts"] = event["thread_ts"]
+        await client.chat_postMessage(**message_kwargs)
+    logger.log(BOT_RESPONSE_LEVEL, 'DM reply: %s', response)
+    await remove_reaction(client, event)
+
+async def handle_thread_reply(client, event):
+    await add_reaction(client, event)
+    logger.log(HANDLED_MESSAGE_LEVEL, 'Handling thread reply %s in %s/%s', event["ts"], event["channel"], event["thread_ts"])
+    log_sampled("thread_reply", logging.INFO, "Thread reply event: %s", event)
+    if not await handle_audio_and_respond(client, event):
+        # With thread_ts the whole thread is reloaded, so replies a coalesced run superseded are still part of the question
+        message = {"text": event["text"], "channel": event["channel"], "ts": event["thread_ts"], "thread_ts": event["thread_ts"]}
+        response = await process_conversation(client, message, get_tools(), new_reply(client, event["channel"], event["thread_ts"]))
+        if response:
+            await client.chat_postMessage(channel=event["channel"], thread_ts=event["thread_ts"], text=response)
+        logger.log(BOT_RESPONSE_LEVEL, 'Thread reply: %s', response)
+    await remove_reaction(client, event)
+
+async def handle_trigger_word(client, event):
+    await add_reaction(client, event)
+    logger.log(HANDLED_MESSAGE_LEVEL, 'Handling trigger word "%s" in %s/%s', Config.TRIGGER_WORD, event["channel"], event["ts"])
+    log_sampled("trigger_word", logging.INFO, "Trigger word event: %s", event)
+    if not await handle_audio_and_respond(client, event):
+        response = await process_conversation(client, event, get_tools())
+        logger.log(BOT_RESPONSE_LEVEL, 'Trigger word reply: %s', response)
+    await remove_reaction(client, event)
+
+async def handle_app_mention(client, event):
+    logger.log(HANDLED_MESSAGE_LEVEL, 'App mentioned in %s/%s', event["channel"], event["ts"])
+    log_sampled("app_mention", logging.INFO, "App mention event: %s", event)
+    await add_reaction(client, event)
+
+    if await handle_audio_and_respond(client, event, event["ts"]):
+        await remove_reaction(client, event)
+        return
+    # If no files, process the text mention
+    response = await process_conversation(client, event, get_tools(), new_reply(client, event["channel"], event["ts"]))
+    if response:
+        await client.chat_postMessage(channel=event["channel"], thread_ts=event["ts"], text=response)
+    logger.log(BOT_RESPONSE_LEVEL, 'Mention reply: %s', response)
+    await remove_reaction(client, event)
+
+ROUTE_HANDLERS = {
+    "dm_file_share": handle_dm_file_share,
+    "dm": handle_dm,
+    "thread_reply": handle_thread_reply,
+    "trigger_word": handle_trigger_word,
+    "app_mention": handle_app_mention,
+}
@@ -0,0 +1,73 @@
+# slack_ai_assistant/attachment_cache.py
+import os
+import sqlite3
+import threading
+import time
+
+class AttachmentCache:
+    def __init__(self, db_path, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS attachments ("
+            "kind TEXT NOT NULL, file_id TEXT NOT NULL, sha256 TEXT NOT NULL, "
+            "payload TEXT NOT NULL, size INTEGER NOT NULL, accessed_at REAL NOT NULL, "
+            "PRIMARY KEY (kind, file_id))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS attachments_by_hash ON attachments (kind, sha256)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS attachments_by_access ON attachments (accessed_at)")
+        self._conn.commit()
+
+    def get(self, kind, file_id):
+        return self._lookup(kind, "file_id", file_id)
+
+    def get_by_hash(self, kind, sha256):
+        return self._lookup(kind, "sha256", sha256)
+
+    def put(self, kind, file_id, sha256, payload):
+        size = len(payload.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO attachments (kind, file_id, sha256, payload, size, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, file_id, sha256, payload, size, time.time()),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM attachments").fetchone()
+        return {"entries": entries, "bytes": total, "hits": self.hits, "misses": self.misses}
+
+    def _lookup(self, kind, column, value):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT rowid, payload FROM attachments WHERE kind = ? AND {column} = ? LIMIT 1", (kind, value)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE attachments SET accessed_at = ? WHERE rowid = ?", (time.time(), row[0]))
+            self._conn.commit()
+            return row[1]
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM attachments").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used payloads until the store fits its budget again
+        for rowid, size in self._conn.execute("SELECT rowid, size FROM attachments ORDER BY accessed_at").fetchall():
+            self._conn.execute("DELETE FROM attachments WHERE rowid = ?", (rowid,))
+            total -= size
+            if total <= self.max_bytes:
+                break
@@ -1,5 +1,6 @@
 # slack_ai_assistant/config.py
 import os
+import socket
 from dotenv import load_dotenv
 from slack_bolt import App
 
@@ -9,7 +10,7 @@ class Config:
     SLACK_SOCKET_TOKEN = os.getenv("SLACK_SOCKET_TOKEN")
     SLACK_BOT_USER_TOKEN = os.getenv("SLACK_BOT_USER_TOKEN")
     SLACK_SIGNING_SECRET = os.getenv("SLACK_SIGNING_SECRET")
-    TRIGGER_WORD = os.getenv("TRIGGER_WORD", "lang")
+    TRIGGER_WORD = os.getenv("TRIGGER_WORD", "lang")  # comma-separated list of whole words
     app = App(token = SLACK_BOT_USER_TOKEN)
 
     OPENAI_KEY = os.getenv("OPENAI_KEY")
@@ -28,5 +29,123 @@ class Config:
     GPT_MODEL = os.getenv("GPT_MODEL")
     TTS_MODEL = os.getenv("TTS_MODEL")
     TTS_VOICE = os.getenv("TTS_VOICE")
+    TTS_MAX_CHARS = int(os.getenv("TTS_MAX_CHARS", 4096))  # The speech endpoint's input limit; longer text is split at sentence ends
+    TTS_WORKERS = int(os.getenv("TTS_WORKERS", 4))
     IMAGE_MODEL = os.getenv("IMAGE_MODEL")
-    STT_MODEL = os.getenv("STT_MODEL")
\ No newline at end of file
+    STT_MODEL = os.getenv("STT_MODEL")
+
+    THREAD_CACHE_ENABLED = os.getenv('THREAD_CACHE_ENABLED', 'True').lower() in ('true', '1')
+    THREAD_CACHE_MAX_BYTES = int(os.getenv("THREAD_CACHE_MAX_BYTES", 50 * 1024 * 1024))
+    THREAD_CACHE_TTL = int(os.getenv("THREAD_CACHE_TTL", 3600))
+
+
+    ATTACHMENT_CACHE_ENABLED = os.getenv('ATTACHMENT_CACHE_ENABLED', 'True').lower() in ('true', '1')
+    ATTACHMENT_CACHE_PATH = os.getenv("ATTACHMENT_CACHE_PATH", "attachment_cache.db")
+    ATTACHMENT_CACHE_MAX_BYTES = int(os.getenv("ATTACHMENT_CACHE_MAX_BYTES", 500 * 1024 * 1024))
+
+    HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", 12000))
+    HISTORY_KEEP_IMAGES = int(os.getenv("HISTORY_KEEP_IMAGES", 1))
+    HISTORY_OLD_IMAGE_POLICY = os.getenv("HISTORY_OLD_IMAGE_POLICY", "low")
+    HISTORY_SUMMARY_ENABLED = os.getenv('HISTORY_SUMMARY_ENABLED', 'False').lower() in ('true', '1')
+    SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", GPT_MODEL)
+
+    STREAMING_ENABLED = os.getenv('STREAMING_ENABLED', 'False').lower() in ('true', '1')
+    STREAM_UPDATE_INTERVAL = float(os.getenv("STREAM_UPDATE_INTERVAL", 1.5))
+
+    RUNTIME_MODE = os.getenv("RUNTIME_MODE", "sync").lower()
+
+    SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", 8))
+    SCHEDULER_MAX_QUEUE = int(os.getenv("SCHEDULER_MAX_QUEUE", 100))
+    SCHEDULER_PER_USER = int(os.getenv("SCHEDULER_PER_USER", 2))
+    SCHEDULER_PER_CHANNEL = int(os.getenv("SCHEDULER_PER_CHANNEL", 4))
+    BUSY_MESSAGE = os.getenv("BUSY_MESSAGE", "I'm busy right now, please try again in a moment.")
+    QUEUED_MESSAGE = os.getenv("QUEUED_MESSAGE", "I'm busy right now, your request is queued at position {position}.")
+    METRICS_LOG_INTERVAL = int(os.getenv("METRICS_LOG_INTERVAL", 60))
+
+    OPENAI_RPM = int(os.getenv("OPENAI_RPM", 500))
+    OPENAI_TPM = int(os.getenv("OPENAI_TPM", 150000))
+    SLACK_METHOD_RPM = int(os.getenv("SLACK_METHOD_RPM", 50))
+    RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", 5))
+    RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", 1.0))
+    RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", 30.0))
+    CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+    CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", 30.0))
+
+    DOWNLOAD_MAX_BYTES = int(os.getenv("DOWNLOAD_MAX_BYTES", 100 * 1024 * 1024))
+    DOWNLOAD_CONNECT_TIMEOUT = float(os.getenv("DOWNLOAD_CONNECT_TIMEOUT", 10))
+    DOWNLOAD_TIMEOUT = float(os.getenv("DOWNLOAD_TIMEOUT", 60))
+    DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", 256 * 1024))
+    DOWNLOAD_POOL_SIZE = int(os.getenv("DOWNLOAD_POOL_SIZE", 10))
+
+    IN_MEMORY_ATTACHMENTS = os.getenv('IN_MEMORY_ATTACHMENTS', 'True').lower() in ('true', '1')
+    SPOOL_MAX_MEMORY_BYTES = int(os.getenv("SPOOL_MAX_MEMORY_BYTES", 10 * 1024 * 1024))
+
+    IMAGE_PREPROCESSING_ENABLED = os.getenv('IMAGE_PREPROCESSING_ENABLED', 'True').lower() in ('true', '1')
+    IMAGE_ENCODE_FORMAT = os.getenv("IMAGE_ENCODE_FORMAT", "jpeg").lower()
+    IMAGE_ENCODE_QUALITY = int(os.getenv("IMAGE_ENCODE_QUALITY", 85))
+    IMAGE_DETAIL = os.getenv("IMAGE_DETAIL", "auto").lower()
+
+    IMAGE_RESPONSE_FORMAT = os.getenv("IMAGE_RESPONSE_FORMAT", "b64_json").lower()  # b64_json (image in the API response) or url (downloaded afterwards)
+    IMAGE_MAX_VARIANTS = int(os.getenv("IMAGE_MAX_VARIANTS", 4))
+    IMAGE_THUMBNAIL_PREVIEW = os.getenv('IMAGE_THUMBNAIL_PREVIEW', 'False').lower() in ('true', '1')
+    IMAGE_THUMBNAIL_SIDE = int(os.getenv("IMAGE_THUMBNAIL_SIDE", 360))
+
+    WORKSPACE_REFRESH_INTERVAL = int(os.getenv("WORKSPACE_REFRESH_INTERVAL", 3600))
+
+    LOG_UNHANDLED_MESSAGES = os.getenv('LOG_UNHANDLED_MESSAGES', 'False').lower() in ('true', '1')
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_FILE = os.getenv("LOG_FILE", "slack_bot.log")
+    LOG_FILE_FORMAT = os.getenv("LOG_FILE_FORMAT", "json").lower()  # json or text
+    LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 50 * 1024 * 1024))
+    LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 5))
+    LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")  # Share of verbose dumps kept per key, e.g. dm=1,thread_reply=0.2,gpt_response=0.1,default=0.05
+
+    TOOL_WORKERS = int(os.getenv("TOOL_WORKERS", 4))
+    TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", 120))
+    AGENT_MAX_ITERATIONS = int(os.getenv("AGENT_MAX_ITERATIONS", 1))  # 1 posts tool results as they are, more sends them back to the model
+
+    ATTACHMENT_WORKERS = int(os.getenv("ATTACHMENT_WORKERS", 4))  # Files downloaded and converted at once, shared by all messages
+
+    STT_BACKEND = os.getenv("STT_BACKEND", "openai").lower()  # openai or fake (offline, for testing)
+    STT_CHUNK_SECONDS = float(os.getenv("STT_CHUNK_SECONDS", 120))  # Longer recordings are split (needs ffmpeg, or WAV input)
+    STT_CHUNK_OVERLAP = float(os.getenv("STT_CHUNK_OVERLAP", 2))
+    STT_CHUNK_WORKERS = int(os.getenv("STT_CHUNK_WORKERS", 4))
+    STT_MAX_UPLOAD_BYTES = int(os.getenv("STT_MAX_UPLOAD_BYTES", 25 * 1024 * 1024))
+    STT_CHUNK_MIN_BYTES = int(os.getenv("STT_CHUNK_MIN_BYTES", 2 * 1024 * 1024))  # Smaller files without a known duration are sent as they are
+
+    DEDUPE_ENABLED = os.getenv('DEDUPE_ENABLED', 'True').lower() in ('true', '1')
+    DEDUPE_BACKEND = os.getenv("DEDUPE_BACKEND", "memory").lower()  # memory or sqlite
+    DEDUPE_PATH = os.getenv("DEDUPE_PATH", "dedupe.db")
+    DEDUPE_MAX_ENTRIES = int(os.getenv("DEDUPE_MAX_ENTRIES", 10000))
+    DEDUPE_TTL = int(os.getenv("DEDUPE_TTL", 3600))
+    DEDUPE_IN_FLIGHT = os.getenv("DEDUPE_IN_FLIGHT", "drop").lower()  # drop or wait
+    DEDUPE_WAIT_TIMEOUT = float(os.getenv("DEDUPE_WAIT_TIMEOUT", 30))
+
+    JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "memory").lower()  # memory or sqlite
+    JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "jobs.db")
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+
+    # Must stay the same across restarts so a restarted worker finds the jobs it left behind
+    WORKER_ID = os.getenv("WORKER_ID") or socket.gethostname()
+    WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", 1))
+    COORDINATION_ENABLED = os.getenv('COORDINATION_ENABLED', 'False').lower() in ('true', '1')
+    COORDINATION_PATH = os.getenv("COORDINATION_PATH", "coordination.db")
+    THREAD_LEASE_SECONDS = int(os.getenv("THREAD_LEASE_SECONDS", 300))
+    WORKER_HEARTBEAT_INTERVAL = float(os.getenv("WORKER_HEARTBEAT_INTERVAL", 5))
+    FORWARD_POLL_INTERVAL = float(os.getenv("FORWARD_POLL_INTERVAL", 0.5))
+
+    THREAD_SERIALIZE = os.getenv('THREAD_SERIALIZE', 'True').lower() in ('true', '1')
+    THREAD_COALESCE = os.getenv('THREAD_COALESCE', 'False').lower() in ('true', '1')
+
+    RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'False').lower() in ('true', '1')
+    RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "response_cache.db")
+    RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 200 * 1024 * 1024))
+    RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 24 * 3600))
+
+    SEMANTIC_CACHE_ENABLED = os.getenv('SEMANTIC_CACHE_ENABLED', 'False').lower() in ('true', '1')
+    SEMANTIC_CACHE_FOLDER = os.getenv("SEMANTIC_CACHE_FOLDER", "semantic_cache")
+    SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 10000))
+    SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92))
+    SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", 7 * 24 * 3600))
+    SEMANTIC_CACHE_INDEX = os.getenv("SEMANTIC_CACHE_INDEX", "flat").lower()  # flat (exact search) or lsh
+    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
\ No newline at end of file
@@ -1,110 +1,321 @@
 # slack_ai_assistant/conversation_processor.py
 import json
-import requests
-from file_utils import save_uploaded_file, clean_up_file, generate_random_file_name
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from file_utils import open_uploaded_file, clean_up_file, file_sha256
 from openai_config import get_ai_client
-from logging_config import logger
+from logging_config import logger, log_sampled
 from config import Config
 from openai_utils import *
+from thread_cache import ThreadHistoryCache, ts_key
+from attachment_cache import AttachmentCache
+from history_compactor import compact_history
+from image_utils import get_image_variant, prepare_image_data_url, image_url_part, make_thumbnail
+from tool_registry import get_tool, get_tool_timeout, tool_executor
+from metrics import metrics
+from scheduler import is_cancelled
+from transcription import transcribe_audio, slack_audio_duration
+from semantic_cache import semantic_cache, single_turn_question, to_vector, record_hit
 
 ai_client = get_ai_client()
+thread_cache = ThreadHistoryCache(Config.THREAD_CACHE_MAX_BYTES, Config.THREAD_CACHE_TTL)
+attachment_cache = AttachmentCache(Config.ATTACHMENT_CACHE_PATH, Config.ATTACHMENT_CACHE_MAX_BYTES) if Config.ATTACHMENT_CACHE_ENABLED else None
+tool_pool = ThreadPoolExecutor(max_workers=Config.TOOL_WORKERS, thread_name_prefix="tool")
+attachment_pool = ThreadPoolExecutor(max_workers=Config.ATTACHMENT_WORKERS, thread_name_prefix="attachment")
 
-def process_conversation(client, message, tools):
+IMAGE_FILETYPES = ("png", "jpg", "jpeg", "gif", "webp")
+AUDIO_FILETYPES = ("mp3", "wav", "ogg", "flac", "webm")
+# The placeholder and the scheduler's busy/queued notices are bot posts but not answers, so they stay out of the history
+STATUS_MESSAGES = {Config.WAITING_MESSAGE or "...", Config.BUSY_MESSAGE}
+QUEUED_MESSAGE_PATTERN = re.compile(r"\d+".join(re.escape(part) for part in Config.QUEUED_MESSAGE.split("{position}"))) if Config.QUEUED_MESSAGE else None
+
+def process_conversation(client, message, tools, reply=None):
+    # The placeholder goes up before history, attachments and compaction, so the user sees the bot working at once
+    if reply is not None and not reply.started:
+        reply.start()
     conversation_history = get_conversation_history(client, message)
-    result = get_gpt_response(ai_client, Config.GPT_MODEL, Config.SYSTEM_PROMPT, conversation_history, tools)
-    logger.info(f'GPT response: {result}')
-    response = None
-
-    if result.content:
-        response = result.content
-    elif result.tool_calls:
-        function_name = result.tool_calls[0].function.name
-        arguments = json.loads(result.tool_calls[0].function.arguments)
-        logger.info(f'Tool called: {function_name} with arguments: {arguments}')
-        if function_name == "generate_image":
-            description = arguments["description"]
-            size = arguments.get("size", "square")
-            try:
-                image_url = generate_image(ai_client, Config.IMAGE_MODEL, description, size)
-                image_content = requests.get(image_url)
-                image_filepath = f'{Config.TEMP_FILES_FOLDER}/{generate_random_file_name()}.jpg'
-                with open(image_filepath, "wb") as f:
-                    f.write(image_content.content)
-                client.files_upload_v2(channel=message["channel"], thread_ts=message["ts"], file=image_filepath, title=description)
-                response = None
-                clean_up_file(image_filepath)
-            except Exception as e:
-                response = f'[ERROR] Problem generating image using DALL-E:\n {e}'
-        elif function_name == "generate_tts":
-            input_text = arguments["input_text"]
+    question = single_turn_question(conversation_history) if semantic_cache else None
+    cached_answer, question_vector = find_semantic_answer(question)
+    if cached_answer is not None:
+        if reply is not None:
+            reply.finish(cached_answer)
+            return None
+        return cached_answer
+    thread_key = (message["channel"], message["thread_ts"]) if "thread_ts" in message else None
+    conversation_history = compact_history(ai_client, Config.SYSTEM_PROMPT, conversation_history, thread_cache if Config.THREAD_CACHE_ENABLED else None, thread_key)
+    iterations = 0
+    completion_started_at = time.monotonic()
+    while True:
+        if reply is not None:
+            result = get_gpt_response_stream(ai_client, Config.GPT_MODEL, Config.SYSTEM_PROMPT, conversation_history, tools, reply.update)
+        else:
+            result = get_gpt_response(ai_client, Config.GPT_MODEL, Config.SYSTEM_PROMPT, conversation_history, tools)
+        log_sampled("gpt_response", logging.INFO, 'GPT response: %s', result)
+        if is_cancelled():
+            logger.info("Run for %s/%s superseded by a newer message, dropping its answer", message['channel'], message['ts'])
+            metrics.incr("conversation.superseded")
+            if reply is not None:
+                reply.finish("")
+            return None
+        tool_calls = getattr(result, "tool_calls", None)
+        # Text next to tool calls is the model thinking out loud; the tools still have to run
+        if not tool_calls:
+            response = result.content
+            break
+        outputs = execute_tool_calls(client, message, tool_calls)
+        iterations += 1
+        if iterations >= Config.AGENT_MAX_ITERATIONS:
+            response = "\n\n".join(output for output in outputs if output) or None
+            break
+        # Hand the results back so the model can answer (or call more tools) on the next turn
+        conversation_history = conversation_history + [tool_calls_message(result)] + [tool_result_message(call, output) for call, output in zip(tool_calls, outputs)]
+    metrics.observe("agent.iterations", iterations)
+    if question_vector is not None and iterations == 0 and response and not response.startswith("[ERROR]"):
+        semantic_cache.add(question, question_vector, response, time.monotonic() - completion_started_at)
+    if reply is not None:
+        # The streamed message already holds the answer, so callers have nothing left to post
+        reply.finish(response)
+        return None
+    return response
+
+def find_semantic_answer(question):
+    # Returns the cached answer (or None) and the question's embedding so a fresh answer can be stored under it
+    if not question:
+        return None, None
+    started_at = time.monotonic()
+    try:
+        question_vector = to_vector(get_embedding(ai_client, Config.EMBEDDING_MODEL, question))
+    except Exception as e:
+        logger.warning("Semantic cache lookup skipped: %s", e)
+        return None, None
+    hit = semantic_cache.search(question_vector)
+    if hit is None:
+        metrics.incr("semantic_cache.misses")
+        return None, question_vector
+    record_hit(hit[1], started_at)
+    return hit[0], None
+
+def execute_tool_calls(client, message, tool_calls):
+    # All calls of one completion run side by side; a call that overruns its timeout is reported, not waited for
+    started_at = time.monotonic()
+    futures = [tool_pool.submit(execute_tool_call, client, message, tool_call) for tool_call in tool_calls]
+    outputs = []
+    for tool_call, future in zip(tool_calls, futures):
+        timeout = get_tool_timeout(tool_call.function.name)
+        try:
+            outputs.append(future.result(timeout=max(0, started_at + timeout - time.monotonic())))
+        except FutureTimeoutError:
+            metrics.incr(f"tool.{tool_call.function.name}.timeouts")
+            outputs.append(f'[ERROR] {tool_call.function.name} did not finish within {timeout:g}s')
+            logger.error(outputs[-1])
+    return outputs
+
+def execute_tool_call(client, message, tool_call):
+    function_name = tool_call.function.name
+    tool = get_tool(function_name)
+    if tool is None or tool.executor is None:
+        logger.warning("Model called unknown or disabled tool: %s", function_name)
+        return None
+    started_at = time.monotonic()
+    try:
+        arguments = json.loads(tool_call.function.arguments or "{}")
+        logger.info('Tool called: %s with arguments: %s', function_name, arguments)
+        return tool.executor(client, message, arguments)
+    except Exception as e:
+        metrics.incr(f"tool.{function_name}.errors")
+        logger.error("Tool %s failed: %s", function_name, e)
+        return f'[ERROR] Problem running {function_name}:\n {e}'
+    finally:
+        metrics.observe(f"tool.{function_name}.seconds", time.monotonic() - started_at)
+
+@tool_executor("generate_image")
+def run_generate_image(client, message, arguments):
+    description = arguments["description"]
+    size = arguments.get("size", "square")
+    variants = min(max(int(arguments.get("variants") or 1), 1), Config.IMAGE_MAX_VARIANTS)
+    started_at = time.monotonic()
+    on_image = image_preview(client, message, description, started_at) if Config.IMAGE_THUMBNAIL_PREVIEW else None
+    try:
+        images = generate_image_variants(ai_client, Config.IMAGE_MODEL, description, size, variants, on_image)
+        # The bytes go straight to Slack, nothing is downloaded again or written to disk
+        if len(images) == 1:
+            client.files_upload_v2(channel=message["channel"], thread_ts=message["ts"], content=images[0], filename="image.png", title=description)
+        else:
+            file_uploads = [{"content": image, "filename": f"image_{index + 1}.png", "title": description} for index, image in enumerate(images)]
+            client.files_upload_v2(channel=message["channel"], thread_ts=message["ts"], file_uploads=file_uploads)
+        metrics.observe("image.time_to_upload_seconds", time.monotonic() - started_at)
+        return None
+    except Exception as e:
+        return f'[ERROR] Problem generating image using DALL-E:\n {e}'
+
+def image_preview(client, message, description, started_at):
+    # Uploads a thumbnail of whichever image is ready first, ahead of the full-size files
+    posted = []
+    def on_image(image):
+        if posted:
+            return
+        posted.append(True)
+        try:
+            thumbnail = make_thumbnail(image)
+            if thumbnail:
+                client.files_upload_v2(channel=message["channel"], thread_ts=message["ts"], content=thumbnail, filename="preview.jpg", title=f"Preview: {description}")
+                metrics.observe("image.time_to_preview_seconds", time.monotonic() - started_at)
+        except Exception as e:
+            logger.warning("Could not post image preview: %s", e)
+    return on_image
+
+@tool_executor("generate_tts")
+def run_generate_tts(client, message, arguments):
+    input_text = arguments["input_text"]
+    started_at = time.monotonic()
+    try:
+        if Config.IN_MEMORY_ATTACHMENTS:
+            speech_content = generate_tts_bytes(ai_client, Config.TTS_MODEL, Config.TTS_VOICE, input_text)
+            metrics.observe("tts.synthesis_seconds", time.monotonic() - started_at)
+            client.files_upload_v2(channel=message["channel"], thread_ts=message["ts"], content=speech_content, filename="speech.mp3", title="Text To Speech")
+        else:
+            generated_file = generate_tts(ai_client, Config.TEMP_FILES_FOLDER, Config.TTS_MODEL, Config.TTS_VOICE, input_text)
+            metrics.observe("tts.synthesis_seconds", time.monotonic() - started_at)
             try:
-                generated_file = generate_tts(ai_client, Config.TEMP_FILES_FOLDER, Config.TTS_MODEL, Config.TTS_VOICE, input_text)
                 client.files_upload_v2(channel=message["channel"], thread_ts=message["ts"], file=generated_file, title="Text To Speech")
-                response = None
+            finally:
                 clean_up_file(generated_file)
-            except Exception as e:
-                response = f'[ERROR] Problem converting from text to speech:\n {e}'
-        elif function_name == "generate_stt":
-            try:
-                file_path = save_uploaded_file(message["files"][0], Config.SLACK_BOT_USER_TOKEN)
-                logger.info(f"Processing audio file: {file_path}")
-                transcript = generate_stt(ai_client, file_path, Config.STT_MODEL)
-                clean_up_file(file_path)
-                response = f'Transcript of the audio:\n{transcript}'
-                logger.info(f"Audio processed and response generated: {response}")
-            except Exception as e:
-                response = f'[ERROR] Problem converting from speech to text:\n {e}'
-                logger.error(response)
+        metrics.observe("tts.time_to_upload_seconds", time.monotonic() - started_at)
+        logger.info("Speech for %d characters uploaded in %.2fs", len(input_text), time.monotonic() - started_at)
+        return None
+    except Exception as e:
+        return f'[ERROR] Problem converting from text to speech:\n {e}'
+
+@tool_executor("generate_stt")
+def run_generate_stt(client, message, arguments):
+    try:
+        transcripts = get_audio_transcripts(message.get("files", []))
+        if not transcripts:
+            raise ValueError("No audio file attached")
+        transcript = "\n\n".join(transcripts)
+        response = f'Transcript of the audio:\n{transcript}'
+        logger.info("Audio processed and response generated: %s", response)
+    except Exception as e:
+        response = f'[ERROR] Problem converting from speech to text:\n {e}'
+        logger.error(response)
     return response
 
 def get_conversation_history(client, message):
     result = []
     if "thread_ts" in message:
-        conversation = client.conversations_replies(channel=message["channel"], ts=message["thread_ts"])
-        if "messages" in conversation:
-            for msg in conversation["messages"]:
-                if "client_msg_id" in msg:
-                    gpt_message = create_gpt_user_message_from_slack_message(msg)
-                    result.append(gpt_message)
-                if "bot_id" in msg and msg["text"] != Config.WAITING_MESSAGE:
-                    result.append({"role": "assistant", "content": msg["text"]})
+        result = get_thread_history(client, message["channel"], message["thread_ts"])
     else:
         gpt_message = create_gpt_user_message_from_slack_message(message)
         result.append(gpt_message)
     return result
 
-def create_gpt_user_message_from_slack_message(slack_message):
-    if "files" in slack_message:
-        attached_file = slack_message["files"][0]
-        if attached_file["filetype"].lower() in ["png", "jpg", "jpeg", "gif", "webp"]:
-            image_file = save_uploaded_file(attached_file, Config.SLACK_BOT_USER_TOKEN)
-            base64_image = encode_image(image_file)
-            result = {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": slack_message["text"]},
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64_image}"
-                        },
-                    },
-                ],
-            }
-            clean_up_file(image_file)
-        elif attached_file["filetype"].lower() in ["mp3", "wav", "ogg", "flac"]:
-            audio_file = save_uploaded_file(attached_file, Config.SLACK_BOT_USER_TOKEN)
-            transcript = generate_stt(ai_client, audio_file, Config.STT_MODEL)
-            result = {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": slack_message["text"]},
-                    {"type": "text", "text": f"Transcript of the audio:\n{transcript}"},
-                ],
-            }  
-            clean_up_file(audio_file)
-        else:
-            result = {"role": "user", "content": slack_message["text"]}
+def invalidate_thread_history(event):
+    # Edits and deletions change messages the cached history was built from; the bot's own streamed updates do not count
+    if event.get("subtype") not in ("message_changed", "message_deleted") or not Config.THREAD_CACHE_ENABLED:
+        return
+    changed = event.get("message") or event.get("previous_message") or {}
+    if changed.get("thread_ts") and "bot_id" not in changed:
+        thread_cache.invalidate((event["channel"], changed["thread_ts"]))
+
+def get_thread_history(client, channel, thread_ts):
+    key = (channel, thread_ts)
+    cached = thread_cache.get(key) if Config.THREAD_CACHE_ENABLED else None
+    if cached:
+        # Only replies newer than the cached ones need to be fetched and converted
+        result, last_ts = cached
+        conversation = client.conversations_replies(channel=channel, ts=thread_ts, oldest=last_ts)
     else:
-        result = {"role": "user", "content": slack_message["text"]}
-    return result
\ No newline at end of file
+        result, last_ts = [], None
+        conversation = client.conversations_replies(channel=channel, ts=thread_ts)
+    newest_ts = last_ts
+    new_messages = 0
+    cacheable = None
+    if "messages" in conversation:
+        for msg in conversation["messages"]:
+            if last_ts is not None and ts_key(msg["ts"]) <= ts_key(last_ts):
+                continue
+            if cacheable is None and is_streaming_placeholder(msg):
+                cacheable = (list(result), newest_ts)
+            if newest_ts is None or ts_key(msg["ts"]) > ts_key(newest_ts):
+                newest_ts = msg["ts"]
+            new_messages += 1
+            if "client_msg_id" in msg:
+                gpt_message = create_gpt_user_message_from_slack_message(msg)
+                result.append(gpt_message)
+            if "bot_id" in msg and not is_status_message(msg["text"]):
+                result.append({"role": "assistant", "content": msg["text"]})
+    cached_messages, cached_ts = cacheable or (result, newest_ts)
+    if Config.THREAD_CACHE_ENABLED and cached_ts is not None:
+        thread_cache.put(key, cached_messages, cached_ts)
+    logger.info("Thread history %s/%s: %d new messages, cache %s %s", channel, thread_ts, new_messages, 'hit' if cached else 'miss', thread_cache.stats())
+    return result
+
+def is_streaming_placeholder(msg):
+    # A reply still streaming is edited into the answer later, and bot edits do not invalidate the cache. The cache
+    # stops just before it, so the next fetch reads it again once it holds the answer.
+    return "bot_id" in msg and msg.get("text") == (Config.WAITING_MESSAGE or "...")
+
+def is_status_message(text):
+    return text in STATUS_MESSAGES or bool(QUEUED_MESSAGE_PATTERN and QUEUED_MESSAGE_PATTERN.fullmatch(text or ""))
+
+def create_gpt_user_message_from_slack_message(slack_message):
+    files = [file for file in slack_message.get("files", []) if is_image_file(file) or is_audio_file(file)]
+    if not files:
+        return {"role": "user", "content": slack_message["text"]}
+    return {"role": "user", "content": [{"type": "text", "text": slack_message["text"]}] + map_attachments(get_attachment_part, files)}
+
+def get_attachment_part(file):
+    if is_image_file(file):
+        return image_url_part(get_image_data_url(file))
+    return {"type": "text", "text": f"Transcript of the audio:\n{get_audio_transcript(file)}"}
+
+def get_audio_transcripts(files, on_partial=None):
+    # on_partial(file, text) receives each file's transcript so far while long recordings are still being transcribed
+    def transcribe(file):
+        return get_audio_transcript(file, on_partial and (lambda text: on_partial(file, text)))
+    return map_attachments(transcribe, [file for file in files if is_audio_file(file)])
+
+def map_attachments(convert, files):
+    # Every file of a message is fetched and converted at once, so the wait is the slowest file rather than the sum
+    if len(files) <= 1:
+        return [convert(file) for file in files]
+    started_at = time.monotonic()
+    results = list(attachment_pool.map(convert, files))
+    metrics.observe("attachments.batch_seconds", time.monotonic() - started_at)
+    logger.info("Processed %d attachments in %.2fs", len(files), time.monotonic() - started_at)
+    return results
+
+def is_image_file(file):
+    return file.get("filetype", "").lower() in IMAGE_FILETYPES
+
+def is_audio_file(file):
+    return file.get("filetype", "").lower() in AUDIO_FILETYPES
+
+def get_audio_transcript(file, on_partial=None):
+    def convert(audio_file):
+        return transcribe_audio(ai_client, (f'{file.get("id", "audio")}.{file["filetype"]}', audio_file), Config.STT_MODEL, on_partial, file.get("size"), slack_audio_duration(file))
+    return get_cached_attachment("transcript", file, convert)
+
+def get_image_data_url(file):
+    return get_cached_attachment(get_image_variant(), file, lambda image_file: prepare_image_data_url(image_file, file["filetype"]))
+
+def get_cached_attachment(kind, file, convert):
+    # Known Slack file ids are served without downloading; identical bytes re-uploaded under a new id are matched by sha256
+    file_id = file.get("id")
+    if attachment_cache and file_id:
+        payload = attachment_cache.get(kind, file_id)
+        if payload is not None:
+            logger.info("Attachment cache hit (%s) for file %s", kind, file_id)
+            return payload
+    with open_uploaded_file(file, Config.SLACK_BOT_USER_TOKEN) as attached_file:
+        if not attachment_cache:
+            return convert(attached_file)
+        digest = file_sha256(attached_file)
+        payload = attachment_cache.get_by_hash(kind, digest)
+        if payload is None:
+            logger.info("Processing %s attachment: %s", kind, file_id)
+            payload = convert(attached_file)
+        attachment_cache.put(kind, file_id or digest, digest, payload)
+        return payload
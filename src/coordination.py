@@ -0,0 +1,87 @@
+# slack_ai_assistant/coordination.py
+import os
+import sqlite3
+import threading
+import time
+from config import Config
+from logging_config import logger
+from metrics import metrics
+
+class Coordinator:
+    # Worker heartbeats and thread leases in one sqlite file that every bot process on the host shares
+    def __init__(self, db_path, worker_id, lease_seconds, heartbeat_interval):
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval = heartbeat_interval
+        self._lock = threading.Lock()
+        self._pruned_at = 0.0
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS workers (worker_id TEXT PRIMARY KEY, heartbeat_at REAL NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS thread_leases (thread_key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)")
+        self.heartbeat()
+
+    def heartbeat(self):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO workers (worker_id, heartbeat_at) VALUES (?, ?)", (self.worker_id, time.time()))
+
+    def live_workers(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT worker_id FROM workers WHERE heartbeat_at > ?", (self._alive_after(),)).fetchall()
+        return {row[0] for row in rows} | {self.worker_id}
+
+    def pin_thread(self, thread_key):
+        # Returns the worker that owns the thread, taking the lease over when it is free, expired or held by a dead worker
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT l.owner FROM thread_leases l LEFT JOIN workers w ON w.worker_id = l.owner "
+                    "WHERE l.thread_key = ? AND l.expires_at > ? AND (l.owner = ? OR w.heartbeat_at > ?)",
+                    (thread_key, now, self.worker_id, self._alive_after()),
+                ).fetchone()
+                owner = row[0] if row else self.worker_id
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO thread_leases (thread_key, owner, expires_at) VALUES (?, ?, ?)",
+                    (thread_key, owner, now + self.lease_seconds),
+                )
+                if now - self._pruned_at > self.lease_seconds:
+                    self._conn.execute("DELETE FROM thread_leases WHERE expires_at < ?", (now,))
+                    self._pruned_at = now
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return owner
+
+    def start(self, job_queue, submit):
+        # Sends heartbeats and hands this worker the jobs other workers forwarded to it, or left behind when they died
+        def run():
+            heartbeat_at = 0.0
+            while True:
+                try:
+                    if time.monotonic() - heartbeat_at >= self.heartbeat_interval:
+                        self.heartbeat()
+                        heartbeat_at = time.monotonic()
+                    for job in job_queue.take_forwarded(self.worker_id, self.live_workers()):
+                        metrics.incr("coordination.received")
+                        submit(job)
+                except Exception as e:
+                    logger.error("Coordination loop failed: %s", e)
+                time.sleep(Config.FORWARD_POLL_INTERVAL)
+        threading.Thread(target=run, name="coordination", daemon=True).start()
+        logger.info("Coordination started for worker %s", self.worker_id)
+
+    def _alive_after(self):
+        return time.time() - 3 * self.heartbeat_interval
+
+def create_coordinator():
+    if not Config.COORDINATION_ENABLED:
+        return None
+    return Coordinator(Config.COORDINATION_PATH, Config.WORKER_ID, Config.THREAD_LEASE_SECONDS, Config.WORKER_HEARTBEAT_INTERVAL)
+
+coordinator = create_coordinator()
@@ -0,0 +1,144 @@
+# slack_ai_assistant/event_dedupe.py
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config import Config
+from logging_config import logger
+from metrics import metrics
+
+# Stores follow Redis SET NX EX / DEL semantics, so a shared key-value service can stand in for either of them
+class MemoryDedupeStore:
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def claim(self, key):
+        now = time.monotonic()
+        with self._lock:
+            seen_at = self._seen.get(key)
+            if seen_at is not None and now - seen_at < self.ttl_seconds:
+                return False
+            self._seen[key] = now
+            self._seen.move_to_end(key)
+            while len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+            return True
+
+    def release(self, key):
+        with self._lock:
+            self._seen.pop(key, None)
+
+class SqliteDedupeStore:
+    def __init__(self, db_path, ttl_seconds):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS seen_events (key TEXT PRIMARY KEY, seen_at REAL NOT NULL)")
+        self._conn.commit()
+        self._pruned_at = 0.0
+
+    def claim(self, key):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM seen_events WHERE key = ? AND seen_at < ?", (key, now - self.ttl_seconds))
+            claimed = self._conn.execute("INSERT OR IGNORE INTO seen_events (key, seen_at) VALUES (?, ?)", (key, now)).rowcount == 1
+            if now - self._pruned_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM seen_events WHERE seen_at < ?", (now - self.ttl_seconds,))
+                self._pruned_at = now
+            self._conn.commit()
+            return claimed
+
+    def release(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM seen_events WHERE key = ?", (key,))
+            self._conn.commit()
+
+class EventDeduplicator:
+    def __init__(self, stores, in_flight_mode, wait_timeout):
+        self.stores = stores
+        self.in_flight_mode = in_flight_mode
+        self.wait_timeout = wait_timeout
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def begin(self, keys):
+        running = self._try_claim(keys)
+        if running is True:
+            return True
+        if running is not None and self.in_flight_mode == "wait":
+            # A failed job releases its keys, so the duplicate gets to run once the original is done
+            metrics.incr("dedupe.waited")
+            running.wait(self.wait_timeout)
+            if self._try_claim(keys) is True:
+                return True
+        metrics.incr("dedupe.duplicates")
+        return False
+
+    async def async_begin(self, keys):
+        # The sqlite store can block on a lock held by another process, keep it off the event loop
+        running = await asyncio.to_thread(self._try_claim, keys)
+        if running is True:
+            return True
+        if running is not None and self.in_flight_mode == "wait":
+            metrics.incr("dedupe.waited")
+            await asyncio.to_thread(running.wait, self.wait_timeout)
+            if await asyncio.to_thread(self._try_claim, keys) is True:
+                return True
+        metrics.incr("dedupe.duplicates")
+        return False
+
+    def finish(self, keys, succeeded):
+        with self._lock:
+            if not succeeded:
+                # Let a Slack retry of a failed event through
+                for key in keys:
+                    for store in self.stores:
+                        store.release(key)
+            done = {self._in_flight.pop(key, None) for key in keys}
+        for event in done:
+            if event is not None:
+                event.set()
+
+    def _try_claim(self, keys):
+        # True when the keys were claimed, the in-flight job's Event when one is running, None when already handled
+        with self._lock:
+            for key in keys:
+                if key in self._in_flight:
+                    return self._in_flight[key]
+            claims = [store.claim(key) for store in self.stores for key in keys]
+            if not all(claims):
+                return None
+            running = threading.Event()
+            for key in keys:
+                self._in_flight[key] = running
+            return True
+
+def event_keys(event, event_id=None):
+    # The same message can arrive as both a message and an app_mention event, with different event ids
+    keys = []
+    if event_id:
+        keys.append(f"event:{event_id}")
+    if event.get("channel") and event.get("ts"):
+        keys.append(f"message:{event['channel']}:{event['ts']}")
+    return keys
+
+def create_deduplicator():
+    if not Config.DEDUPE_ENABLED:
+        return None
+    stores = [MemoryDedupeStore(Config.DEDUPE_MAX_ENTRIES, Config.DEDUPE_TTL)]
+    # Workers coordinating with each other must see each other's claims
+    if Config.DEDUPE_BACKEND == "sqlite" or Config.COORDINATION_ENABLED:
+        stores.append(SqliteDedupeStore(Config.DEDUPE_PATH, Config.DEDUPE_TTL))
+    logger.info("Event deduplication: %s backend, duplicates in flight %s", Config.DEDUPE_BACKEND, Config.DEDUPE_IN_FLIGHT)
+    return EventDeduplicator(stores, Config.DEDUPE_IN_FLIGHT, Config.DEDUPE_WAIT_TIMEOUT)
+
+deduplicator = create_deduplicator()
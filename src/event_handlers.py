@@ -1,201 +1,264 @@
 # slack_ai_assistant/event_handlers.py
-from conversation_processor import process_conversation
-from file_utils import save_uploaded_file, clean_up_file
+from conversation_processor import process_conversation, get_audio_transcripts, is_image_file, is_audio_file, invalidate_thread_history
 from openai_config import get_ai_client
-from logging_config import logger, HANDLED_MESSAGE_LEVEL, UNHANDLED_MESSAGE_LEVEL, BOT_RESPONSE_LEVEL
+from slack_reply import SlackReply
+from rate_limiter import ThrottledSlackClient
+from scheduler import WorkScheduler, QueueFullError, is_cancelled
+from event_router import route_message
+from event_dedupe import deduplicator, event_keys
+from job_queue import EventJob, job_queue, record_stage
+from coordination import coordinator
+from metrics import metrics
+from tool_registry import get_tools
+from logging_config import logger, log_sampled, HANDLED_MESSAGE_LEVEL, BOT_RESPONSE_LEVEL
 from config import Config
 from openai_utils import *
 from slack_bolt import App
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
 from dotenv import load_dotenv
+import logging
 import os
+import threading
+import time
 load_dotenv()  # This will load all the environment variables from a .env file located in the same directory as the script.
 SLACK_BOT_USER_TOKEN = os.getenv("SLACK_BOT_USER_TOKEN")
 
 ai_client = get_ai_client()
 app = App(token = SLACK_BOT_USER_TOKEN)
+# Jobs are replayed after restarts, so workers use their own client rather than the one of the request that queued them
+slack_client = WebClient(token=SLACK_BOT_USER_TOKEN)
+scheduler = WorkScheduler("scheduler", Config.SCHEDULER_WORKERS, Config.SCHEDULER_MAX_QUEUE, Config.SCHEDULER_PER_USER, Config.SCHEDULER_PER_CHANNEL, Config.THREAD_SERIALIZE, Config.THREAD_COALESCE)
 
-def handle_audio_and_respond(client, event):
-    logger.info(f"handle_audio_and_respond called with event: {event}")
-    if "files" in event:
-        for file in event["files"]:
-            if file["filetype"] in ["mp3", "wav", "ogg", "flac", "webm"]:
-                try:
-                    file_path = save_uploaded_file(file, Config.SLACK_BOT_USER_TOKEN)
-                    logger.info(f"Processing audio file: {file_path}")
-                    transcript = generate_stt(ai_client, file_path, Config.STT_MODEL)
-                    clean_up_file(file_path)
-                    response_text = process_conversation(client, {"text": transcript, "channel": event["channel"], "ts": event["ts"]}, get_tools())
-                    response = f'Transcript of the audio:\n{transcript}\n\nResponse:\n{response_text}'
-                    logger.info(f"Audio processed and response generated: {response}")
-                except Exception as e:
-                    response = f'[ERROR] Problem converting from speech to text:\n {e}'
-                    logger.error(response)
-                
-                if "thread_ts" in event:
-                    client.chat_postMessage(channel=event["channel"], thread_ts=event["thread_ts"], text=response)
-                else:
-                    client.chat_postMessage(channel=event["channel"], text=response)
-                
-                logger.log(BOT_RESPONSE_LEVEL, f'Audio response sent: {response}')
-                return True  # Indicates that an audio file was processed
-    return False  # No audio file processed
+def dispatch(event, route, thread_ts=None, event_id=None):
+    # Stage one runs inside the Bolt listener: it only records the job and hands it to the workers, so the ack is never held up
+    job = EventJob(route, event, thread_ts, event_id)
+    keys = event_keys(event, event_id)
+    if deduplicator and not deduplicator.begin(keys):
+        logger.info("Dropping duplicate event %s (%s/%s)", event_id, event.get('channel'), event.get('ts'))
+        return
+    if coordinator:
+        owner = coordinator.pin_thread(job.thread_key)
+        if owner != coordinator.worker_id:
+            # The thread belongs to another worker, which picks the job up from the shared queue
+            job_queue.put(job, owner)
+            if deduplicator:
+                deduplicator.finish(keys, True)
+            metrics.incr("coordination.forwarded")
+            record_stage("ack", job.received_at)
+            return
+    job_queue.put(job)
+    submit_job(job)
+    record_stage("ack", job.received_at)
 
-@app.event("message")
-def handle_message_events(client, body):
-    event = body.get('event', {})
-    if event.get('channel_type') == 'im':
-        if event.get('subtype') == 'file_share':
-            logger.info(f"Received file share event in DM: {event}")
-            client.reactions_add(channel=event["channel"], timestamp=event["ts"], name="sparkles")
-            
-            if "files" in event:
-                for file in event["files"]:
-                    if file["filetype"] in ["png", "jpg", "jpeg", "gif", "webp", "mp3", "wav", "ogg", "flac", "webm"]:
-                        try:
-                            response = process_conversation(client, event, get_tools())
-                            logger.info(f"File processed and response generated: {response}")
-                        except Exception as e:
-                            response = f'[ERROR] Problem processing file:\n {e}'
-                            logger.error(response)
-                        
-                        client.chat_postMessage(channel=event["channel"], text=response)
-                        logger.log(BOT_RESPONSE_LEVEL, f'File response sent: {response}')
-                        client.reactions_remove(channel=event["channel"], timestamp=event["ts"], name="sparkles")
-                        return  # Exit after processing the file
-        else:
-            logger.info(f"DM event: {event}")
-            client.reactions_add(channel=event["channel"], timestamp=event["ts"], name="sparkles")
-            logger.log(HANDLED_MESSAGE_LEVEL, f'Handling DM: {event}')
-            response = process_conversation(client, event, get_tools())
-            if response:  # This checks if response is not None or not an empty string
-                message_kwargs = {
-                    "channel": event["channel"],
-                    "text": response
-                }
-                if "thread_ts" in event:
-                    message_kwargs["thread_ts"] = event["thread_ts"]
-                client.chat_postMessage(**message_kwargs)
-            logger.log(BOT_RESPONSE_LEVEL, f'DM reply: {response}')
-            client.reactions_remove(channel=event["channel"], timestamp=event["ts"], name="sparkles")
-    elif "thread_ts" in event and event["parent_user_id"] == client.auth_test()["user_id"]:
+def submit_job(job):
+    client = ThrottledSlackClient(slack_client)
+    event = job.event
+    try:
+        position = scheduler.submit(lambda: run_job(client, job), event.get("user"), event.get("channel"), job.thread_key)
+    except QueueFullError as e:
+        logger.warning("Rejecting event %s in %s: %s", event.get('ts'), event.get('channel'), e)
+        finish_job(job, False)
+        post_status_message(client, event["channel"], job.thread_ts, Config.BUSY_MESSAGE)
+        return
+    if position and Config.QUEUED_MESSAGE:
+        post_status_message(client, event["channel"], job.thread_ts, Config.QUEUED_MESSAGE.format(position=position))
+
+def run_job(client, job):
+    # Stage two runs on a scheduler worker
+    record_stage("queue", job.received_at)
+    started_at = time.time()
+    succeeded = False
+    try:
+        if is_cancelled():
+            # A newer message in the same thread arrived while this one was queued; that run answers both
+            logger.info("Skipping job %s, superseded by a newer message in %s", job.job_id, job.thread_key)
+            succeeded = True
+            return
+        ROUTE_HANDLERS[job.route](client, job.event)
+        succeeded = True
+    finally:
+        record_stage("run", started_at)
+        record_stage("total", job.received_at)
+        finish_job(job, succeeded)
+
+def finish_job(job, succeeded):
+    job_queue.ack(job)
+    if deduplicator:
+        deduplicator.finish(event_keys(job.event, job.event_id), succeeded)
+
+def start_job_workers():
+    for job in job_queue.recover(coordinator.live_workers() if coordinator else None):
+        logger.info("Resuming job %s (%s, attempt %d) left over from the last run", job.job_id, job.route, job.attempts + 1)
+        submit_job(job)
+    if coordinator:
+        coordinator.start(job_queue, submit_job)
+
+# A replayed job may have reacted before the restart, or been cleaned up already; neither is a reason to fail it
+IGNORED_REACTION_ERRORS = ("already_reacted", "no_reaction")
+
+def add_reaction(client, event):
+    try:
         client.reactions_add(channel=event["channel"], timestamp=event["ts"], name="sparkles")
-        logger.log(HANDLED_MESSAGE_LEVEL, f'Handling thread reply: {event}')
-        if not handle_audio_and_respond(client, event):
-            response = process_conversation(client, {"text": event["text"], "channel": event["channel"], "ts": event["thread_ts"]}, get_tools())
-            client.chat_postMessage(channel=event["channel"], thread_ts=event["thread_ts"], text=response)
-            logger.log(BOT_RESPONSE_LEVEL, f'Thread reply: {response}')
+    except SlackApiError as e:
+        if e.response.get("error") not in IGNORED_REACTION_ERRORS:
+            raise
+
+def remove_reaction(client, event):
+    try:
         client.reactions_remove(channel=event["channel"], timestamp=event["ts"], name="sparkles")
-    elif event["channel_type"] == "channel":
-        if Config.TRIGGER_WORD.lower() in event["text"].lower():
-            client.reactions_add(channel=event["channel"], timestamp=event["ts"], name="sparkles")
-            logger.log(HANDLED_MESSAGE_LEVEL, f'Handling trigger word "{Config.TRIGGER_WORD}": {event}')
-            if not handle_audio_and_respond(client, event):
-                response = process_conversation(client, event, get_tools())
-                logger.log(BOT_RESPONSE_LEVEL, f'Trigger word reply: {response}')
-            client.reactions_remove(channel=event["channel"], timestamp=event["ts"], name="sparkles")
+    except SlackApiError as e:
+        if e.response.get("error") not in IGNORED_REACTION_ERRORS:
+            raise
+
+def post_status_message(client, channel, thread_ts, text):
+    message_kwargs = {"channel": channel, "text": text}
+    if thread_ts:
+        message_kwargs["thread_ts"] = thread_ts
+    client.chat_postMessage(**message_kwargs)
+
+def new_reply(client, channel, thread_ts=None, prefix=""):
+    if not Config.STREAMING_ENABLED:
+        return None
+    return SlackReply(client, channel, thread_ts, prefix)
+
+def handle_audio_and_respond(client, event, thread_ts=None):
+    log_sampled("audio", logging.INFO, "handle_audio_and_respond called with event: %s", event)
+    thread_ts = thread_ts or event.get("thread_ts")
+    files = event.get("files", [])
+    audio_files = [file for file in files if is_audio_file(file)]
+    if not audio_files:
+        return False  # No audio file processed
+    reply = new_reply(client, event["channel"], thread_ts, "Transcribing the audio...\n")
+    try:
+        logger.info("Processing %d audio files", len(audio_files))
+        on_partial = None
+        if reply is not None:
+            # Long recordings stream their transcript into the reply as chunks finish; the answer then follows in the same message
+            reply.start()
+            on_partial = transcript_progress(reply, audio_files)
+        transcript = "\n\n".join(get_audio_transcripts(audio_files, on_partial))
+        prefix = f'Transcript of the audio:\n{transcript}\n\nResponse:\n'
+        if reply is not None:
+            reply.prefix = prefix
+        # Images shared next to the voice notes go into the same user message
+        other_files = [file for file in files if not is_audio_file(file)]
+        response_text = process_conversation(client, {"text": transcript, "channel": event["channel"], "ts": event["ts"], "files": other_files}, get_tools(), reply)
+        response = None if reply else f'{prefix}{response_text}'
+        logger.info("Audio processed and response generated: %s", response)
+    except Exception as e:
+        response = f'[ERROR] Problem converting from speech to text:\n {e}'
+        logger.error(response)
+
+    if response:
+        if reply is not None and reply.started:
+            reply.prefix = ""
+            reply.finish(response)
         else:
-            # Regular channel message, not intended for the bot
-            logger.log(UNHANDLED_MESSAGE_LEVEL, f"Message Type: {event.get('channel_type')}, User: {event.get('user')}, Message: {event.get('text')}")
-            
+            post_status_message(client, event["channel"], thread_ts, response)
+
+    logger.log(BOT_RESPONSE_LEVEL, 'Audio response sent: %s', response)
+    return True  # Indicates that the audio files were processed
+
+def transcript_progress(reply, audio_files):
+    partials = {file["id"]: "" for file in audio_files}
+    lock = threading.Lock()
+    def on_partial(file, text):
+        # Files are transcribed on several pool threads at once
+        with lock:
+            partials[file["id"]] = text
+            reply.update("\n\n".join(partial for partial in partials.values() if partial))
+    return on_partial
+
+@app.event("message")
+def handle_message_events(client, body):
+    event = body.get('event', {})
+    invalidate_thread_history(event)
+    route, thread_ts = route_message(event)
+    if route:
+        dispatch(event, route, thread_ts, body.get("event_id"))
+
 @app.event("app_mention")
 def handle_app_mention_events(client, body):
     event = body.get('event', {})
-    logger.log(HANDLED_MESSAGE_LEVEL, f'App mentioned: {event}')
-    client.reactions_add(channel=event["channel"], timestamp=event["ts"], name="sparkles")
-
-    # Check if there are files in the mention
-    if "files" in event:
-        for file in event["files"]:
-            if file["filetype"] in ["mp3", "wav", "ogg", "flac", "webm"]:
-                try:
-                    file_path = save_uploaded_file(file, Config.SLACK_BOT_USER_TOKEN)
-                    logger.info(f"Calling generate_stt with file: {file_path}")
-                    transcript = generate_stt(ai_client, file_path, Config.STT_MODEL)
-                    clean_up_file(file_path)
-                    
-                    # Generate a response using the transcript
-                    response_text = process_conversation(client, {"text": transcript, "channel": event["channel"], "ts": event["ts"]}, get_tools())
-                    response = f'Transcript of the audio:\n{transcript}\n\nResponse:\n{response_text}'
-                    
-                except Exception as e:
-                    response = f'[ERROR] Problem converting from speech to text:\n {e}'
-                client.chat_postMessage(channel=event["channel"], thread_ts=event["ts"], text=response)
-                logger.log(BOT_RESPONSE_LEVEL, f'Mention reply with file: {response}')
-                client.reactions_remove(channel=event["channel"], timestamp=event["ts"], name="sparkles")
-                return  # Ensure we exit after handling the file
+    dispatch(event, "app_mention", event["ts"], body.get("event_id"))
+
+def handle_dm_file_share(client, event):
+    logger.info("Received file share in DM %s/%s", event["channel"], event["ts"])
+    log_sampled("dm_file_share", logging.INFO, "File share event: %s", event)
+    add_reaction(client, event)
+
+    # Every image and audio file is converted into the one user message
+    if any(is_image_file(file) or is_audio_file(file) for file in event.get("files", [])):
+        try:
+            response = process_conversation(client, event, get_tools(), new_reply(client, event["channel"]))
+            logger.info("Files processed and response generated: %s", response)
+        except Exception as e:
+            response = f'[ERROR] Problem processing file:\n {e}'
+            logger.error(response)
+
+        if response:
+            client.chat_postMessage(channel=event["channel"], text=response)
+        logger.log(BOT_RESPONSE_LEVEL, 'File response sent: %s', response)
+        remove_reaction(client, event)
+
+def handle_dm(client, event):
+    add_reaction(client, event)
+    logger.log(HANDLED_MESSAGE_LEVEL, 'Handling DM %s/%s from %s', event["channel"], event["ts"], event.get("user"))
+    log_sampled("dm", logging.INFO, "DM event: %s", event)
+    response = process_conversation(client, event, get_tools(), new_reply(client, event["channel"], event.get("thread_ts")))
+    if response:  # This checks if response is not None or not an empty string
+        message_kwargs = {
+            "channel": event["channel"],
+            "text": response
+        }
+        if "thread_ts" in event:
+            message_kwargs["thread_ts"] = event["thread_ts"]
+        client.chat_postMessage(**message_kwargs)
+    logger.log(BOT_RESPONSE_LEVEL, 'DM reply: %s', response)
+    remove_reaction(client, event)
+
+def handle_thread_reply(client, event):
+    add_reaction(client, event)
+    logger.log(HANDLED_MESSAGE_LEVEL, 'Handling thread reply %s in %s/%s', event["ts"], event["channel"], event["thread_ts"])
+    log_sampled("thread_reply", logging.INFO, "Thread reply event: %s", event)
+    if not handle_audio_and_respond(client, event):
+        # With thread_ts the whole thread is reloaded, so replies a coalesced run superseded are still part of the question
+        message = {"text": event["text"], "channel": event["channel"], "ts": event["thread_ts"], "thread_ts": event["thread_ts"]}
+        response = process_conversation(client, message, get_tools(), new_reply(client, event["channel"], event["thread_ts"]))
+        if response:
+            client.chat_postMessage(channel=event["channel"], thread_ts=event["thread_ts"], text=response)
+        logger.log(BOT_RESPONSE_LEVEL, 'Thread reply: %s', response)
+    remove_reaction(client, event)
+
+def handle_trigger_word(client, event):
+    add_reaction(client, event)
+    logger.log(HANDLED_MESSAGE_LEVEL, 'Handling trigger word "%s" in %s/%s', Config.TRIGGER_WORD, event["channel"], event["ts"])
+    log_sampled("trigger_word", logging.INFO, "Trigger word event: %s", event)
+    if not handle_audio_and_respond(client, event):
+        response = process_conversation(client, event, get_tools())
+        logger.log(BOT_RESPONSE_LEVEL, 'Trigger word reply: %s', response)
+    remove_reaction(client, event)
+
+def handle_app_mention(client, event):
+    logger.log(HANDLED_MESSAGE_LEVEL, 'App mentioned in %s/%s', event["channel"], event["ts"])
+    log_sampled("app_mention", logging.INFO, "App mention event: %s", event)
+    add_reaction(client, event)
+
+    if handle_audio_and_respond(client, event, event["ts"]):
+        remove_reaction(client, event)
+        return
     # If no files, process the text mention
-    response = process_conversation(client, event, get_tools())
-    client.chat_postMessage(channel=event["channel"], thread_ts=event["ts"], text=response)
-    logger.log(BOT_RESPONSE_LEVEL, f'Mention reply: {response}')
-    client.reactions_remove(channel=event["channel"], timestamp=event["ts"], name="sparkles")
-
-def get_tools():
-    tools = []
-    if Config.IMAGE_GENERATION_ENABLED:
-        tools.append({
-            "type": "function",
-            "function": {
-                "name": "generate_image",
-                "description": "Generate image basing on description",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "description": {
-                            "type": "string",
-                            "description": "Description of the image, e.g. a house under an apple tree",
-                        },
-                        "size": {
-                            "type": "string",
-                            "enum": ["square", "portrait", "landscape"],
-                            "description": "Size of the generated image. Use square if no information is provided",
-                        }
-                    },
-                    "required": ["description"],
-                },
-            },
-        })
-        logger.info('IMAGE_GENERATION: Enabled')
-        
-    else:
-        logger.info('IMAGE_GENERATION: Disabled')
-
-    if Config.TEXT_TO_SPEECH_ENABLED:
-        tools.append({
-            "type": "function",
-            "function": {
-                "name": "generate_tts",
-                "description": "Generate or convert from text to speech",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "input_text": {
-                            "type": "string",
-                            "description": "Text to be converted to speech",
-                        }
-                    },
-                    "required": ["input_text"],
-                },
-            },
-        })
-        logger.info('TEXT_TO_SPEECH: Enabled')
-    else:
-        logger.info('TEXT_TO_SPEECH: Disabled')
-
-    if Config.SPEECH_TO_TEXT_ENABLED:
-        tools.append({
-            "type": "function",
-            "function": {
-                "name": "generate_stt",
-                "description": "Transcript or convert from speech to text",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                    }
-                },
-            },
-        })
-        logger.info('SPEECH_TO_TEXT: Enabled')
-    else:
-        logger.info('SPEECH_TO_TEXT: Disabled')
-
-    return tools
\ No newline at end of file
+    response = process_conversation(client, event, get_tools(), new_reply(client, event["channel"], event["ts"]))
+    if response:
+        client.chat_postMessage(channel=event["channel"], thread_ts=event["ts"], text=response)
+    logger.log(BOT_RESPONSE_LEVEL, 'Mention reply: %s', response)
+    remove_reaction(client, event)
+
+ROUTE_HANDLERS = {
+    "dm_file_share": handle_dm_file_share,
+    "dm": handle_dm,
+    "thread_reply": handle_thread_reply,
+    "trigger_word": handle_trigger_word,
+    "app_mention": handle_app_mention,
+}
\ No newline at end of file
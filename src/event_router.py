@@ -0,0 +1,62 @@
+# slack_ai_assistant/event_router.py
+import re
+from config import Config
+from logging_config import logger, UNHANDLED_MESSAGE_LEVEL
+from metrics import metrics
+from workspace_info import workspace_info
+
+# Edits, deletions, joins and other bots' posts never get an answer, so they are dropped before anything else
+IGNORED_SUBTYPES = frozenset({
+    "bot_message",
+    "message_changed",
+    "message_deleted",
+    "message_replied",
+    "channel_join",
+    "channel_leave",
+    "channel_topic",
+    "channel_purpose",
+    "channel_name",
+    "group_join",
+    "group_leave",
+    "pinned_item",
+    "unpinned_item",
+    "ekm_access_denied",
+})
+# (channel_type, subtype) -> route; a None subtype is the fallback for that channel type
+CHANNEL_ROUTES = {
+    ("im", "file_share"): "dm_file_share",
+    ("im", None): "dm",
+}
+TRIGGER_CHANNEL_TYPES = frozenset({"channel"})
+
+def compile_trigger_pattern(trigger_words):
+    words = [word.strip() for word in trigger_words.split(",") if word.strip()]
+    if not words:
+        return None
+    # Longest first so overlapping words match the most specific one; lookarounds also work for words like "!ask"
+    alternatives = "|".join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+    return re.compile(rf"(?<!\w)(?:{alternatives})(?!\w)", re.IGNORECASE)
+
+trigger_pattern = compile_trigger_pattern(Config.TRIGGER_WORD)
+
+def route_message(event):
+    # Returns (route, thread_ts to answer in), or (None, None) when the bot should stay quiet
+    subtype = event.get("subtype")
+    if subtype in IGNORED_SUBTYPES or "bot_id" in event:
+        metrics.incr("router.rejected")
+        return None, None
+    channel_type = event.get("channel_type")
+    route = CHANNEL_ROUTES.get((channel_type, subtype)) or CHANNEL_ROUTES.get((channel_type, None))
+    if route:
+        metrics.incr(f"router.{route}")
+        return route, event.get("thread_ts")
+    if "thread_ts" in event and event.get("parent_user_id") == workspace_info.bot_user_id:
+        metrics.incr("router.thread_reply")
+        return "thread_reply", event["thread_ts"]
+    if channel_type in TRIGGER_CHANNEL_TYPES and trigger_pattern and trigger_pattern.search(event.get("text") or ""):
+        metrics.incr("router.trigger_word")
+        return "trigger_word", event["ts"]
+    metrics.incr("router.ignored")
+    if Config.LOG_UNHANDLED_MESSAGES:
+        logger.log(UNHANDLED_MESSAGE_LEVEL, "Message Type: %s, User: %s, Message: %s", channel_type, event.get("user"), event.get("text"))
+    return None, None
@@ -1,23 +1,168 @@
 # slack_ai_assistant/file_utils.py
+import hashlib
+import httpx
 import os
 import requests
+import tempfile
 import uuid
+from contextlib import contextmanager, asynccontextmanager
+from requests.adapters import HTTPAdapter
 from config import Config
 from logging_config import logger
+from rate_limiter import call_with_retry, async_call_with_retry
+
+class FileTooLargeError(Exception):
+    def __init__(self, size, max_size):
+        super().__init__(f"File is {size} bytes, the limit is {max_size} bytes")
+        self.size = size
+        self.max_size = max_size
+
+# One keep-alive pool for all downloads, so files.slack.com is not re-handshaked for every file
+http_session = requests.Session()
+http_session.mount("https://", HTTPAdapter(pool_connections=Config.DOWNLOAD_POOL_SIZE, pool_maxsize=Config.DOWNLOAD_POOL_SIZE))
+async_http_client = httpx.AsyncClient(
+    follow_redirects=True,
+    timeout=httpx.Timeout(Config.DOWNLOAD_TIMEOUT, connect=Config.DOWNLOAD_CONNECT_TIMEOUT),
+    limits=httpx.Limits(max_connections=Config.DOWNLOAD_POOL_SIZE, max_keepalive_connections=Config.DOWNLOAD_POOL_SIZE)
+)
 
 def save_uploaded_file(file, token):
-    url = file["url_private"]
-    headers = {"Authorization": f"Bearer {token}"}
-    response = requests.get(url, headers=headers)
+    check_file_size(file.get("size"))
     file_extension = file["filetype"]
     file_path = f'{Config.TEMP_FILES_FOLDER}/{generate_random_file_name()}.{file_extension}'
-    with open(file_path, "wb") as f:
-        f.write(response.content)
-    logger.info(f"File saved: {file_path}")
+    call_with_retry("download", lambda: download_to_file(file["url_private"], file_path, {"Authorization": f"Bearer {token}"}))
+    logger.info("File saved: %s", file_path)
+    return file_path
+
+@contextmanager
+def open_uploaded_file(file, token):
+    # Yields a readable binary file object; nothing is left on disk once the block exits
+    if not Config.IN_MEMORY_ATTACHMENTS:
+        file_path = save_uploaded_file(file, token)
+        try:
+            with open(file_path, "rb") as f:
+                yield f
+        finally:
+            clean_up_file(file_path)
+        return
+    check_file_size(file.get("size"))
+    buffer = call_with_retry("download", lambda: download_to_buffer(file["url_private"], {"Authorization": f"Bearer {token}"}))
+    try:
+        yield buffer
+    finally:
+        buffer.close()
+
+def download_to_file(url, file_path, headers=None):
+    try:
+        with open(file_path, "wb") as f:
+            stream_download(url, f, headers)
+    except Exception:
+        if os.path.exists(file_path):
+            clean_up_file(file_path)
+        raise
     return file_path
 
+def download_to_buffer(url, headers=None):
+    buffer = new_spooled_buffer()
+    try:
+        stream_download(url, buffer, headers)
+    except Exception:
+        buffer.close()
+        raise
+    buffer.seek(0)
+    return buffer
+
+def download_to_bytes(url, headers=None):
+    with download_to_buffer(url, headers) as buffer:
+        return buffer.read()
+
+def stream_download(url, f, headers=None):
+    with http_session.get(url, headers=headers, stream=True, timeout=(Config.DOWNLOAD_CONNECT_TIMEOUT, Config.DOWNLOAD_TIMEOUT)) as response:
+        response.raise_for_status()
+        check_file_size(response.headers.get("Content-Length"))
+        written = 0
+        for chunk in response.iter_content(chunk_size=Config.DOWNLOAD_CHUNK_SIZE):
+            written += len(chunk)
+            # Content-Length can be missing or wrong, so the limit is enforced while streaming too
+            check_file_size(written)
+            f.write(chunk)
+
+async def async_save_uploaded_file(file, token):
+    check_file_size(file.get("size"))
+    file_extension = file["filetype"]
+    file_path = f'{Config.TEMP_FILES_FOLDER}/{generate_random_file_name()}.{file_extension}'
+    await async_call_with_retry("download", lambda: async_download_to_file(file["url_private"], file_path, {"Authorization": f"Bearer {token}"}))
+    logger.info("File saved: %s", file_path)
+    return file_path
+
+@asynccontextmanager
+async def async_open_uploaded_file(file, token):
+    if not Config.IN_MEMORY_ATTACHMENTS:
+        file_path = await async_save_uploaded_file(file, token)
+        try:
+            with open(file_path, "rb") as f:
+                yield f
+        finally:
+            clean_up_file(file_path)
+        return
+    check_file_size(file.get("size"))
+    buffer = await async_call_with_retry("download", lambda: async_download_to_buffer(file["url_private"], {"Authorization": f"Bearer {token}"}))
+    try:
+        yield buffer
+    finally:
+        buffer.close()
+
+async def async_download_to_file(url, file_path, headers=None):
+    try:
+        with open(file_path, "wb") as f:
+            await async_stream_download(url, f, headers)
+    except Exception:
+        if os.path.exists(file_path):
+            clean_up_file(file_path)
+        raise
+    return file_path
+
+async def async_download_to_buffer(url, headers=None):
+    buffer = new_spooled_buffer()
+    try:
+        await async_stream_download(url, buffer, headers)
+    except Exception:
+        buffer.close()
+        raise
+    buffer.seek(0)
+    return buffer
+
+async def async_download_to_bytes(url, headers=None):
+    with await async_download_to_buffer(url, headers) as buffer:
+        return buffer.read()
+
+async def async_stream_download(url, f, headers=None):
+    async with async_http_client.stream("GET", url, headers=headers) as response:
+        response.raise_for_status()
+        check_file_size(response.headers.get("Content-Length"))
+        written = 0
+        async for chunk in response.aiter_bytes(Config.DOWNLOAD_CHUNK_SIZE):
+            written += len(chunk)
+            check_file_size(written)
+            f.write(chunk)
+
+def check_file_size(size):
+    if size is not None and Config.DOWNLOAD_MAX_BYTES > 0 and int(size) > Config.DOWNLOAD_MAX_BYTES:
+        raise FileTooLargeError(int(size), Config.DOWNLOAD_MAX_BYTES)
+
+def new_spooled_buffer():
+    # Stays in memory up to the threshold, then rolls over to an anonymous file that is deleted on close
+    return tempfile.SpooledTemporaryFile(max_size=Config.SPOOL_MAX_MEMORY_BYTES, dir=Config.TEMP_FILES_FOLDER)
+
+def file_sha256(f):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+        digest.update(chunk)
+    f.seek(0)
+    return digest.hexdigest()
+
 def clean_up_file(file_path):
     os.remove(file_path)
 
 def generate_random_file_name():
-    return str(uuid.uuid4())
\ No newline at end of file
+    return str(uuid.uuid4())
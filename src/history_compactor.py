@@ -0,0 +1,137 @@
+# slack_ai_assistant/history_compactor.py
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from config import Config
+from logging_config import logger
+from rate_limiter import call_with_retry
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+MESSAGE_OVERHEAD_TOKENS = 4
+IMAGE_TOKENS = {"low": 85, "high": 765, "auto": 765}
+TOKEN_CACHE_SIZE = 10000
+SUMMARY_PROMPT = "Summarize the following conversation between a user and an assistant. Keep facts, decisions, names and open questions. Be concise."
+
+_token_cache = OrderedDict()
+_token_cache_lock = threading.Lock()
+_encoding = None
+
+def get_encoding():
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        try:
+            _encoding = tiktoken.encoding_for_model(Config.GPT_MODEL)
+        except Exception:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+    return _encoding
+
+def count_text_tokens(text):
+    encoding = get_encoding()
+    if encoding is None:
+        # Rough estimate when no local tokenizer is installed
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+def count_message_tokens(message):
+    key = hashlib.sha1(json.dumps(message, sort_keys=True).encode("utf-8")).hexdigest()
+    with _token_cache_lock:
+        if key in _token_cache:
+            _token_cache.move_to_end(key)
+            return _token_cache[key]
+    tokens = MESSAGE_OVERHEAD_TOKENS
+    content = message.get("content") or ""
+    if isinstance(content, str):
+        tokens += count_text_tokens(content)
+    else:
+        for part in content:
+            if part["type"] == "text":
+                tokens += count_text_tokens(part["text"])
+            elif part["type"] == "image_url":
+                tokens += IMAGE_TOKENS.get(part["image_url"].get("detail", "auto"), IMAGE_TOKENS["auto"])
+    with _token_cache_lock:
+        _token_cache[key] = tokens
+        if len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+    return tokens
+
+def count_history_tokens(history):
+    return sum(count_message_tokens(msg) for msg in history)
+
+def compact_history(ai_client, system_prompt, history, summary_store=None, thread_key=None):
+    before = count_history_tokens(history)
+    result = reduce_old_images(history)
+    budget = Config.HISTORY_TOKEN_BUDGET - count_text_tokens(system_prompt or "")
+    # The newest message is always sent, even if it alone exceeds the budget
+    kept = 1
+    used = count_message_tokens(result[-1]) if result else 0
+    while kept < len(result):
+        tokens = count_message_tokens(result[-kept - 1])
+        if used + tokens > budget:
+            break
+        used += tokens
+        kept += 1
+    dropped = len(result) - kept
+    result = result[dropped:]
+    if dropped and Config.HISTORY_SUMMARY_ENABLED and summary_store is not None and thread_key is not None:
+        summary = get_rolling_summary(ai_client, history[:dropped], summary_store, thread_key)
+        if summary:
+            result.insert(0, {"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+    after = count_history_tokens(result)
+    logger.info("History tokens: %d -> %d (%d -> %d messages, %d dropped)", before, after, len(history), len(result), dropped)
+    return result
+
+def reduce_old_images(history):
+    result = []
+    images_kept = 0
+    for msg in reversed(history):
+        content = msg.get("content")
+        if isinstance(content, list) and any(part["type"] == "image_url" for part in content):
+            if images_kept < Config.HISTORY_KEEP_IMAGES or Config.HISTORY_OLD_IMAGE_POLICY == "keep":
+                images_kept += 1
+            else:
+                msg = {**msg, "content": [downscale_image_part(part) for part in content]}
+        result.append(msg)
+    result.reverse()
+    return result
+
+def downscale_image_part(part):
+    if part["type"] != "image_url":
+        return part
+    if Config.HISTORY_OLD_IMAGE_POLICY == "drop":
+        return {"type": "text", "text": "[image omitted]"}
+    return {"type": "image_url", "image_url": {**part["image_url"], "detail": "low"}}
+
+def get_rolling_summary(ai_client, dropped_messages, summary_store, thread_key):
+    summary, covered = summary_store.get_summary(thread_key)
+    if covered >= len(dropped_messages):
+        return summary
+    pending = dropped_messages[covered:]
+    lines = [f"Previous summary:\n{summary}"] if summary else []
+    for msg in pending:
+        lines.append(f'{msg["role"]}: {message_text(msg)}')
+    try:
+        response = call_with_retry("openai.chat", lambda: ai_client.chat.completions.create(
+            model = Config.SUMMARY_MODEL,
+            messages = [
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": "\n\n".join(lines)}
+            ]
+        ))
+        summary = response.choices[0].message.content
+    except Exception as e:
+        logger.error("Problem summarizing conversation history: %s", e)
+        return summary
+    summary_store.set_summary(thread_key, summary, len(dropped_messages))
+    logger.info("Conversation summary for %s now covers %d messages", thread_key, len(dropped_messages))
+    return summary
+
+def message_text(message):
+    content = message.get("content") or ""
+    if isinstance(content, str):
+        return content
+    return " ".join(part["text"] if part["type"] == "text" else "[image]" for part in content)
@@ -0,0 +1,91 @@
+# slack_ai_assistant/image_utils.py
+import base64
+import io
+from config import Config
+from logging_config import logger
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+MIME_TYPES = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "gif": "image/gif",
+    "webp": "image/webp",
+}
+# OpenAI fits high-detail images into 2048x2048 and then scales the shortest side down to 768
+MAX_LONG_SIDE = 2048
+MAX_SHORT_SIDE = 768
+LOW_DETAIL_SIDE = 512
+
+def get_image_variant():
+    # Part of the attachment cache key, so changing the encoding settings never serves stale payloads
+    return f"image:{Config.IMAGE_ENCODE_FORMAT}:{Config.IMAGE_ENCODE_QUALITY}:{Config.IMAGE_DETAIL}"
+
+def prepare_image_data_url(image_file, filetype):
+    image_file.seek(0)
+    original = image_file.read()
+    mime_type = MIME_TYPES.get(filetype.lower(), "image/jpeg")
+    if Image is None or not Config.IMAGE_PREPROCESSING_ENABLED:
+        return to_data_url(mime_type, original)
+    try:
+        image = Image.open(io.BytesIO(original))
+        image.seek(0)  # animated GIF/WebP: the first frame is what the model gets anyway
+        width, height = image.size
+        target = get_target_size(width, height)
+        if target != (width, height):
+            image = image.resize(target, Image.LANCZOS)
+        encoded, encoded_mime_type = encode(image)
+    except Exception as e:
+        logger.warning("Could not preprocess %s image, sending it unchanged: %s", filetype, e)
+        return to_data_url(mime_type, original)
+    if target == (width, height) and len(encoded) >= len(original):
+        return to_data_url(mime_type, original)
+    logger.info("Image preprocessed: %dx%d %d bytes -> %dx%d %d bytes", width, height, len(original), target[0], target[1], len(encoded))
+    return to_data_url(encoded_mime_type, encoded)
+
+def get_target_size(width, height):
+    if Config.IMAGE_DETAIL == "low":
+        scale = LOW_DETAIL_SIDE / max(width, height)
+    else:
+        scale = min(MAX_LONG_SIDE / max(width, height), MAX_SHORT_SIDE / min(width, height))
+    scale = min(1.0, scale)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def encode(image):
+    output = io.BytesIO()
+    if Config.IMAGE_ENCODE_FORMAT == "webp":
+        image.save(output, format="WEBP", quality=Config.IMAGE_ENCODE_QUALITY)
+        return output.getvalue(), "image/webp"
+    if image.mode in ("RGBA", "LA", "P"):
+        # JPEG has no alpha channel, flatten onto white instead of letting it turn black
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+    image.save(output, format="JPEG", quality=Config.IMAGE_ENCODE_QUALITY, optimize=True)
+    return output.getvalue(), "image/jpeg"
+
+def make_thumbnail(content):
+    # A small JPEG uploads in a fraction of the time of a full-size PNG; None when Pillow is missing
+    if Image is None:
+        return None
+    image = Image.open(io.BytesIO(content))
+    image.thumbnail((Config.IMAGE_THUMBNAIL_SIDE, Config.IMAGE_THUMBNAIL_SIDE), Image.LANCZOS)
+    output = io.BytesIO()
+    image.convert("RGB").save(output, format="JPEG", quality=80)
+    return output.getvalue()
+
+def to_data_url(mime_type, content):
+    return f"data:{mime_type};base64,{base64.b64encode(content).decode('utf-8')}"
+
+def image_url_part(data_url):
+    image_url = {"url": data_url}
+    if Config.IMAGE_DETAIL in ("low", "high"):
+        image_url["detail"] = Config.IMAGE_DETAIL
+    return {"type": "image_url", "image_url": image_url}
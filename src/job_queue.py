@@ -0,0 +1,157 @@
+# slack_ai_assistant/job_queue.py
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from config import Config
+from logging_config import logger
+from metrics import metrics
+
+class EventJob:
+    # Everything a worker needs to handle an event, with no references to the listener's request or client
+    def __init__(self, route, event, thread_ts=None, event_id=None, job_id=None, received_at=None, attempts=0):
+        self.route = route
+        self.event = event
+        self.thread_ts = thread_ts
+        self.event_id = event_id
+        self.job_id = job_id or uuid.uuid4().hex
+        self.received_at = received_at or time.time()
+        self.attempts = attempts
+
+    @property
+    def thread_key(self):
+        return f'{self.event.get("channel")}:{self.event.get("thread_ts") or self.event.get("ts")}'
+
+    def to_json(self):
+        return json.dumps({"route": self.route, "event": self.event, "thread_ts": self.thread_ts, "event_id": self.event_id, "received_at": self.received_at})
+
+    @classmethod
+    def from_json(cls, job_id, payload, attempts):
+        data = json.loads(payload)
+        return cls(data["route"], data["event"], data["thread_ts"], data["event_id"], job_id, data["received_at"], attempts)
+
+class MemoryJobQueue:
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def put(self, job, owner=None):
+        with self._lock:
+            self._jobs[job.job_id] = job
+            metrics.gauge("jobs.in_flight", len(self._jobs))
+
+    def ack(self, job):
+        with self._lock:
+            self._jobs.pop(job.job_id, None)
+            metrics.gauge("jobs.in_flight", len(self._jobs))
+
+    def recover(self, live_workers=None):
+        # Nothing outlives the process
+        return []
+
+    def take_forwarded(self, worker_id, live_workers):
+        return []
+
+class SqliteJobQueue:
+    def __init__(self, db_path, max_attempts):
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, payload TEXT NOT NULL, enqueued_at REAL NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "owner TEXT NOT NULL DEFAULT '', state TEXT NOT NULL DEFAULT 'running')"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "owner" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT NOT NULL DEFAULT ''")
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN state TEXT NOT NULL DEFAULT 'running'")
+        self._conn.execute("UPDATE jobs SET owner = ? WHERE owner = ''", (Config.WORKER_ID,))
+        self._conn.commit()
+
+    def put(self, job, owner=None):
+        # A job put for another worker waits in the forwarded state until that worker's coordination loop takes it
+        owner = owner or Config.WORKER_ID
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, payload, enqueued_at, attempts, owner, state) VALUES (?, ?, ?, ?, ?, ?)",
+                (job.job_id, job.to_json(), job.received_at, job.attempts, owner, "running" if owner == Config.WORKER_ID else "forwarded"),
+            )
+            self._conn.commit()
+            metrics.gauge("jobs.in_flight", self._conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0])
+
+    def ack(self, job):
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE job_id = ?", (job.job_id,))
+            self._conn.commit()
+            metrics.gauge("jobs.in_flight", self._conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0])
+
+    def recover(self, live_workers=None):
+        # Jobs still here were running when their process stopped; each restart counts as an attempt so a poison job is dropped eventually.
+        # Without coordination this process is the only worker and takes every row, whichever id wrote it. With coordination it
+        # takes its own rows plus those of workers that are no longer alive, and leaves the rest to their owners.
+        if live_workers is None:
+            condition, params = "1", ()
+        else:
+            placeholders = ", ".join("?" for _ in live_workers)
+            condition, params = f"owner = ? OR owner NOT IN ({placeholders})", (Config.WORKER_ID, *live_workers)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(f"UPDATE jobs SET attempts = attempts + 1, owner = ?, state = 'running' WHERE {condition}", (Config.WORKER_ID, *params))
+                dropped = self._conn.execute("DELETE FROM jobs WHERE owner = ? AND attempts >= ?", (Config.WORKER_ID, self.max_attempts)).rowcount
+                rows = self._conn.execute("SELECT job_id, payload, attempts FROM jobs WHERE owner = ? ORDER BY enqueued_at", (Config.WORKER_ID,)).fetchall()
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+        if dropped:
+            metrics.incr("jobs.dropped", dropped)
+            logger.warning("Dropped %d jobs that failed %d times", dropped, self.max_attempts)
+        return [EventJob.from_json(job_id, payload, attempts) for job_id, payload, attempts in rows]
+
+    def take_forwarded(self, worker_id, live_workers):
+        # Claims jobs forwarded to this worker plus any job whose owner stopped sending heartbeats
+        placeholders = ", ".join("?" for _ in live_workers)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    f"SELECT job_id, payload, attempts, owner FROM jobs WHERE (owner = ? AND state = 'forwarded') OR owner NOT IN ({placeholders}) ORDER BY enqueued_at",
+                    (worker_id, *live_workers),
+                ).fetchall()
+                jobs = []
+                for job_id, payload, attempts, owner in rows:
+                    if owner != worker_id:
+                        # Its owner died while holding it, which counts as a failed attempt just like a restart does
+                        attempts += 1
+                        logger.warning("Taking over job %s from unresponsive worker %s", job_id, owner)
+                    if attempts >= self.max_attempts:
+                        self._conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+                        metrics.incr("jobs.dropped")
+                        continue
+                    self._conn.execute("UPDATE jobs SET owner = ?, state = 'running', attempts = ? WHERE job_id = ?", (worker_id, attempts, job_id))
+                    jobs.append(EventJob.from_json(job_id, payload, attempts))
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+        return jobs
+
+def create_job_queue():
+    # Workers coordinating with each other need the shared, durable queue to forward jobs through
+    if Config.JOB_QUEUE_BACKEND == "sqlite" or Config.COORDINATION_ENABLED:
+        logger.info("Job queue: sqlite at %s", Config.JOB_QUEUE_PATH)
+        return SqliteJobQueue(Config.JOB_QUEUE_PATH, Config.JOB_MAX_ATTEMPTS)
+    return MemoryJobQueue()
+
+job_queue = create_job_queue()
+
+def record_stage(stage, started_at):
+    metrics.observe(f"pipeline.{stage}_seconds", time.time() - started_at)
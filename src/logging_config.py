@@ -1,6 +1,14 @@
 # slack_ai_assistant/logging_config.py
+import atexit
+import copy
+import json
 import logging
+import queue
+import random
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from colorlog import ColoredFormatter
+from config import Config
 
 # Custom log levels
 HANDLED_MESSAGE_LEVEL = 25
@@ -24,17 +32,73 @@ log_colors = {
     'BOT_RESPONSE': 'cyan',
 }
 
-formatter = ColoredFormatter(log_format, log_colors=log_colors)
+# Everything a LogRecord carries by itself; any other attribute came in through extra= and goes into the JSON line
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class LazyQueueHandler(QueueHandler):
+    def prepare(self, record):
+        # Only the %-merge of msg and args happens on the calling thread, so an argument mutated after the call
+        # cannot change what gets logged. Timestamps, JSON, colours and traceback text are left to the listener thread.
+        message = record.getMessage()
+        record = copy.copy(record)
+        record.msg = message
+        record.args = None
+        return record
+
+def parse_sample_rates(value):
+    # "dm=1,thread_reply=0.2,default=0.05" -> {"dm": 1.0, "thread_reply": 0.2, "default": 0.05}
+    rates = {}
+    for item in value.split(","):
+        if "=" in item:
+            key, rate = item.split("=", 1)
+            rates[key.strip()] = float(rate)
+    return rates
+
+SAMPLE_RATES = parse_sample_rates(Config.LOG_SAMPLE_RATES)
+
+def log_sampled(key, level, msg, *args):
+    # For verbose dumps (raw events, full model responses); each key only logs its LOG_SAMPLE_RATES share of them
+    if not logger.isEnabledFor(level):
+        return
+    rate = SAMPLE_RATES.get(key, SAMPLE_RATES.get("default", 1.0))
+    if rate >= 1 or random.random() < rate:
+        logger.log(level, msg, *args, extra={"sample_key": key})
 
 stream_handler = logging.StreamHandler()
-stream_handler.setFormatter(formatter)
+stream_handler.setFormatter(ColoredFormatter(log_format, log_colors=log_colors))
+
+# The file gets no colour codes: JSON lines by default, plain text with LOG_FILE_FORMAT=text
+file_handler = RotatingFileHandler(Config.LOG_FILE, maxBytes=Config.LOG_MAX_BYTES, backupCount=Config.LOG_BACKUP_COUNT, encoding="utf-8")
+if Config.LOG_FILE_FORMAT == "text":
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+else:
+    file_handler.setFormatter(JsonFormatter())
 
-file_handler = logging.FileHandler('slack_bot.log')
-file_handler.setFormatter(formatter)
+# Request threads only put records on the queue; one listener thread formats them and does the I/O
+log_queue = queue.SimpleQueue()
+queue_listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+queue_listener.start()
+atexit.register(queue_listener.stop)
 
 logging.basicConfig(
-    level=logging.INFO,
-    handlers=[file_handler, stream_handler]
+    level=Config.LOG_LEVEL,
+    handlers=[LazyQueueHandler(log_queue)]
 )
 
 logger = logging.getLogger(__name__)
\ No newline at end of file
@@ -1,13 +1,68 @@
 # slack_ai_assistant/main.py
+import asyncio
+import multiprocessing
+import os
+import socket
+import time
 from slack_bolt.adapter.socket_mode import SocketModeHandler
 # main.py
 from config import Config
-from slack_bot import init_slack_bot
+from slack_bot import init_slack_bot, init_async_slack_bot, start_job_workers, async_start_job_workers
+from metrics import start_metrics_reporter
+from workspace_info import workspace_info
+from logging_config import logger
 
 def main():
+    if Config.WORKER_PROCESSES > 1:
+        run_worker_pool(Config.WORKER_PROCESSES)
+        return
+    run_worker()
+
+def run_worker():
+    start_metrics_reporter(Config.METRICS_LOG_INTERVAL)
+    if Config.RUNTIME_MODE == "async":
+        asyncio.run(async_main())
+        return
     app = init_slack_bot()
+    # Resolved once here so routing thread replies never calls auth.test
+    workspace_info.start(app.client)
+    start_job_workers()
     handler = SocketModeHandler(app, Config.SLACK_SOCKET_TOKEN)
     handler.start()
 
+async def async_main():
+    from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
+    app = init_async_slack_bot()
+    await workspace_info.async_start(app.client)
+    await async_start_job_workers()
+    handler = AsyncSocketModeHandler(app, Config.SLACK_SOCKET_TOKEN)
+    await handler.start_async()
+
+def run_worker_pool(count):
+    # Every process opens its own Socket Mode connection and Slack spreads events across them (at most 10 per app)
+    context = multiprocessing.get_context("spawn")
+    workers = {}
+    while True:
+        for index in range(count):
+            process = workers.get(index)
+            if process is not None and process.is_alive():
+                continue
+            if process is not None:
+                logger.warning("Worker process %d exited with code %s, restarting it", index, process.exitcode)
+            workers[index] = start_worker_process(context, index)
+        time.sleep(5)
+
+def start_worker_process(context, index):
+    # A stable id per slot lets a restarted process resume the jobs its predecessor left in the shared queue
+    os.environ["WORKER_ID"] = f"{socket.gethostname()}-{index}"
+    os.environ["WORKER_PROCESSES"] = "1"
+    os.environ["COORDINATION_ENABLED"] = "true"
+    # One log file per worker, rotating a shared file from several processes would lose lines
+    log_root, log_extension = os.path.splitext(Config.LOG_FILE)
+    os.environ["LOG_FILE"] = f"{log_root}-{index}{log_extension}"
+    process = context.Process(target=run_worker, name=f"bot-worker-{index}")
+    process.start()
+    return process
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
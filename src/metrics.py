@@ -0,0 +1,67 @@
+# slack_ai_assistant/metrics.py
+import bisect
+import threading
+from collections import defaultdict
+from logging_config import logger
+
+HISTOGRAM_BUCKETS = [0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+
+class Histogram:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.buckets[bisect.bisect_left(HISTOGRAM_BUCKETS, value)] += 1
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "avg": round(self.total / self.count, 4) if self.count else 0.0,
+            "max": round(self.max, 4),
+            "buckets": {f"le_{bound}": n for bound, n in zip(HISTOGRAM_BUCKETS + ["inf"], self.buckets) if n},
+        }
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._gauges = {}
+        self._histograms = defaultdict(Histogram)
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name, value):
+        with self._lock:
+            self._histograms[name].observe(value)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "histograms": {name: h.snapshot() for name, h in self._histograms.items()},
+            }
+
+metrics = Metrics()
+
+def start_metrics_reporter(interval):
+    if interval <= 0:
+        return None
+    stop = threading.Event()
+    def report():
+        while not stop.wait(interval):
+            logger.info("Metrics: %s", metrics.snapshot())
+    threading.Thread(target=report, name="metrics-reporter", daemon=True).start()
+    return stop
@@ -1,17 +1,34 @@
 # slack_ai_assistant/openai_config.py
-from openai import OpenAI, AzureOpenAI
+from openai import OpenAI, AzureOpenAI, AsyncOpenAI, AsyncAzureOpenAI
 from config import Config
 
 def get_ai_client():
     if Config.OPENAI_KEY:
         print("Running with OpenAI")
-        return OpenAI(api_key=Config.OPENAI_KEY)
+        return OpenAI(api_key=Config.OPENAI_KEY, max_retries=0)
     elif Config.AZURE_OPENAI_KEY:
         print("Running with Azure OpenAI")
         return AzureOpenAI(
             api_key=Config.AZURE_OPENAI_KEY,
             api_version=Config.AZURE_OPENAI_VERSION,
-            azure_endpoint=Config.AZURE_OPENAI_ENDPOINT
+            azure_endpoint=Config.AZURE_OPENAI_ENDPOINT,
+            max_retries=0
+        )
+    else:
+        print("[ERROR] Missing both OPENAI_KEY and AZURE_OPENAI_KEY")
+        exit(1)
+
+def get_async_ai_client():
+    if Config.OPENAI_KEY:
+        print("Running with async OpenAI")
+        return AsyncOpenAI(api_key=Config.OPENAI_KEY, max_retries=0)
+    elif Config.AZURE_OPENAI_KEY:
+        print("Running with async Azure OpenAI")
+        return AsyncAzureOpenAI(
+            api_key=Config.AZURE_OPENAI_KEY,
+            api_version=Config.AZURE_OPENAI_VERSION,
+            azure_endpoint=Config.AZURE_OPENAI_ENDPOINT,
+            max_retries=0
         )
     else:
         print("[ERROR] Missing both OPENAI_KEY and AZURE_OPENAI_KEY")
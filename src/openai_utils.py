@@ -1,48 +1,387 @@
 # slack_ai_assistant/openai_utils.py
+import asyncio
 import base64
 import random
+import re
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from types import SimpleNamespace
+from openai import NOT_GIVEN
+from config import Config
+from file_utils import download_to_bytes, async_download_to_bytes
+from logging_config import logger
+from rate_limiter import call_with_retry, async_call_with_retry
+from response_cache import response_cache, response_cache_key, chat_cache_key, get_cached_chat, put_cached_chat
+
+# DALL-E image URLs expire after an hour, so cached ones are only handed out while they still have time left
+IMAGE_URL_MAX_AGE = 3000
+SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+tts_pool = ThreadPoolExecutor(max_workers=Config.TTS_WORKERS, thread_name_prefix="tts")
+image_pool = ThreadPoolExecutor(max_workers=Config.IMAGE_MAX_VARIANTS, thread_name_prefix="image")
 
 def get_gpt_response(ai_client, gpt_model, system_prompt, conversation_history, tools):
     prompt_structure = [{"role": "system", "content": system_prompt}]
     for msg in conversation_history:
         prompt_structure.append(msg) 
+    cache_key = chat_cache_key(gpt_model, prompt_structure, tools)
+    cached = get_cached_chat(cache_key)
+    if cached is not None:
+        return SimpleNamespace(content=cached, tool_calls=None)
     try:
-        response = ai_client.chat.completions.create(
+        response = call_with_retry("openai.chat", lambda: ai_client.chat.completions.create(
             model = gpt_model,
             messages = prompt_structure,
-            tools = tools,
-            tool_choice = "auto"
-        )
+            tools = tools or NOT_GIVEN,
+            tool_choice = "auto" if tools else NOT_GIVEN
+        ), estimate_prompt_tokens(prompt_structure))
+        put_cached_chat(cache_key, response.choices[0].message)
         return response.choices[0].message
     except Exception as e:
         return SimpleNamespace(content=f"[ERROR] Problem calling OpenAI API:\n {e}")
 
-def generate_image(ai_client, image_model, input_text, size = "square"):
-    if size == "portrait":
-        image_size = "1024x1792"
-    elif size == "landscape":
-        image_size = "1792x1024"
-    else:
-        image_size = "1024x1024"
-    response = ai_client.images.generate(model = image_model, prompt = input_text, size = image_size, quality = "standard", n=1)
+def get_gpt_response_stream(ai_client, gpt_model, system_prompt, conversation_history, tools, on_delta=None):
+    prompt_structure = [{"role": "system", "content": system_prompt}]
+    for msg in conversation_history:
+        prompt_structure.append(msg)
+    cache_key = chat_cache_key(gpt_model, prompt_structure, tools)
+    cached = get_cached_chat(cache_key)
+    if cached is not None:
+        return SimpleNamespace(content=cached, tool_calls=None)
+    try:
+        completion = StreamedCompletion()
+        stream = call_with_retry("openai.chat", lambda: ai_client.chat.completions.create(
+            model = gpt_model,
+            messages = prompt_structure,
+            tools = tools or NOT_GIVEN,
+            tool_choice = "auto" if tools else NOT_GIVEN,
+            stream = True
+        ), estimate_prompt_tokens(prompt_structure))
+        for chunk in stream:
+            if completion.add(chunk) and on_delta and on_delta(completion.content) is False:
+                stream.close()
+                return completion.message()
+        message = completion.message()
+        put_cached_chat(cache_key, message)
+        return message
+    except Exception as e:
+        return SimpleNamespace(content=f"[ERROR] Problem calling OpenAI API:\n {e}")
+
+async def async_get_gpt_response(ai_client, gpt_model, system_prompt, conversation_history, tools):
+    prompt_structure = [{"role": "system", "content": system_prompt}]
+    for msg in conversation_history:
+        prompt_structure.append(msg)
+    cache_key = chat_cache_key(gpt_model, prompt_structure, tools)
+    cached = get_cached_chat(cache_key)
+    if cached is not None:
+        return SimpleNamespace(content=cached, tool_calls=None)
+    try:
+        response = await async_call_with_retry("openai.chat", lambda: ai_client.chat.completions.create(
+            model = gpt_model,
+            messages = prompt_structure,
+            tools = tools or NOT_GIVEN,
+            tool_choice = "auto" if tools else NOT_GIVEN
+        ), estimate_prompt_tokens(prompt_structure))
+        put_cached_chat(cache_key, response.choices[0].message)
+        return response.choices[0].message
+    except Exception as e:
+        return SimpleNamespace(content=f"[ERROR] Problem calling OpenAI API:\n {e}")
+
+async def async_get_gpt_response_stream(ai_client, gpt_model, system_prompt, conversation_history, tools, on_delta=None):
+    prompt_structure = [{"role": "system", "content": system_prompt}]
+    for msg in conversation_history:
+        prompt_structure.append(msg)
+    cache_key = chat_cache_key(gpt_model, prompt_structure, tools)
+    cached = get_cached_chat(cache_key)
+    if cached is not None:
+        return SimpleNamespace(content=cached, tool_calls=None)
+    try:
+        completion = StreamedCompletion()
+        stream = await async_call_with_retry("openai.chat", lambda: ai_client.chat.completions.create(
+            model = gpt_model,
+            messages = prompt_structure,
+            tools = tools or NOT_GIVEN,
+            tool_choice = "auto" if tools else NOT_GIVEN,
+            stream = True
+        ), estimate_prompt_tokens(prompt_structure))
+        async for chunk in stream:
+            if completion.add(chunk) and on_delta and await on_delta(completion.content) is False:
+                await stream.close()
+                return completion.message()
+        message = completion.message()
+        put_cached_chat(cache_key, message)
+        return message
+    except Exception as e:
+        return SimpleNamespace(content=f"[ERROR] Problem calling OpenAI API:\n {e}")
+
+def tool_calls_message(result):
+    return {
+        "role": "assistant",
+        "content": result.content,
+        "tool_calls": [
+            {"id": call.id, "type": "function", "function": {"name": call.function.name, "arguments": call.function.arguments}}
+            for call in result.tool_calls
+        ],
+    }
+
+def tool_result_message(tool_call, output):
+    # Tools that upload to Slack return nothing, but the model still needs an answer for every call
+    return {"role": "tool", "tool_call_id": tool_call.id, "content": output or "Done, the result was posted to the Slack thread."}
+
+class StreamedCompletion:
+    def __init__(self):
+        self.content = ""
+        self.tool_calls = {}
+        self.started_at = time.monotonic()
+        self.first_token_at = None
+
+    def add(self, chunk):
+        if not chunk.choices:
+            return False
+        delta = chunk.choices[0].delta
+        if self.first_token_at is None and (delta.content or delta.tool_calls):
+            self.first_token_at = time.monotonic()
+            logger.info("Time to first token: %.2fs", self.first_token_at - self.started_at)
+        # Tool calls arrive in fragments keyed by index: id and name first, then pieces of the arguments JSON
+        for tool_call in delta.tool_calls or []:
+            assembled = self.tool_calls.setdefault(tool_call.index, {"id": None, "name": "", "arguments": ""})
+            if tool_call.id:
+                assembled["id"] = tool_call.id
+            if tool_call.function and tool_call.function.name:
+                assembled["name"] += tool_call.function.name
+            if tool_call.function and tool_call.function.arguments:
+                assembled["arguments"] += tool_call.function.arguments
+        if delta.content:
+            self.content += delta.content
+            return True
+        return False
+
+    def message(self):
+        logger.info("Streamed completion finished in %.2fs", time.monotonic() - self.started_at)
+        return SimpleNamespace(
+            content = self.content or None,
+            tool_calls = [
+                SimpleNamespace(id=call["id"], type="function", function=SimpleNamespace(name=call["name"], arguments=call["arguments"]))
+                for _, call in sorted(self.tool_calls.items())
+            ] or None
+        )
+
+def generate_image(ai_client, image_model, input_text, size = "square", variant = 0):
+    cache_key = response_cache_key("image", image_model, input_text, get_image_size(size), variant) if response_cache else None
+    if cache_key:
+        cached = response_cache.get("image", cache_key, IMAGE_URL_MAX_AGE)
+        if cached is not None:
+            return cached.decode("utf-8")
+    response = call_with_retry("openai.images", lambda: ai_client.images.generate(model = image_model, prompt = input_text, size = get_image_size(size), quality = "standard", n=1))
+    if cache_key:
+        response_cache.put("image", cache_key, response.data[0].url.encode("utf-8"))
     return response.data[0].url
 
+def generate_image_bytes(ai_client, image_model, input_text, size = "square", variant = 0):
+    if Config.IMAGE_RESPONSE_FORMAT == "url":
+        image_url = generate_image(ai_client, image_model, input_text, size, variant)
+        return call_with_retry("download", lambda: download_to_bytes(image_url))
+    # The variant number is part of the key so cached variants of one prompt stay different from each other
+    cache_key = response_cache_key("image", image_model, input_text, get_image_size(size), "b64_json", variant) if response_cache else None
+    if cache_key:
+        cached = response_cache.get("image", cache_key)
+        if cached is not None:
+            return cached
+    response = call_with_retry("openai.images", lambda: ai_client.images.generate(model = image_model, prompt = input_text, size = get_image_size(size), quality = "standard", response_format = "b64_json", n=1))
+    image = base64.b64decode(response.data[0].b64_json)
+    if cache_key:
+        response_cache.put("image", cache_key, image)
+    return image
+
+def generate_image_variants(ai_client, image_model, input_text, size = "square", variants = 1, on_image = None):
+    # DALL-E 3 makes one image per request, so variants are separate requests run side by side.
+    # on_image receives each image as soon as it is ready; variants that fail are left out unless all of them do.
+    futures = [image_pool.submit(generate_image_bytes, ai_client, image_model, input_text, size, variant) for variant in range(variants)]
+    for future in as_completed(futures):
+        if future.exception() is None and on_image:
+            on_image(future.result())
+    return collect_image_variants([(future.result() if future.exception() is None else None, future.exception()) for future in futures])
+
 def generate_tts(ai_client, file_folder, tts_model, tts_voice, input_text):
     speech_file_path = f'{file_folder}/{generate_random_file_name()}.mp3'
-    with ai_client.audio.speech.with_streaming_response.create(model = tts_model, voice = tts_voice, input = input_text) as response:
-        response.stream_to_file(speech_file_path)
+    if response_cache or len(input_text) > Config.TTS_MAX_CHARS:
+        with open(speech_file_path, "wb") as speech_file:
+            speech_file.write(generate_tts_bytes(ai_client, tts_model, tts_voice, input_text))
+        return speech_file_path
+    def synthesize():
+        with ai_client.audio.speech.with_streaming_response.create(model = tts_model, voice = tts_voice, input = input_text) as response:
+            response.stream_to_file(speech_file_path)
+    call_with_retry("openai.speech", synthesize)
+    return speech_file_path
+
+def generate_tts_bytes(ai_client, tts_model, tts_voice, input_text):
+    segments = split_tts_text(input_text, Config.TTS_MAX_CHARS)
+    if len(segments) == 1:
+        return generate_tts_segment(ai_client, tts_model, tts_voice, input_text)
+    # Segments are synthesized side by side; MP3 is a sequence of independent frames, so the parts simply concatenate
+    return b"".join(tts_pool.map(lambda segment: generate_tts_segment(ai_client, tts_model, tts_voice, segment), segments))
+
+def generate_tts_segment(ai_client, tts_model, tts_voice, input_text):
+    cache_key = response_cache_key("tts", tts_model, tts_voice, input_text) if response_cache else None
+    if cache_key:
+        cached = response_cache.get("tts", cache_key)
+        if cached is not None:
+            return cached
+    def synthesize():
+        with ai_client.audio.speech.with_streaming_response.create(model = tts_model, voice = tts_voice, input = input_text) as response:
+            return b"".join(response.iter_bytes())
+    speech = call_with_retry("openai.speech", synthesize)
+    if cache_key:
+        response_cache.put("tts", cache_key, speech)
+    return speech
+
+def generate_stt(ai_client, audio, stt_model):
+    # audio is either a file path or a (file name, binary file object) pair; the name tells Whisper the format
+    def transcribe():
+        if isinstance(audio, str):
+            with open(audio, "rb") as audio_file:
+                return ai_client.audio.transcriptions.create(model = stt_model, file = audio_file, response_format="text")
+        audio[1].seek(0)
+        return ai_client.audio.transcriptions.create(model = stt_model, file = audio, response_format="text")
+    return call_with_retry("openai.transcriptions", transcribe)
+
+async def async_generate_image(ai_client, image_model, input_text, size = "square", variant = 0):
+    cache_key = response_cache_key("image", image_model, input_text, get_image_size(size), variant) if response_cache else None
+    if cache_key:
+        cached = response_cache.get("image", cache_key, IMAGE_URL_MAX_AGE)
+        if cached is not None:
+            return cached.decode("utf-8")
+    response = await async_call_with_retry("openai.images", lambda: ai_client.images.generate(model = image_model, prompt = input_text, size = get_image_size(size), quality = "standard", n=1))
+    if cache_key:
+        response_cache.put("image", cache_key, response.data[0].url.encode("utf-8"))
+    return response.data[0].url
+
+async def async_generate_image_bytes(ai_client, image_model, input_text, size = "square", variant = 0):
+    if Config.IMAGE_RESPONSE_FORMAT == "url":
+        image_url = await async_generate_image(ai_client, image_model, input_text, size, variant)
+        return await async_call_with_retry("download", lambda: async_download_to_bytes(image_url))
+    cache_key = response_cache_key("image", image_model, input_text, get_image_size(size), "b64_json", variant) if response_cache else None
+    if cache_key:
+        cached = response_cache.get("image", cache_key)
+        if cached is not None:
+            return cached
+    response = await async_call_with_retry("openai.images", lambda: ai_client.images.generate(model = image_model, prompt = input_text, size = get_image_size(size), quality = "standard", response_format = "b64_json", n=1))
+    image = base64.b64decode(response.data[0].b64_json)
+    if cache_key:
+        response_cache.put("image", cache_key, image)
+    return image
+
+async def async_generate_image_variants(ai_client, image_model, input_text, size = "square", variants = 1, on_image = None):
+    tasks = [asyncio.ensure_future(async_generate_image_bytes(ai_client, image_model, input_text, size, variant)) for variant in range(variants)]
+    for next_done in asyncio.as_completed(tasks):
+        try:
+            image = await next_done
+        except Exception:
+            continue
+        if on_image:
+            await on_image(image)
+    return collect_image_variants([(task.result() if task.exception() is None else None, task.exception()) for task in tasks])
+
+def collect_image_variants(outcomes):
+    images = [image for image, error in outcomes if error is None]
+    errors = [error for image, error in outcomes if error is not None]
+    if not images:
+        raise errors[0]
+    if errors:
+        logger.warning("%d of %d image variants failed: %s", len(errors), len(outcomes), errors[0])
+    return images
+
+async def async_generate_tts(ai_client, file_folder, tts_model, tts_voice, input_text):
+    speech_file_path = f'{file_folder}/{generate_random_file_name()}.mp3'
+    if response_cache or len(input_text) > Config.TTS_MAX_CHARS:
+        speech = await async_generate_tts_bytes(ai_client, tts_model, tts_voice, input_text)
+        with open(speech_file_path, "wb") as speech_file:
+            speech_file.write(speech)
+        return speech_file_path
+    async def synthesize():
+        async with ai_client.audio.speech.with_streaming_response.create(model = tts_model, voice = tts_voice, input = input_text) as response:
+            await response.stream_to_file(speech_file_path)
+    await async_call_with_retry("openai.speech", synthesize)
     return speech_file_path
 
-def generate_stt(ai_client, file_path, stt_model):
-    audio_file= open(file_path, "rb")
-    response = ai_client.audio.transcriptions.create(model = stt_model, file = audio_file, response_format="text")
-    return response
+async def async_generate_tts_bytes(ai_client, tts_model, tts_voice, input_text):
+    segments = split_tts_text(input_text, Config.TTS_MAX_CHARS)
+    if len(segments) == 1:
+        return await async_generate_tts_segment(ai_client, tts_model, tts_voice, input_text)
+    parts = await asyncio.gather(*[async_generate_tts_segment(ai_client, tts_model, tts_voice, segment) for segment in segments])
+    return b"".join(parts)
+
+async def async_generate_tts_segment(ai_client, tts_model, tts_voice, input_text):
+    cache_key = response_cache_key("tts", tts_model, tts_voice, input_text) if response_cache else None
+    if cache_key:
+        cached = response_cache.get("tts", cache_key)
+        if cached is not None:
+            return cached
+    async def synthesize():
+        async with ai_client.audio.speech.with_streaming_response.create(model = tts_model, voice = tts_voice, input = input_text) as response:
+            return b"".join([chunk async for chunk in response.iter_bytes()])
+    speech = await async_call_with_retry("openai.speech", synthesize)
+    if cache_key:
+        response_cache.put("tts", cache_key, speech)
+    return speech
 
-def encode_image(image_path):
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+async def async_generate_stt(ai_client, audio, stt_model):
+    async def transcribe():
+        if isinstance(audio, str):
+            with open(audio, "rb") as audio_file:
+                return await ai_client.audio.transcriptions.create(model = stt_model, file = audio_file, response_format="text")
+        audio[1].seek(0)
+        return await ai_client.audio.transcriptions.create(model = stt_model, file = audio, response_format="text")
+    return await async_call_with_retry("openai.transcriptions", transcribe)
+
+def get_embedding(ai_client, embedding_model, input_text):
+    response = call_with_retry("openai.embeddings", lambda: ai_client.embeddings.create(model = embedding_model, input = input_text), len(input_text) // 4 + 1)
+    return response.data[0].embedding
+
+async def async_get_embedding(ai_client, embedding_model, input_text):
+    response = await async_call_with_retry("openai.embeddings", lambda: ai_client.embeddings.create(model = embedding_model, input = input_text), len(input_text) // 4 + 1)
+    return response.data[0].embedding
+
+def split_tts_text(input_text, max_chars):
+    # Packs whole sentences into segments of at most max_chars; a sentence that is too long on its own is cut at spaces
+    segments = []
+    current = ""
+    for sentence in SENTENCE_END.split(input_text.strip()):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars + 1)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                segments.append(current)
+                current = ""
+            segments.append(sentence[:cut])
+            sentence = sentence[cut:].lstrip()
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            segments.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current or not segments:
+        segments.append(current)
+    return segments
+
+def estimate_prompt_tokens(prompt_structure):
+    # Cheap upper-bound estimate for the TPM limiter; images are charged at the high-detail rate
+    tokens = 0
+    for msg in prompt_structure:
+        content = msg.get("content") or ""
+        if isinstance(content, str):
+            tokens += len(content) // 4 + 4
+        else:
+            for part in content:
+                tokens += len(part["text"]) // 4 if part["type"] == "text" else 765
+    return tokens
+
+def get_image_size(size):
+    if size == "portrait":
+        return "1024x1792"
+    elif size == "landscape":
+        return "1792x1024"
+    return "1024x1024"
 
 def generate_random_file_name():
     return f'{int(time.time_ns())}_{random.randint(0,10000)}'
\ No newline at end of file
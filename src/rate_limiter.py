@@ -0,0 +1,224 @@
+# slack_ai_assistant/rate_limiter.py
+import asyncio
+import random
+import threading
+import time
+import urllib.error
+import openai
+import requests
+from config import Config
+from logging_config import logger
+from metrics import metrics
+
+try:
+    from aiohttp import ClientConnectionError
+except ImportError:
+    ClientConnectionError = ConnectionError
+
+TRANSIENT_ERRORS = (
+    openai.APIConnectionError,
+    ConnectionError,
+    TimeoutError,
+    urllib.error.URLError,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    ClientConnectionError,
+)
+
+class CircuitOpenError(Exception):
+    def __init__(self, endpoint, retry_in):
+        super().__init__(f"Circuit for {endpoint} is open, retry in {retry_in:.0f}s")
+        self.endpoint = endpoint
+
+class TokenBucket:
+    def __init__(self, name, per_minute, capacity=None):
+        self.name = name
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, amount):
+        # Takes the tokens now (possibly going negative) and returns how long the caller must wait for them
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= min(amount, self.capacity)
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self, amount=1):
+        wait = self._reserve(amount)
+        if wait > 0:
+            self._record_throttle(wait)
+            time.sleep(wait)
+        return wait
+
+    async def async_acquire(self, amount=1):
+        wait = self._reserve(amount)
+        if wait > 0:
+            self._record_throttle(wait)
+            await asyncio.sleep(wait)
+        return wait
+
+    def _record_throttle(self, wait):
+        metrics.incr(f"ratelimit.{self.name}.throttled")
+        metrics.observe(f"ratelimit.{self.name}.wait_seconds", wait)
+        logger.info("Rate limiter %s throttling for %.2fs", self.name, wait)
+
+class CircuitBreaker:
+    def __init__(self, endpoint, failure_threshold, reset_timeout):
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def check(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            elapsed = time.monotonic() - self._opened_at
+            if elapsed < self.reset_timeout:
+                metrics.incr(f"circuit.{self.endpoint}.rejected")
+                raise CircuitOpenError(self.endpoint, self.reset_timeout - elapsed)
+            # Half-open: let this call through as a probe, one more failure re-opens the circuit
+            self._opened_at = None
+            self._failures = self.failure_threshold - 1
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold and self._opened_at is None:
+                self._opened_at = time.monotonic()
+                metrics.incr(f"circuit.{self.endpoint}.opened")
+                logger.warning("Circuit for %s opened after %d failures", self.endpoint, self._failures)
+
+_buckets = {}
+_breakers = {}
+_registry_lock = threading.Lock()
+
+def get_bucket(name, per_minute):
+    with _registry_lock:
+        if name not in _buckets:
+            _buckets[name] = TokenBucket(name, per_minute)
+        return _buckets[name]
+
+def get_breaker(endpoint):
+    with _registry_lock:
+        if endpoint not in _breakers:
+            _breakers[endpoint] = CircuitBreaker(endpoint, Config.CIRCUIT_FAILURE_THRESHOLD, Config.CIRCUIT_RESET_TIMEOUT)
+        return _breakers[endpoint]
+
+def get_limits(endpoint, tokens):
+    if endpoint.startswith("openai."):
+        limits = []
+        if Config.OPENAI_RPM > 0:
+            limits.append((get_bucket("openai.requests", Config.OPENAI_RPM), 1))
+        if Config.OPENAI_TPM > 0 and tokens:
+            limits.append((get_bucket("openai.tokens", Config.OPENAI_TPM), tokens))
+        return limits
+    if endpoint.startswith("slack.") and Config.SLACK_METHOD_RPM > 0:
+        # Slack rate limits apply per Web API method
+        return [(get_bucket(endpoint, Config.SLACK_METHOD_RPM), 1)]
+    return []
+
+def classify_error(e):
+    # Returns (retryable, retry_after seconds or None, counts towards the circuit breaker)
+    status = getattr(e, "status_code", None)
+    response = getattr(e, "response", None)
+    if status is None and response is not None:
+        status = getattr(response, "status_code", None)
+    headers = getattr(response, "headers", None) or {}
+    retry_after = headers.get("retry-after") or headers.get("Retry-After")
+    try:
+        retry_after = float(retry_after) if retry_after is not None else None
+    except (TypeError, ValueError):
+        retry_after = None
+    if status == 429:
+        return True, retry_after, False
+    if status is not None and status >= 500:
+        return True, retry_after, True
+    if isinstance(e, TRANSIENT_ERRORS):
+        return True, None, True
+    return False, None, False
+
+def backoff_delay(attempt, retry_after):
+    delay = random.uniform(0, min(Config.RETRY_MAX_DELAY, Config.RETRY_BASE_DELAY * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+def call_with_retry(endpoint, call, tokens=0):
+    breaker = get_breaker(endpoint)
+    attempt = 0
+    while True:
+        breaker.check()
+        for bucket, amount in get_limits(endpoint, tokens):
+            bucket.acquire(amount)
+        try:
+            result = call()
+            breaker.record_success()
+            return result
+        except Exception as e:
+            delay = handle_failure(endpoint, breaker, e, attempt)
+        time.sleep(delay)
+        attempt += 1
+
+async def async_call_with_retry(endpoint, call, tokens=0):
+    breaker = get_breaker(endpoint)
+    attempt = 0
+    while True:
+        breaker.check()
+        for bucket, amount in get_limits(endpoint, tokens):
+            await bucket.async_acquire(amount)
+        try:
+            result = await call()
+            breaker.record_success()
+            return result
+        except Exception as e:
+            delay = handle_failure(endpoint, breaker, e, attempt)
+        await asyncio.sleep(delay)
+        attempt += 1
+
+def handle_failure(endpoint, breaker, e, attempt):
+    retryable, retry_after, counts = classify_error(e)
+    if counts:
+        breaker.record_failure()
+    if not retryable or attempt + 1 >= Config.RETRY_MAX_ATTEMPTS:
+        metrics.incr(f"retry.{endpoint}.failed")
+        raise e
+    delay = backoff_delay(attempt, retry_after)
+    metrics.incr(f"retry.{endpoint}.retries")
+    logger.warning("%s failed (%s), retry %d/%d in %.2fs", endpoint, e, attempt + 1, Config.RETRY_MAX_ATTEMPTS - 1, delay)
+    return delay
+
+class ThrottledSlackClient:
+    # Bolt builds a fresh WebClient per request, so Web API calls are throttled by wrapping that client
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+        def call(*args, **kwargs):
+            return call_with_retry(f"slack.{name}", lambda: attr(*args, **kwargs))
+        return call
+
+class AsyncThrottledSlackClient(ThrottledSlackClient):
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+        async def call(*args, **kwargs):
+            return await async_call_with_retry(f"slack.{name}", lambda: attr(*args, **kwargs))
+        return call
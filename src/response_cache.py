@@ -0,0 +1,94 @@
+# slack_ai_assistant/response_cache.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from config import Config
+from metrics import metrics
+
+class ResponseCache:
+    def __init__(self, db_path, max_bytes, ttl_seconds):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, kind TEXT NOT NULL, payload BLOB NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_by_access ON responses (accessed_at)")
+        self._conn.commit()
+
+    def get(self, kind, key, max_age=None):
+        max_age = min(max_age or self.ttl_seconds, self.ttl_seconds)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT payload FROM responses WHERE key = ? AND created_at > ?", (key, now - max_age)).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+        metrics.incr(f"response_cache.{kind}.{'hits' if row is not None else 'misses'}")
+        return row[0] if row is not None else None
+
+    def put(self, kind, key, payload):
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, kind, payload, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, kind, payload, size, now, now),
+            )
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+            self._evict()
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"entries": entries, "bytes": total}
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall():
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+response_cache = ResponseCache(Config.RESPONSE_CACHE_PATH, Config.RESPONSE_CACHE_MAX_BYTES, Config.RESPONSE_CACHE_TTL) if Config.RESPONSE_CACHE_ENABLED else None
+
+def response_cache_key(kind, *parts):
+    # Canonical JSON so dict ordering or whitespace never splits otherwise identical requests
+    canonical = json.dumps([kind, *parts], sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def chat_cache_key(gpt_model, prompt_structure, tools):
+    if response_cache is None:
+        return None
+    # Images and transcripts come in as multi-part content; those conversations are not worth caching
+    if any(not isinstance(msg.get("content"), str) for msg in prompt_structure if msg.get("role") == "user"):
+        metrics.incr("response_cache.chat.bypassed")
+        return None
+    return response_cache_key("chat", gpt_model, prompt_structure, list(tools or []))
+
+def get_cached_chat(key):
+    if key is None:
+        return None
+    payload = response_cache.get("chat", key)
+    return payload.decode("utf-8") if payload is not None else None
+
+def put_cached_chat(key, message):
+    # Only plain answers are stored; tool calls have side effects that must run again
+    if key is not None and message.content and not getattr(message, "tool_calls", None):
+        response_cache.put("chat", key, message.content.encode("utf-8"))
@@ -0,0 +1,185 @@
+# slack_ai_assistant/scheduler.py
+import asyncio
+import contextvars
+import threading
+import time
+from collections import Counter
+from logging_config import logger
+from metrics import metrics
+
+# Holds the cancel flag of the job the current worker is running, so replies can stop work a newer message superseded
+current_cancel = contextvars.ContextVar("current_cancel", default=None)
+
+def is_cancelled():
+    cancelled = current_cancel.get()
+    return cancelled is not None and cancelled.is_set()
+
+class QueueFullError(Exception):
+    def __init__(self, depth):
+        super().__init__(f"Work queue is full ({depth} jobs waiting)")
+        self.depth = depth
+
+class Job:
+    def __init__(self, work, user=None, channel=None, thread_key=None):
+        self.work = work
+        self.user = user
+        self.channel = channel
+        self.thread_key = thread_key
+        self.cancelled = threading.Event()
+        self.enqueued_at = time.monotonic()
+
+class BaseScheduler:
+    def __init__(self, name, workers, max_queue, per_user, per_channel, serialize_threads=True, coalesce_threads=False):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.per_user = per_user
+        self.per_channel = per_channel
+        self.serialize_threads = serialize_threads
+        self.coalesce_threads = coalesce_threads
+        self._pending = []
+        self._running = 0
+        self._running_users = Counter()
+        self._running_channels = Counter()
+        self._running_threads = {}
+
+    def _enqueue(self, job):
+        if len(self._pending) >= self.max_queue:
+            metrics.incr(f"{self.name}.rejected")
+            raise QueueFullError(len(self._pending))
+        if self.coalesce_threads and job.thread_key:
+            self._supersede(job.thread_key)
+        self._pending.append(job)
+        metrics.incr(f"{self.name}.submitted")
+        self._update_gauges()
+        # Position 0 means there is nothing to tell the user: a free worker picks the job up right away, or it only waits
+        # for the run answering an earlier message in its own thread
+        if self.serialize_threads and job.thread_key and self._waits_for_thread(job):
+            return 0
+        runnable_ahead = sum(1 for pending in self._pending if self._can_run(pending))
+        if self._can_run(job) and runnable_ahead <= self.workers - self._running:
+            return 0
+        return max(1, len(self._pending) - (self.workers - self._running))
+
+    def _can_run(self, job):
+        if job.user and self._running_users[job.user] >= self.per_user:
+            return False
+        if job.channel and self._running_channels[job.channel] >= self.per_channel:
+            return False
+        # One job per thread at a time, taken in arrival order, so answers land in the order they were asked
+        if self.serialize_threads and job.thread_key and job.thread_key in self._running_threads:
+            return False
+        return True
+
+    def _waits_for_thread(self, job):
+        return job.thread_key in self._running_threads or any(pending.thread_key == job.thread_key for pending in self._pending if pending is not job)
+
+    def _supersede(self, thread_key):
+        # Latest wins: the new job answers from the whole thread history, so older queued or streaming runs can stop
+        superseded = [job for job in self._pending if job.thread_key == thread_key]
+        if thread_key in self._running_threads:
+            superseded.append(self._running_threads[thread_key])
+        for job in superseded:
+            if not job.cancelled.is_set():
+                job.cancelled.set()
+                metrics.incr(f"{self.name}.superseded")
+
+    def _take_runnable(self):
+        # Oldest job whose user and channel are still below their caps
+        for index, job in enumerate(self._pending):
+            if self._can_run(job):
+                del self._pending[index]
+                self._running += 1
+                self._running_users[job.user] += 1
+                self._running_channels[job.channel] += 1
+                if job.thread_key:
+                    self._running_threads[job.thread_key] = job
+                metrics.observe(f"{self.name}.wait_seconds", time.monotonic() - job.enqueued_at)
+                self._update_gauges()
+                return job
+        return None
+
+    def _release(self, job):
+        self._running -= 1
+        self._running_users[job.user] -= 1
+        self._running_channels[job.channel] -= 1
+        if self._running_threads.get(job.thread_key) is job:
+            del self._running_threads[job.thread_key]
+        self._update_gauges()
+
+    def _update_gauges(self):
+        metrics.gauge(f"{self.name}.queue_depth", len(self._pending))
+        metrics.gauge(f"{self.name}.running", self._running)
+
+    def _record_run(self, job, started_at, error):
+        metrics.observe(f"{self.name}.run_seconds", time.monotonic() - started_at)
+        if error is not None:
+            metrics.incr(f"{self.name}.failed")
+            logger.error("Scheduled job failed (user %s, channel %s): %s", job.user, job.channel, error)
+
+class WorkScheduler(BaseScheduler):
+    def __init__(self, name, workers, max_queue, per_user, per_channel, serialize_threads=True, coalesce_threads=False):
+        super().__init__(name, workers, max_queue, per_user, per_channel, serialize_threads, coalesce_threads)
+        self._condition = threading.Condition()
+        for index in range(workers):
+            threading.Thread(target=self._worker, name=f"{name}-worker-{index}", daemon=True).start()
+
+    def submit(self, work, user=None, channel=None, thread_key=None):
+        with self._condition:
+            position = self._enqueue(Job(work, user, channel, thread_key))
+            self._condition.notify_all()
+            return position
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                job = self._take_runnable()
+                while job is None:
+                    self._condition.wait()
+                    job = self._take_runnable()
+            started_at = time.monotonic()
+            error = None
+            current_cancel.set(job.cancelled)
+            try:
+                job.work()
+            except Exception as e:
+                error = e
+            self._record_run(job, started_at, error)
+            with self._condition:
+                self._release(job)
+                self._condition.notify_all()
+
+class AsyncWorkScheduler(BaseScheduler):
+    def __init__(self, name, workers, max_queue, per_user, per_channel, serialize_threads=True, coalesce_threads=False):
+        super().__init__(name, workers, max_queue, per_user, per_channel, serialize_threads, coalesce_threads)
+        self._condition = None
+        self._tasks = []
+
+    async def submit(self, work, user=None, channel=None, thread_key=None):
+        if self._condition is None:
+            # Worker tasks can only be created once the event loop is running
+            self._condition = asyncio.Condition()
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        async with self._condition:
+            position = self._enqueue(Job(work, user, channel, thread_key))
+            self._condition.notify_all()
+            return position
+
+    async def _worker(self):
+        while True:
+            async with self._condition:
+                job = self._take_runnable()
+                while job is None:
+                    await self._condition.wait()
+                    job = self._take_runnable()
+            started_at = time.monotonic()
+            error = None
+            current_cancel.set(job.cancelled)
+            try:
+                await job.work()
+            except Exception as e:
+                error = e
+            self._record_run(job, started_at, error)
+            async with self._condition:
+                self._release(job)
+                self._condition.notify_all()
@@ -0,0 +1,187 @@
+# slack_ai_assistant/semantic_cache.py
+import os
+import re
+import sqlite3
+import threading
+import time
+from config import Config
+from logging_config import logger
+from metrics import metrics
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MENTION_PATTERN = re.compile(r"<[@#!][^>]*>")
+LSH_TABLES = 8
+LSH_BITS = 12
+
+class SemanticCache:
+    # Embeddings live in a fixed-size .npy file that is memory-mapped and written in place; questions and answers live in sqlite.
+    # Several worker processes can share the folder: sqlite decides which row each answer goes to, so nothing is kept only in memory.
+    def __init__(self, folder, max_entries, threshold, ttl_seconds, index_type):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.index_type = index_type
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        self._vectors_path = os.path.join(folder, "embeddings.npy")
+        self._conn = sqlite3.connect(os.path.join(folder, "answers.db"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "row INTEGER PRIMARY KEY, question TEXT NOT NULL, answer TEXT NOT NULL, latency REAL NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.commit()
+        self._count = self._stored_count()
+        self._vectors = None
+        self._codes = None
+        if os.path.exists(self._vectors_path):
+            self._vectors = np.lib.format.open_memmap(self._vectors_path, mode="r+")
+            if self._vectors.shape[0] != max_entries:
+                logger.warning("Semantic cache size changed, starting with an empty index")
+                self._reset()
+            else:
+                self._build_index()
+        logger.info("Semantic cache loaded: %d answers, %s index", self._count, index_type)
+
+    def search(self, vector):
+        # Returns (answer, original latency) for the closest cached question, or None below the threshold
+        with self._lock:
+            self._refresh()
+            if self._vectors is None or self._count == 0 or self._vectors.shape[1] != len(vector):
+                return None
+            rows = self._candidates(vector)
+            if len(rows) == 0:
+                return None
+            scores = self._vectors[rows] @ vector
+            best = int(np.argmax(scores))
+            score, row = float(scores[best]), int(rows[best])
+            if score < self.threshold:
+                return None
+            found = self._conn.execute("SELECT answer, latency, created_at FROM answers WHERE row = ?", (row,)).fetchone()
+            if found is None or time.time() - found[2] > self.ttl_seconds:
+                return None
+            self._conn.execute("UPDATE answers SET accessed_at = ?, hits = hits + 1 WHERE row = ?", (time.time(), row))
+            self._conn.commit()
+        logger.info("Semantic cache hit with similarity %.3f", score)
+        return found[0], found[1]
+
+    def add(self, question, vector, answer, latency):
+        with self._lock:
+            # The write lock is held from picking the row until its answer is committed, so two processes never pick the same row
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._refresh()
+                if self._vectors is None or self._vectors.shape[1] != len(vector):
+                    self._create(len(vector))
+                if self._count < self.max_entries:
+                    row = self._count
+                    self._count += 1
+                else:
+                    # Full: overwrite the least recently used answer in place
+                    row = self._conn.execute("SELECT row FROM answers ORDER BY accessed_at LIMIT 1").fetchone()[0]
+                    metrics.incr("semantic_cache.evictions")
+                self._vectors[row] = vector
+                self._vectors.flush()
+                if self._codes is not None:
+                    self._codes[row] = self._hash(vector[np.newaxis, :])[0]
+                now = time.time()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO answers (row, question, answer, latency, created_at, accessed_at, hits) VALUES (?, ?, ?, ?, ?, ?, 0)",
+                    (row, question, answer, latency, now, now),
+                )
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def _stored_count(self):
+        # Rows are handed out in order, so the highest one in use tells how much of the embeddings file is filled
+        return self._conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM answers").fetchone()[0]
+
+    def _refresh(self):
+        # Picks up the embeddings file and the rows other processes added since this one last looked
+        if self._vectors is None:
+            if not os.path.exists(self._vectors_path):
+                return
+            self._vectors = np.lib.format.open_memmap(self._vectors_path, mode="r+")
+            self._count = self._stored_count()
+            self._build_index()
+            return
+        count = self._stored_count()
+        if count > self._count and self._codes is not None:
+            self._codes[self._count:count] = self._hash(self._vectors[self._count:count])
+        self._count = count
+
+    def _create(self, dimensions):
+        # Runs inside add()'s transaction, which commits the cleared table
+        self._vectors = np.lib.format.open_memmap(self._vectors_path, mode="w+", dtype=np.float32, shape=(self.max_entries, dimensions))
+        self._conn.execute("DELETE FROM answers")
+        self._count = 0
+        self._build_index()
+
+    def _reset(self):
+        self._vectors = None
+        self._codes = None
+        os.remove(self._vectors_path)
+        self._conn.execute("DELETE FROM answers")
+        self._conn.commit()
+        self._count = 0
+
+    def _build_index(self):
+        if self.index_type != "lsh":
+            return
+        # Random-hyperplane LSH: a fixed seed keeps the planes, and so the stored codes, stable across restarts
+        planes = np.random.default_rng(0).standard_normal((LSH_TABLES * LSH_BITS, self._vectors.shape[1])).astype(np.float32)
+        self._planes = planes.reshape(LSH_TABLES, LSH_BITS, -1)
+        self._codes = np.zeros((self.max_entries, LSH_TABLES), dtype=np.int64)
+        if self._count:
+            self._codes[:self._count] = self._hash(self._vectors[:self._count])
+
+    def _hash(self, vectors):
+        bits = np.einsum("tbd,nd->ntb", self._planes, vectors) > 0
+        return bits.astype(np.int64) @ (1 << np.arange(LSH_BITS, dtype=np.int64))
+
+    def _candidates(self, vector):
+        if self._codes is None:
+            return np.arange(self._count)
+        # A candidate only has to share its bucket in one of the tables
+        code = self._hash(vector[np.newaxis, :])[0]
+        return np.nonzero((self._codes[:self._count] == code).any(axis=1))[0]
+
+def normalize_question(text):
+    text = MENTION_PATTERN.sub(" ", text or "")
+    return " ".join(text.lower().split()).strip(" ?!.")
+
+def single_turn_question(conversation_history):
+    # Only a lone plain-text question can be answered from the cache; threads and attachments change the answer
+    if len(conversation_history) != 1:
+        return None
+    message = conversation_history[0]
+    if message.get("role") != "user" or not isinstance(message.get("content"), str):
+        return None
+    return normalize_question(message["content"]) or None
+
+def to_vector(embedding):
+    vector = np.asarray(embedding, dtype=np.float32)
+    return vector / (np.linalg.norm(vector) or 1.0)
+
+def record_hit(latency, started_at):
+    saved = max(0.0, latency - (time.monotonic() - started_at))
+    metrics.incr("semantic_cache.hits")
+    metrics.observe("semantic_cache.saved_seconds", saved)
+    logger.info("Semantic cache saved %.2fs", saved)
+
+def create_semantic_cache():
+    if not Config.SEMANTIC_CACHE_ENABLED:
+        return None
+    if np is None:
+        logger.warning("SEMANTIC_CACHE_ENABLED is set but numpy is not installed, semantic cache disabled")
+        return None
+    return SemanticCache(Config.SEMANTIC_CACHE_FOLDER, Config.SEMANTIC_CACHE_MAX_ENTRIES, Config.SEMANTIC_CACHE_THRESHOLD, Config.SEMANTIC_CACHE_TTL, Config.SEMANTIC_CACHE_INDEX)
+
+semantic_cache = create_semantic_cache()
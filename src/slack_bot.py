@@ -1,10 +1,27 @@
 # slack_ai_assistant/slack_bot.py
 from slack_bolt import App
 from config import Config
-from event_handlers import handle_message_events, handle_app_mention_events
 
 def init_slack_bot():
+    from event_handlers import handle_message_events, handle_app_mention_events
     app = App(token=Config.SLACK_BOT_USER_TOKEN, signing_secret=Config.SLACK_SIGNING_SECRET)
     app.event("message")(handle_message_events)
     app.event("app_mention")(handle_app_mention_events)
-    return app
\ No newline at end of file
+    return app
+
+def start_job_workers():
+    from event_handlers import start_job_workers
+    start_job_workers()
+
+def init_async_slack_bot():
+    # The async stack needs aiohttp, so it is only imported when that mode is selected
+    from slack_bolt.async_app import AsyncApp
+    from async_event_handlers import handle_message_events, handle_app_mention_events
+    app = AsyncApp(token=Config.SLACK_BOT_USER_TOKEN, signing_secret=Config.SLACK_SIGNING_SECRET)
+    app.event("message")(handle_message_events)
+    app.event("app_mention")(handle_app_mention_events)
+    return app
+
+async def async_start_job_workers():
+    from async_event_handlers import start_job_workers
+    await start_job_workers()
\ No newline at end of file
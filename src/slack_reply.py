@@ -0,0 +1,89 @@
+# slack_ai_assistant/slack_reply.py
+import time
+from config import Config
+from logging_config import logger
+from scheduler import is_cancelled
+
+class SlackReply:
+    def __init__(self, client, channel, thread_ts=None, prefix=""):
+        self.client = client
+        self.channel = channel
+        self.thread_ts = thread_ts
+        self.prefix = prefix
+        self.ts = None
+        self._last_text = None
+        self._last_update_at = 0.0
+
+    @property
+    def started(self):
+        return self.ts is not None
+
+    def start(self):
+        message_kwargs = {"channel": self.channel, "text": Config.WAITING_MESSAGE or "..."}
+        if self.thread_ts:
+            message_kwargs["thread_ts"] = self.thread_ts
+        self.ts = self.client.chat_postMessage(**message_kwargs)["ts"]
+        self._last_update_at = time.monotonic()
+
+    def update(self, text):
+        # Returning False tells the stream to stop because a newer message superseded this run
+        if is_cancelled():
+            return False
+        # chat.update is rate limited per workspace, so partial answers are pushed at a fixed cadence
+        if not self.started or time.monotonic() - self._last_update_at < Config.STREAM_UPDATE_INTERVAL:
+            return
+        self._update(text)
+
+    def finish(self, text):
+        if not self.started:
+            return
+        if text:
+            self._update(text)
+        else:
+            # Nothing left to say in text (e.g. a file was uploaded instead), so drop the placeholder
+            self.client.chat_delete(channel=self.channel, ts=self.ts)
+
+    def _update(self, text):
+        full_text = f"{self.prefix}{text}"
+        if not text or full_text == self._last_text:
+            return
+        try:
+            self.client.chat_update(channel=self.channel, ts=self.ts, text=full_text)
+            self._last_text = full_text
+        except Exception as e:
+            logger.error("Problem updating streamed reply: %s", e)
+        self._last_update_at = time.monotonic()
+
+class AsyncSlackReply(SlackReply):
+    async def start(self):
+        message_kwargs = {"channel": self.channel, "text": Config.WAITING_MESSAGE or "..."}
+        if self.thread_ts:
+            message_kwargs["thread_ts"] = self.thread_ts
+        self.ts = (await self.client.chat_postMessage(**message_kwargs))["ts"]
+        self._last_update_at = time.monotonic()
+
+    async def update(self, text):
+        if is_cancelled():
+            return False
+        if not self.started or time.monotonic() - self._last_update_at < Config.STREAM_UPDATE_INTERVAL:
+            return
+        await self._update(text)
+
+    async def finish(self, text):
+        if not self.started:
+            return
+        if text:
+            await self._update(text)
+        else:
+            await self.client.chat_delete(channel=self.channel, ts=self.ts)
+
+    async def _update(self, text):
+        full_text = f"{self.prefix}{text}"
+        if not text or full_text == self._last_text:
+            return
+        try:
+            await self.client.chat_update(channel=self.channel, ts=self.ts, text=full_text)
+            self._last_text = full_text
+        except Exception as e:
+            logger.error("Problem updating streamed reply: %s", e)
+        self._last_update_at = time.monotonic()
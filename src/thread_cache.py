@@ -0,0 +1,110 @@
+# slack_ai_assistant/thread_cache.py
+import json
+import threading
+import time
+from collections import OrderedDict
+
+def ts_key(ts):
+    # Slack timestamps are "seconds.micros" strings; compare them numerically
+    seconds, _, micros = str(ts).partition(".")
+    return (int(seconds), int(micros or 0))
+
+class ThreadEntry:
+    def __init__(self, messages, last_ts):
+        self.messages = messages
+        self.last_ts = last_ts
+        self.size = estimate_size(messages)
+        self.summary = None
+        self.summary_covered = 0
+        self.touched_at = time.monotonic()
+
+class ThreadHistoryCache:
+    def __init__(self, max_bytes, ttl_seconds):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_expired(entry):
+                self._remove(key)
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry.touched_at = time.monotonic()
+            self._entries.move_to_end(key)
+            return list(entry.messages), entry.last_ts
+
+    def put(self, key, messages, last_ts):
+        entry = ThreadEntry(list(messages), last_ts)
+        with self._lock:
+            current = self._entries.get(key)
+            # A concurrent run may already have cached a newer view of the thread
+            if current is not None and ts_key(current.last_ts) > ts_key(last_ts):
+                return
+            if current is not None:
+                entry.summary = current.summary
+                entry.summary_covered = current.summary_covered
+                self._remove(key)
+            if entry.size > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self._size += entry.size
+            self._evict()
+
+    def get_summary(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, 0
+            return entry.summary, entry.summary_covered
+
+    def set_summary(self, key, summary, covered):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and covered >= entry.summary_covered:
+                entry.summary = summary
+                entry.summary_covered = covered
+
+    def invalidate(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "threads": len(self._entries),
+                "bytes": self._size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _is_expired(self, entry):
+        return time.monotonic() - entry.touched_at > self.ttl_seconds
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._size -= entry.size
+
+    def _evict(self):
+        for key in [k for k, e in self._entries.items() if self._is_expired(e)]:
+            self._remove(key)
+            self.evictions += 1
+        while self._size > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
+
+def estimate_size(messages):
+    return len(json.dumps(messages, ensure_ascii=False))
@@ -0,0 +1,96 @@
+# slack_ai_assistant/tool_registry.py
+from config import Config
+from logging_config import logger
+
+class Tool:
+    def __init__(self, name, description, parameters, enabled, timeout):
+        self.name = name
+        self.enabled = enabled
+        self.timeout = timeout
+        self.schema = {
+            "type": "function",
+            "function": {
+                "name": name,
+                "description": description,
+                "parameters": parameters,
+            },
+        }
+        # Executors take (client, message, arguments) and return the text to post, or None when they posted themselves
+        self.executor = None
+        self.async_executor = None
+
+_tools = {}
+_tool_schemas = ()
+
+def register_tool(name, description, parameters, enabled=True, timeout=None):
+    global _tool_schemas
+    _tools[name] = Tool(name, description, parameters, enabled, timeout or Config.TOOL_TIMEOUT)
+    # Rebuilt only when a tool is registered; every request shares the same tuple so no caller can mutate it
+    _tool_schemas = tuple(tool.schema for tool in _tools.values() if tool.enabled)
+    return _tools[name]
+
+def tool_executor(name):
+    def decorator(func):
+        _tools[name].executor = func
+        return func
+    return decorator
+
+def async_tool_executor(name):
+    def decorator(func):
+        _tools[name].async_executor = func
+        return func
+    return decorator
+
+def get_tool(name):
+    tool = _tools.get(name)
+    if tool is None or not tool.enabled:
+        return None
+    return tool
+
+def get_tool_timeout(name):
+    tool = _tools.get(name)
+    return tool.timeout if tool else Config.TOOL_TIMEOUT
+
+def get_tools():
+    return _tool_schemas
+
+register_tool("generate_image", "Generate image basing on description", {
+    "type": "object",
+    "properties": {
+        "description": {
+            "type": "string",
+            "description": "Description of the image, e.g. a house under an apple tree",
+        },
+        "size": {
+            "type": "string",
+            "enum": ["square", "portrait", "landscape"],
+            "description": "Size of the generated image. Use square if no information is provided",
+        },
+        "variants": {
+            "type": "integer",
+            "minimum": 1,
+            "maximum": Config.IMAGE_MAX_VARIANTS,
+            "description": "Number of alternative images to generate. Use 1 unless the user asks for several",
+        }
+    },
+    "required": ["description"],
+}, Config.IMAGE_GENERATION_ENABLED)
+
+register_tool("generate_tts", "Generate or convert from text to speech", {
+    "type": "object",
+    "properties": {
+        "input_text": {
+            "type": "string",
+            "description": "Text to be converted to speech",
+        }
+    },
+    "required": ["input_text"],
+}, Config.TEXT_TO_SPEECH_ENABLED)
+
+register_tool("generate_stt", "Transcript or convert from speech to text", {
+    "type": "object",
+    "properties": {
+    }
+}, Config.SPEECH_TO_TEXT_ENABLED)
+
+logger.info("Tools enabled: %s", ", ".join(tool.name for tool in _tools.values() if tool.enabled) or "none")
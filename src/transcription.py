@@ -0,0 +1,253 @@
+# slack_ai_assistant/transcription.py
+import asyncio
+import hashlib
+import io
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from types import SimpleNamespace
+from config import Config
+from logging_config import logger
+from metrics import metrics
+from openai_utils import generate_stt, async_generate_stt
+
+FFMPEG = shutil.which("ffmpeg")
+FFPROBE = shutil.which("ffprobe")
+CHUNK_BITRATE = 48000  # Chunks are re-encoded to mono 16 kHz mp3, plenty for speech
+WORD_PATTERN = re.compile(r"[^\w']+")
+
+stt_pool = ThreadPoolExecutor(max_workers=Config.STT_CHUNK_WORKERS, thread_name_prefix="stt")
+# Created on first use so it binds to the running event loop
+stt_limit = None
+
+def transcribe_audio(ai_client, audio, stt_model, on_partial=None, size=None, duration=None):
+    # Same arguments as generate_stt; long recordings are split into overlapping windows transcribed side by side.
+    # size and duration are hints from the Slack file, see may_need_chunks
+    ai_client = get_stt_client(ai_client)
+    if not may_need_chunks(audio, size, duration):
+        return generate_stt(ai_client, audio, stt_model)
+    with audio_path(audio) as path:
+        chunks = plan_audio_chunks(path)
+        if chunks is None:
+            return generate_stt(ai_client, audio, stt_model)
+        started_at = time.monotonic()
+        futures = [stt_pool.submit(transcribe_chunk, ai_client, path, start, length, stt_model) for start, length in chunks]
+        texts = []
+        # Results are collected in order, so every partial transcript is a prefix of the final one
+        for future in futures:
+            texts.append(future.result())
+            if on_partial and len(texts) < len(chunks):
+                on_partial(stitch_transcripts(texts))
+    return finish_transcript(texts, started_at)
+
+async def async_transcribe_audio(ai_client, audio, stt_model, on_partial=None, size=None, duration=None):
+    global stt_limit
+    ai_client = get_stt_client(ai_client, True)
+    if not may_need_chunks(audio, size, duration):
+        return await async_generate_stt(ai_client, audio, stt_model)
+    with audio_path(audio) as path:
+        chunks = await asyncio.to_thread(plan_audio_chunks, path)
+        if chunks is None:
+            return await async_generate_stt(ai_client, audio, stt_model)
+        if stt_limit is None:
+            stt_limit = asyncio.Semaphore(Config.STT_CHUNK_WORKERS)
+        async def transcribe(start, length):
+            async with stt_limit:
+                chunk = await asyncio.to_thread(extract_chunk, path, start, length)
+                return await async_generate_stt(ai_client, chunk, stt_model)
+        started_at = time.monotonic()
+        tasks = [asyncio.ensure_future(transcribe(start, length)) for start, length in chunks]
+        texts = []
+        try:
+            for task in tasks:
+                texts.append(await task)
+                if on_partial and len(texts) < len(chunks):
+                    await on_partial(stitch_transcripts(texts))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+    return finish_transcript(texts, started_at)
+
+def transcribe_chunk(ai_client, path, start, length, stt_model):
+    return generate_stt(ai_client, extract_chunk(path, start, length), stt_model)
+
+def finish_transcript(texts, started_at):
+    metrics.incr("stt.chunks", len(texts))
+    metrics.observe("stt.long_audio_seconds", time.monotonic() - started_at)
+    logger.info("Transcribed %d audio chunks in %.2fs", len(texts), time.monotonic() - started_at)
+    return stitch_transcripts(texts)
+
+def may_need_chunks(audio, size=None, duration=None):
+    # Splitting means spilling in-memory downloads to disk and running ffprobe; short notes skip all of it and go out in one upload
+    if size is None:
+        size = audio_size(audio)
+    if size > Config.STT_MAX_UPLOAD_BYTES:
+        return True
+    if duration is not None:
+        return duration > Config.STT_CHUNK_SECONDS
+    return size > Config.STT_CHUNK_MIN_BYTES
+
+def audio_size(audio):
+    if isinstance(audio, str):
+        return os.path.getsize(audio)
+    audio_file = audio[1]
+    size = audio_file.seek(0, io.SEEK_END)
+    audio_file.seek(0)
+    return size
+
+def slack_audio_duration(file):
+    # Slack reports duration_ms for voice clips and some uploads; None when it does not
+    duration_ms = file.get("duration_ms")
+    return duration_ms / 1000 if duration_ms else None
+
+@contextmanager
+def audio_path(audio):
+    # Splitting needs a seekable file on disk; in-memory downloads are spilled to a temp file for the duration
+    if isinstance(audio, str):
+        yield audio
+        return
+    name, audio_file = audio
+    if isinstance(getattr(audio_file, "name", None), str) and os.path.exists(audio_file.name):
+        yield audio_file.name
+        return
+    # The system temp folder stands in when TEMP_FILES_FOLDER is not set
+    with tempfile.NamedTemporaryFile(suffix=os.path.splitext(name)[1] or ".audio", dir=Config.TEMP_FILES_FOLDER or None) as spill:
+        audio_file.seek(0)
+        shutil.copyfileobj(audio_file, spill)
+        spill.flush()
+        audio_file.seek(0)
+        yield spill.name
+
+def plan_audio_chunks(path):
+    # Returns (start, length) windows, or None when one upload of the original file will do
+    probed = probe_audio(path)
+    if probed is None:
+        if os.path.getsize(path) > Config.STT_MAX_UPLOAD_BYTES:
+            logger.warning("Audio file %s is over the upload limit and cannot be split without ffmpeg", path)
+        return None
+    duration, bytes_per_second = probed
+    window = min(Config.STT_CHUNK_SECONDS, Config.STT_MAX_UPLOAD_BYTES * 0.95 / bytes_per_second)
+    if duration <= window and os.path.getsize(path) <= Config.STT_MAX_UPLOAD_BYTES:
+        return None
+    return plan_chunks(duration, window, Config.STT_CHUNK_OVERLAP)
+
+def plan_chunks(duration, window, overlap):
+    # Each window starts overlap seconds before the previous one ends, so no word is cut in half in both
+    window = max(window, 2 * overlap, 1.0)
+    chunks = []
+    start = 0.0
+    while True:
+        length = min(window, duration - start)
+        chunks.append((start, length))
+        if start + length >= duration:
+            return chunks
+        start += window - overlap
+
+def probe_audio(path):
+    # Returns (duration in seconds, bytes per second of an extracted chunk), or None when the file cannot be split here
+    if FFMPEG and FFPROBE:
+        try:
+            result = subprocess.run(
+                [FFPROBE, "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", path],
+                capture_output=True, text=True, check=True,
+            )
+            return float(result.stdout.strip()), CHUNK_BITRATE / 8
+        except (subprocess.CalledProcessError, ValueError) as e:
+            logger.warning("Could not read the duration of %s: %s", path, e)
+            return None
+    if path.lower().endswith(".wav"):
+        with wave.open(path, "rb") as source:
+            rate = source.getframerate()
+            return source.getnframes() / rate, rate * source.getnchannels() * source.getsampwidth()
+    return None
+
+def extract_chunk(path, start, length):
+    # Returns a (file name, file object) pair ready for generate_stt
+    if FFMPEG and FFPROBE:
+        result = subprocess.run(
+            [FFMPEG, "-v", "error", "-ss", f"{start:.3f}", "-t", f"{length:.3f}", "-i", path,
+             "-vn", "-ac", "1", "-ar", "16000", "-b:a", str(CHUNK_BITRATE), "-f", "mp3", "pipe:1"],
+            capture_output=True, check=True,
+        )
+        return "chunk.mp3", io.BytesIO(result.stdout)
+    buffer = io.BytesIO()
+    with wave.open(path, "rb") as source:
+        rate = source.getframerate()
+        source.setpos(min(int(start * rate), source.getnframes()))
+        frames = source.readframes(int(length * rate))
+        with wave.open(buffer, "wb") as target:
+            target.setnchannels(source.getnchannels())
+            target.setsampwidth(source.getsampwidth())
+            target.setframerate(rate)
+            target.writeframes(frames)
+    buffer.seek(0)
+    return "chunk.wav", buffer
+
+def stitch_transcripts(texts):
+    words = []
+    for text in texts:
+        words = merge_overlap(words, (text or "").split())
+    return " ".join(words)
+
+def merge_overlap(previous, following):
+    # Both chunks heard the overlap; find the longest run of words the end of one shares with the start of the other.
+    # The words around it are where a chunk edge cut through speech, so they are dropped on both sides.
+    window = int(Config.STT_CHUNK_OVERLAP * 4) + 10
+    tail = [normalize_word(word) for word in previous[-window:]]
+    head = [normalize_word(word) for word in following[:window]]
+    best_length, best_tail, best_head = 0, 0, 0
+    for i in range(len(tail)):
+        for j in range(len(head)):
+            length = 0
+            while i + length < len(tail) and j + length < len(head) and tail[i + length] and tail[i + length] == head[j + length]:
+                length += 1
+            if length > best_length:
+                best_length, best_tail, best_head = length, i, j
+    if best_length < 2:
+        return previous + following
+    cut = len(previous) - len(tail) + best_tail + best_length
+    return previous[:cut] + following[best_head + best_length:]
+
+def normalize_word(word):
+    return WORD_PATTERN.sub("", word.lower())
+
+def get_stt_client(ai_client, use_async=False):
+    if Config.STT_BACKEND == "fake":
+        return FakeTranscriptionClient(use_async=use_async)
+    return ai_client
+
+class FakeTranscriptionClient:
+    # Offline stand-in for ai_client.audio.transcriptions (STT_BACKEND=fake). WAV input gets one word per second of
+    # audio derived from its samples, so overlapping chunks produce the same words where they overlap.
+    def __init__(self, latency=0.0, use_async=False):
+        self.latency = latency
+        self.calls = 0
+        create = self._async_create if use_async else self._create
+        self.audio = SimpleNamespace(transcriptions=SimpleNamespace(create=create))
+
+    def _create(self, model, file, response_format="text"):
+        time.sleep(self.latency)
+        return self._transcribe(file)
+
+    async def _async_create(self, model, file, response_format="text"):
+        await asyncio.sleep(self.latency)
+        return self._transcribe(file)
+
+    def _transcribe(self, file):
+        self.calls += 1
+        audio_file = file[1] if isinstance(file, tuple) else file
+        data = audio_file.read()
+        try:
+            with wave.open(io.BytesIO(data), "rb") as source:
+                block = source.getframerate()
+                frames = [source.readframes(block) for _ in range(round(source.getnframes() / block))]
+        except wave.Error:
+            frames = [data[i:i + 16384] for i in range(0, len(data), 16384)]
+        return " ".join(f"w{hashlib.sha1(frame).hexdigest()[:6]}" for frame in frames if frame)
@@ -0,0 +1,48 @@
+# slack_ai_assistant/workspace_info.py
+import asyncio
+import threading
+import time
+from config import Config
+from logging_config import logger
+
+class WorkspaceInfo:
+    def __init__(self):
+        self.bot_user_id = None
+        self.bot_id = None
+        self.team_id = None
+
+    def start(self, client):
+        self.refresh(client)
+        def refresh_loop():
+            while True:
+                time.sleep(Config.WORKSPACE_REFRESH_INTERVAL)
+                try:
+                    self.refresh(client)
+                except Exception as e:
+                    logger.error("Problem refreshing bot identity: %s", e)
+        threading.Thread(target=refresh_loop, name="workspace-info", daemon=True).start()
+
+    async def async_start(self, client):
+        await self.async_refresh(client)
+        async def refresh_loop():
+            while True:
+                await asyncio.sleep(Config.WORKSPACE_REFRESH_INTERVAL)
+                try:
+                    await self.async_refresh(client)
+                except Exception as e:
+                    logger.error("Problem refreshing bot identity: %s", e)
+        self._refresh_task = asyncio.create_task(refresh_loop())
+
+    def refresh(self, client):
+        self._set_identity(client.auth_test())
+
+    async def async_refresh(self, client):
+        self._set_identity(await client.auth_test())
+
+    def _set_identity(self, auth):
+        self.bot_user_id = auth["user_id"]
+        self.bot_id = auth.get("bot_id")
+        self.team_id = auth.get("team_id")
+        logger.info("Bot identity resolved: user %s, bot %s, team %s", self.bot_user_id, self.bot_id, self.team_id)
+
+workspace_info = WorkspaceInfo()
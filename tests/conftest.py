@@ -0,0 +1,24 @@
+import os
+import sys
+import tempfile
+
+# The modules read their settings from the environment when first imported
+TEST_FOLDER = tempfile.mkdtemp(prefix="slack_bot_tests_")
+os.environ.update(
+    OPENAI_KEY="test",
+    SLACK_BOT_USER_TOKEN="xoxb-test",
+    SLACK_SIGNING_SECRET="test",
+    TEMP_FILES_FOLDER=TEST_FOLDER,
+    LOG_FILE=os.path.join(TEST_FOLDER, "slack_bot.log"),
+    ATTACHMENT_CACHE_PATH=os.path.join(TEST_FOLDER, "attachment_cache.db"),
+    DEDUPE_PATH=os.path.join(TEST_FOLDER, "dedupe.db"),
+    JOB_QUEUE_PATH=os.path.join(TEST_FOLDER, "jobs.db"),
+    COORDINATION_PATH=os.path.join(TEST_FOLDER, "coordination.db"),
+    RESPONSE_CACHE_PATH=os.path.join(TEST_FOLDER, "response_cache.db"),
+    SEMANTIC_CACHE_FOLDER=os.path.join(TEST_FOLDER, "semantic_cache"),
+)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# config.py builds a Bolt App at import time, which checks the token with Slack; there is no workspace to ask here
+import slack_sdk.web.client
+slack_sdk.web.client.WebClient.auth_test = lambda self, **kwargs: {"ok": True, "user_id": "UBOT", "bot_id": "BBOT", "team_id": "T1"}
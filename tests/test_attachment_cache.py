@@ -0,0 +1,20 @@
+from attachment_cache import AttachmentCache
+
+def test_attachment_cache_finds_reuploads_by_hash(tmp_path):
+    cache = AttachmentCache(str(tmp_path / "attachments.db"), 1000)
+    cache.put("transcript", "F1", "abc", "hello")
+    assert cache.get("transcript", "F1") == "hello"
+    assert cache.get("transcript", "F2") is None
+    assert cache.get_by_hash("transcript", "abc") == "hello"
+    assert cache.get_by_hash("image", "abc") is None
+
+def test_attachment_cache_drops_least_recently_used_payloads(tmp_path):
+    cache = AttachmentCache(str(tmp_path / "attachments.db"), 10)
+    cache.put("transcript", "F1", "a", "12345")
+    cache.put("transcript", "F2", "b", "12345")
+    cache.get("transcript", "F1")
+    cache.put("transcript", "F3", "c", "12345")
+    assert cache.get("transcript", "F2") is None
+    assert cache.get("transcript", "F1") == "12345"
+    cache.put("transcript", "F4", "d", "x" * 11)
+    assert cache.get("transcript", "F4") is None
@@ -0,0 +1,59 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+import async_conversation_processor
+import conversation_processor
+from config import Config
+
+def tool_call(name):
+    return SimpleNamespace(id=f"call_{name}", function=SimpleNamespace(name=name, arguments="{}"))
+
+RESPONSES = [
+    SimpleNamespace(content="Let me check the weather first.", tool_calls=[tool_call("get_weather")]),
+    SimpleNamespace(content="It is sunny.", tool_calls=None),
+]
+
+@pytest.fixture
+def model(monkeypatch):
+    responses = list(RESPONSES)
+    histories = []
+    monkeypatch.setattr(Config, "AGENT_MAX_ITERATIONS", 3)
+    def respond(ai_client, model, system_prompt, history, tools):
+        histories.append(history)
+        return responses.pop(0)
+    async def async_respond(*args):
+        return respond(*args)
+    for module in (conversation_processor, async_conversation_processor):
+        monkeypatch.setattr(module, "semantic_cache", None)
+    monkeypatch.setattr(conversation_processor, "get_gpt_response", respond)
+    monkeypatch.setattr(conversation_processor, "get_conversation_history", lambda client, message: [{"role": "user", "content": message["text"]}])
+    monkeypatch.setattr(conversation_processor, "compact_history", lambda ai_client, system_prompt, history, *args: history)
+    monkeypatch.setattr(async_conversation_processor, "async_get_gpt_response", async_respond)
+    monkeypatch.setattr(async_conversation_processor, "compact_history", lambda ai_client, system_prompt, history, *args: history)
+    async def async_history(client, message):
+        return [{"role": "user", "content": message["text"]}]
+    monkeypatch.setattr(async_conversation_processor, "get_conversation_history", async_history)
+    return histories
+
+MESSAGE = {"channel": "C1", "ts": "100.000100", "text": "weather?"}
+
+def test_tool_calls_run_even_when_the_model_also_wrote_text(model, monkeypatch):
+    executed = []
+    monkeypatch.setattr(conversation_processor, "execute_tool_calls", lambda client, message, calls: executed.extend(calls) or ["sunny, 21C"])
+    assert conversation_processor.process_conversation(None, MESSAGE, []) == "It is sunny."
+    assert [call.function.name for call in executed] == ["get_weather"]
+    assert model[1][-1] == {"role": "tool", "tool_call_id": "call_get_weather", "content": "sunny, 21C"}
+
+def test_async_tool_calls_run_even_when_the_model_also_wrote_text(model, monkeypatch):
+    executed = []
+    async def execute(client, message, calls):
+        executed.extend(calls)
+        return ["sunny, 21C"]
+    monkeypatch.setattr(async_conversation_processor, "execute_tool_calls", execute)
+    assert asyncio.run(async_conversation_processor.process_conversation(None, MESSAGE, [])) == "It is sunny."
+    assert [call.function.name for call in executed] == ["get_weather"]
+
+def test_single_iteration_posts_the_tool_output(model, monkeypatch):
+    monkeypatch.setattr(Config, "AGENT_MAX_ITERATIONS", 1)
+    monkeypatch.setattr(conversation_processor, "execute_tool_calls", lambda client, message, calls: ["sunny, 21C"])
+    assert conversation_processor.process_conversation(None, MESSAGE, []) == "sunny, 21C"
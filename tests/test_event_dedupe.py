@@ -0,0 +1,62 @@
+import asyncio
+import threading
+import time
+from event_dedupe import EventDeduplicator, MemoryDedupeStore, SqliteDedupeStore, event_keys
+
+def make_deduplicator(in_flight_mode="drop", stores=None):
+    return EventDeduplicator(stores or [MemoryDedupeStore(100, 60)], in_flight_mode, 5)
+
+def test_event_keys_cover_the_event_id_and_the_message():
+    assert event_keys({"channel": "C1", "ts": "1.0"}, "Ev1") == ["event:Ev1", "message:C1:1.0"]
+    assert event_keys({"channel": "C1", "ts": "1.0"}) == ["message:C1:1.0"]
+
+def test_retry_of_a_handled_event_is_dropped():
+    deduplicator = make_deduplicator()
+    keys = event_keys({"channel": "C1", "ts": "1.0"}, "Ev1")
+    assert deduplicator.begin(keys)
+    assert not deduplicator.begin(keys)
+    deduplicator.finish(keys, True)
+    assert not deduplicator.begin(keys)
+
+def test_same_message_as_mention_and_message_event_runs_once():
+    deduplicator = make_deduplicator()
+    assert deduplicator.begin(event_keys({"channel": "C1", "ts": "1.0"}, "Ev1"))
+    assert not deduplicator.begin(event_keys({"channel": "C1", "ts": "1.0"}, "Ev2"))
+
+def test_failed_event_lets_the_retry_through():
+    deduplicator = make_deduplicator()
+    keys = event_keys({"channel": "C1", "ts": "1.0"}, "Ev1")
+    assert deduplicator.begin(keys)
+    deduplicator.finish(keys, False)
+    assert deduplicator.begin(keys)
+
+def test_wait_mode_runs_the_duplicate_once_the_original_fails():
+    deduplicator = make_deduplicator("wait")
+    keys = event_keys({"channel": "C1", "ts": "1.0"}, "Ev1")
+    assert deduplicator.begin(keys)
+    threading.Timer(0.05, deduplicator.finish, (keys, False)).start()
+    started_at = time.monotonic()
+    assert deduplicator.begin(keys)
+    assert time.monotonic() - started_at < 4
+
+def test_async_begin_drops_duplicates():
+    deduplicator = make_deduplicator()
+    keys = event_keys({"channel": "C1", "ts": "1.0"}, "Ev1")
+    async def run():
+        return await deduplicator.async_begin(keys), await deduplicator.async_begin(keys)
+    assert asyncio.run(run()) == (True, False)
+
+def test_memory_store_forgets_claims_after_the_ttl():
+    store = MemoryDedupeStore(100, 0.05)
+    assert store.claim("k")
+    assert not store.claim("k")
+    time.sleep(0.06)
+    assert store.claim("k")
+
+def test_sqlite_store_claims_are_shared_between_processes(tmp_path):
+    path = str(tmp_path / "dedupe.db")
+    first, second = SqliteDedupeStore(path, 60), SqliteDedupeStore(path, 60)
+    assert first.claim("event:Ev1")
+    assert not second.claim("event:Ev1")
+    first.release("event:Ev1")
+    assert second.claim("event:Ev1")
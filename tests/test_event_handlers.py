@@ -0,0 +1,47 @@
+import pytest
+from slack_sdk.errors import SlackApiError
+import event_handlers
+from config import Config
+from job_queue import EventJob, SqliteJobQueue
+from rate_limiter import ThrottledSlackClient
+
+class ReactedSlack:
+    # The reaction was added by the run that was interrupted, so Slack refuses to add it again
+    def __init__(self):
+        self.posted = []
+
+    def reactions_add(self, **kwargs):
+        raise SlackApiError("already_reacted", {"ok": False, "error": "already_reacted"})
+
+    def reactions_remove(self, **kwargs):
+        return {"ok": True}
+
+    def chat_postMessage(self, **kwargs):
+        self.posted.append(kwargs)
+        return {"ok": True, "ts": "200.000100"}
+
+def test_recovered_job_is_answered_even_though_it_already_reacted(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "WORKER_ID", "worker-a")
+    db_path = str(tmp_path / "jobs.db")
+    SqliteJobQueue(db_path, 3).put(EventJob("dm", {"channel": "D1", "ts": "100.000100", "text": "hi", "user": "U1"}, event_id="Ev1"))
+
+    # Restart: a fresh queue on the same file replays the job through the normal worker path
+    queue = SqliteJobQueue(db_path, 3)
+    monkeypatch.setattr(event_handlers, "job_queue", queue)
+    monkeypatch.setattr(event_handlers, "deduplicator", None)
+    monkeypatch.setattr(event_handlers, "new_reply", lambda *args, **kwargs: None)
+    monkeypatch.setattr(event_handlers, "process_conversation", lambda client, event, tools, reply=None: "hello again")
+    (job,) = queue.recover()
+    slack = ReactedSlack()
+    event_handlers.run_job(ThrottledSlackClient(slack), job)
+
+    assert [message["text"] for message in slack.posted] == ["hello again"]
+    assert queue.recover() == []
+
+def test_other_reaction_errors_still_fail_the_job():
+    class BrokenSlack(ReactedSlack):
+        def reactions_add(self, **kwargs):
+            raise SlackApiError("channel_not_found", {"ok": False, "error": "channel_not_found"})
+
+    with pytest.raises(SlackApiError):
+        event_handlers.add_reaction(BrokenSlack(), {"channel": "D1", "ts": "100.000100"})
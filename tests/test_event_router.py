@@ -0,0 +1,30 @@
+import pytest
+import event_router
+from event_router import compile_trigger_pattern, route_message
+from workspace_info import workspace_info
+
+@pytest.fixture(autouse=True)
+def trigger_words(monkeypatch):
+    monkeypatch.setattr(event_router, "trigger_pattern", compile_trigger_pattern("gpt, !ask"))
+
+def test_edits_and_bot_posts_are_rejected():
+    assert route_message({"subtype": "message_changed", "channel_type": "im"}) == (None, None)
+    assert route_message({"bot_id": "B1", "channel_type": "im", "text": "hi"}) == (None, None)
+
+def test_direct_messages():
+    assert route_message({"channel_type": "im", "ts": "1.0", "text": "hi"}) == ("dm", None)
+    assert route_message({"channel_type": "im", "ts": "2.0", "thread_ts": "1.0", "text": "hi"}) == ("dm", "1.0")
+    assert route_message({"channel_type": "im", "subtype": "file_share", "ts": "1.0"}) == ("dm_file_share", None)
+
+def test_replies_in_threads_the_bot_started():
+    event = {"channel_type": "channel", "ts": "2.0", "thread_ts": "1.0", "parent_user_id": workspace_info.bot_user_id, "text": "and?"}
+    assert route_message(event) == ("thread_reply", "1.0")
+    assert route_message({**event, "parent_user_id": "USOMEONE"}) == (None, None)
+
+def test_trigger_words_match_whole_words_only():
+    assert route_message({"channel_type": "channel", "ts": "1.0", "text": "hey GPT, help"}) == ("trigger_word", "1.0")
+    assert route_message({"channel_type": "channel", "ts": "1.0", "text": "!ask what now"}) == ("trigger_word", "1.0")
+    assert route_message({"channel_type": "channel", "ts": "1.0", "text": "chatgpts are fun"}) == (None, None)
+
+def test_empty_trigger_list_compiles_to_nothing():
+    assert compile_trigger_pattern(" , ") is None
@@ -0,0 +1,55 @@
+import pytest
+from config import Config
+from job_queue import EventJob, SqliteJobQueue
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "WORKER_ID", "worker-a")
+    return str(tmp_path / "jobs.db")
+
+def make_job(ts):
+    return EventJob("direct_message", {"channel": "D1", "ts": ts, "text": "hi"}, event_id=f"Ev{ts}")
+
+def test_restart_recovers_unacknowledged_jobs(db_path):
+    queue = SqliteJobQueue(db_path, 3)
+    queue.put(make_job("1.0"))
+    done = make_job("2.0")
+    queue.put(done)
+    queue.ack(done)
+    queue.put(make_job("3.0"))
+
+    recovered = SqliteJobQueue(db_path, 3).recover()
+    assert [(job.event["ts"], job.attempts) for job in recovered] == [("1.0", 1), ("3.0", 1)]
+    assert recovered[0].route == "direct_message" and recovered[0].event_id == "Ev1.0"
+
+def test_recovery_ignores_a_changed_worker_id_without_coordination(db_path, monkeypatch):
+    SqliteJobQueue(db_path, 3).put(make_job("1.0"))
+    monkeypatch.setattr(Config, "WORKER_ID", "worker-b")
+    assert [job.event["ts"] for job in SqliteJobQueue(db_path, 3).recover()] == ["1.0"]
+
+def test_recovery_leaves_jobs_of_live_workers(db_path):
+    queue = SqliteJobQueue(db_path, 3)
+    queue.put(make_job("1.0"))
+    queue.put(make_job("2.0"), "worker-b")
+    queue.put(make_job("3.0"), "worker-dead")
+    recovered = SqliteJobQueue(db_path, 3).recover({"worker-a", "worker-b"})
+    assert sorted(job.event["ts"] for job in recovered) == ["1.0", "3.0"]
+
+def test_poison_job_is_dropped_after_max_attempts(db_path):
+    SqliteJobQueue(db_path, 2).put(make_job("1.0"))
+    assert len(SqliteJobQueue(db_path, 2).recover()) == 1
+    assert SqliteJobQueue(db_path, 2).recover() == []
+
+def test_forwarded_job_is_taken_by_its_owner_only(db_path):
+    queue = SqliteJobQueue(db_path, 3)
+    queue.put(make_job("1.0"), "worker-b")
+    assert queue.take_forwarded("worker-c", {"worker-a", "worker-b", "worker-c"}) == []
+    (job,) = queue.take_forwarded("worker-b", {"worker-a", "worker-b"})
+    assert job.event["ts"] == "1.0" and job.attempts == 0
+    assert queue.take_forwarded("worker-b", {"worker-a", "worker-b"}) == []
+
+def test_jobs_of_a_dead_worker_are_taken_over(db_path):
+    queue = SqliteJobQueue(db_path, 3)
+    queue.put(make_job("1.0"))
+    (job,) = queue.take_forwarded("worker-b", {"worker-b"})
+    assert job.attempts == 1
@@ -0,0 +1,88 @@
+import asyncio
+import time
+from types import SimpleNamespace
+import pytest
+from slack_sdk.errors import SlackApiError
+from config import Config
+from rate_limiter import CircuitBreaker, CircuitOpenError, TokenBucket, async_call_with_retry, call_with_retry, classify_error
+
+class HttpError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(status_code=status_code, headers=headers or {})
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(Config, "RETRY_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(Config, "RETRY_BASE_DELAY", 0.001)
+    monkeypatch.setattr(Config, "RETRY_MAX_DELAY", 0.001)
+
+def test_rate_limited_calls_retry_after_the_given_delay_without_tripping_the_circuit():
+    assert classify_error(HttpError(429, {"Retry-After": "3"})) == (True, 3.0, False)
+
+def test_server_errors_retry_and_count_towards_the_circuit():
+    assert classify_error(HttpError(503)) == (True, None, True)
+    assert classify_error(ConnectionError("reset")) == (True, None, True)
+
+def test_client_errors_are_not_retried():
+    assert classify_error(HttpError(400)) == (False, None, False)
+    # Slack reports most API errors with HTTP 200
+    assert classify_error(SlackApiError("already_reacted", SimpleNamespace(status_code=200, headers={}))) == (False, None, False)
+
+def test_transient_failure_is_retried_until_it_succeeds():
+    outcomes = [HttpError(502), TimeoutError(), "ok"]
+    def call():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    assert call_with_retry("test.retry_success", call) == "ok"
+    assert outcomes == []
+
+def test_retries_stop_at_the_attempt_limit():
+    calls = []
+    def call():
+        calls.append(1)
+        raise HttpError(500)
+    with pytest.raises(HttpError):
+        call_with_retry("test.retry_limit", call)
+    assert len(calls) == 3
+
+def test_non_retryable_error_is_raised_at_once():
+    calls = []
+    def call():
+        calls.append(1)
+        raise HttpError(404)
+    with pytest.raises(HttpError):
+        call_with_retry("test.no_retry", call)
+    assert len(calls) == 1
+
+def test_async_retry():
+    outcomes = [HttpError(503), "ok"]
+    async def call():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    assert asyncio.run(async_call_with_retry("test.async_retry", call)) == "ok"
+
+def test_circuit_opens_after_repeated_failures_and_probes_after_the_timeout():
+    breaker = CircuitBreaker("test.circuit", 2, 0.05)
+    breaker.record_failure()
+    breaker.check()
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    time.sleep(0.06)
+    breaker.check()
+    # The probe failed, so the circuit opens again straight away
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+def test_token_bucket_makes_callers_wait_once_empty():
+    bucket = TokenBucket("test.bucket", 60, capacity=2)
+    assert bucket._reserve(1) == 0.0
+    assert bucket._reserve(1) == 0.0
+    assert bucket._reserve(1) == pytest.approx(1.0, abs=0.05)
@@ -0,0 +1,99 @@
+import threading
+import time
+import pytest
+from scheduler import BaseScheduler, Job, QueueFullError, WorkScheduler, is_cancelled
+
+def make_scheduler(workers=2, max_queue=10, per_user=5, per_channel=5, **kwargs):
+    return BaseScheduler("test", workers, max_queue, per_user, per_channel, **kwargs)
+
+def test_full_queue_rejects_new_work():
+    scheduler = make_scheduler(max_queue=2)
+    scheduler._enqueue(Job(None, "U1", "C1"))
+    scheduler._enqueue(Job(None, "U2", "C1"))
+    with pytest.raises(QueueFullError) as error:
+        scheduler._enqueue(Job(None, "U3", "C1"))
+    assert error.value.depth == 2
+
+def test_position_is_zero_only_while_a_worker_is_free():
+    scheduler = make_scheduler(workers=1)
+    assert scheduler._enqueue(Job(None, "U1", "C1")) == 0
+    scheduler._take_runnable()
+    assert scheduler._enqueue(Job(None, "U2", "C2")) == 1
+    assert scheduler._enqueue(Job(None, "U3", "C3")) == 2
+
+def test_per_user_cap_lets_other_users_go_first():
+    scheduler = make_scheduler(workers=3, per_user=1)
+    first, second, other = Job(None, "U1", "C1"), Job(None, "U1", "C2"), Job(None, "U2", "C3")
+    for job in (first, second, other):
+        scheduler._enqueue(job)
+    assert scheduler._take_runnable() is first
+    assert scheduler._take_runnable() is other
+    assert scheduler._take_runnable() is None
+    scheduler._release(first)
+    assert scheduler._take_runnable() is second
+
+def test_per_channel_cap():
+    scheduler = make_scheduler(workers=3, per_channel=1)
+    first, second = Job(None, "U1", "C1"), Job(None, "U2", "C1")
+    scheduler._enqueue(first)
+    scheduler._enqueue(second)
+    assert scheduler._take_runnable() is first
+    assert scheduler._take_runnable() is None
+    scheduler._release(first)
+    assert scheduler._take_runnable() is second
+
+def test_work_scheduler_never_runs_more_than_its_workers():
+    scheduler = WorkScheduler("test-pool", 2, 20, 10, 10)
+    running, peak, done = [0], [0], threading.Semaphore(0)
+    lock = threading.Lock()
+    def work():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        done.release()
+    for index in range(6):
+        scheduler.submit(work, f"U{index}", f"C{index}")
+    for _ in range(6):
+        assert done.acquire(timeout=5)
+    assert peak[0] == 2
+
+def test_same_thread_jobs_run_one_at_a_time_in_order():
+    scheduler = make_scheduler(workers=3)
+    first, second, other = Job(None, "U1", "C1", "C1:1"), Job(None, "U1", "C1", "C1:1"), Job(None, "U2", "C1", "C1:2")
+    scheduler._enqueue(first)
+    scheduler._take_runnable()
+    # Waiting only for its own thread is not a queue position worth telling the user about
+    assert scheduler._enqueue(second) == 0
+    scheduler._enqueue(other)
+    assert scheduler._take_runnable() is other
+    assert scheduler._take_runnable() is None
+    scheduler._release(first)
+    assert scheduler._take_runnable() is second
+
+def test_coalescing_cancels_older_runs_of_the_thread():
+    scheduler = make_scheduler(workers=1, coalesce_threads=True)
+    running, queued, latest = Job(None, "U1", "C1", "C1:1"), Job(None, "U1", "C1", "C1:1"), Job(None, "U1", "C1", "C1:1")
+    scheduler._enqueue(running)
+    scheduler._take_runnable()
+    scheduler._enqueue(queued)
+    scheduler._enqueue(latest)
+    assert running.cancelled.is_set() and queued.cancelled.is_set()
+    assert not latest.cancelled.is_set()
+
+def test_superseded_job_sees_is_cancelled():
+    scheduler = WorkScheduler("test-coalesce", 1, 10, 10, 10, True, True)
+    started, release, seen = threading.Event(), threading.Event(), []
+    def first():
+        started.set()
+        release.wait(5)
+        seen.append(is_cancelled())
+    scheduler.submit(first, "U1", "C1", "C1:1")
+    assert started.wait(5)
+    finished = threading.Event()
+    scheduler.submit(lambda: (seen.append(is_cancelled()), finished.set()), "U1", "C1", "C1:1")
+    release.set()
+    assert finished.wait(5)
+    assert seen == [True, False]
@@ -0,0 +1,47 @@
+import pytest
+from semantic_cache import SemanticCache, normalize_question, single_turn_question, to_vector
+
+@pytest.fixture(params=["flat", "lsh"])
+def folder_and_index(request, tmp_path):
+    return str(tmp_path / "semantic"), request.param
+
+def test_close_question_reuses_the_answer(folder_and_index):
+    folder, index = folder_and_index
+    cache = SemanticCache(folder, 4, 0.95, 3600, index)
+    cache.add("what is the vpn address", to_vector([1, 0, 0.01]), "vpn.example.com", 2.5)
+    assert cache.search(to_vector([1, 0, 0.02])) == ("vpn.example.com", 2.5)
+    assert cache.search(to_vector([0, 1, 0])) is None
+
+def test_workers_sharing_the_folder_never_overwrite_each_other(folder_and_index):
+    folder, index = folder_and_index
+    first, second = SemanticCache(folder, 4, 0.95, 3600, index), SemanticCache(folder, 4, 0.95, 3600, index)
+    first.add("a", to_vector([1, 0, 0]), "A", 1.0)
+    second.add("b", to_vector([0, 1, 0]), "B", 1.0)
+    first.add("c", to_vector([0, 0, 1]), "C", 1.0)
+    for cache in (first, second):
+        assert [cache.search(to_vector(vector))[0] for vector in ([1, 0, 0], [0, 1, 0], [0, 0, 1])] == ["A", "B", "C"]
+
+def test_answers_survive_a_restart(folder_and_index):
+    folder, index = folder_and_index
+    SemanticCache(folder, 4, 0.95, 3600, index).add("a", to_vector([1, 0, 0]), "A", 1.0)
+    assert SemanticCache(folder, 4, 0.95, 3600, index).search(to_vector([1, 0, 0])) == ("A", 1.0)
+
+def test_full_cache_replaces_the_least_recently_used_answer(tmp_path):
+    cache = SemanticCache(str(tmp_path), 2, 0.95, 3600, "flat")
+    cache.add("a", to_vector([1, 0, 0]), "A", 1.0)
+    cache.add("b", to_vector([0, 1, 0]), "B", 1.0)
+    cache.search(to_vector([1, 0, 0]))
+    cache.add("c", to_vector([0, 0, 1]), "C", 1.0)
+    assert cache.search(to_vector([0, 1, 0])) is None
+    assert cache.search(to_vector([1, 0, 0]))[0] == "A"
+
+def test_expired_answers_are_not_reused(tmp_path):
+    cache = SemanticCache(str(tmp_path), 2, 0.95, -1, "flat")
+    cache.add("a", to_vector([1, 0, 0]), "A", 1.0)
+    assert cache.search(to_vector([1, 0, 0])) is None
+
+def test_only_lone_plain_questions_are_cacheable():
+    assert normalize_question("<@U123> What is the VPN address?") == "what is the vpn address"
+    assert single_turn_question([{"role": "user", "content": "Hello there!"}]) == "hello there"
+    assert single_turn_question([{"role": "user", "content": "a"}, {"role": "assistant", "content": "b"}]) is None
+    assert single_turn_question([{"role": "user", "content": [{"type": "text", "text": "a"}]}]) is None
@@ -0,0 +1,39 @@
+import time
+from thread_cache import ThreadHistoryCache
+
+def test_thread_cache_returns_history_and_last_ts():
+    cache = ThreadHistoryCache(10000, 60)
+    cache.put(("C1", "1.0"), [{"role": "user", "content": "hi"}], "1.5")
+    assert cache.get(("C1", "1.0")) == ([{"role": "user", "content": "hi"}], "1.5")
+    assert cache.get(("C1", "2.0")) is None
+
+def test_thread_cache_keeps_the_newer_view_of_a_thread():
+    cache = ThreadHistoryCache(10000, 60)
+    cache.put(("C1", "1.0"), [{"role": "user", "content": "newer"}], "1.9")
+    cache.put(("C1", "1.0"), [{"role": "user", "content": "older"}], "1.10")
+    assert cache.get(("C1", "1.0"))[1] == "1.10"
+    cache.put(("C1", "1.0"), [{"role": "user", "content": "stale"}], "1.2")
+    assert cache.get(("C1", "1.0"))[0] == [{"role": "user", "content": "older"}]
+
+def test_thread_cache_keeps_the_summary_when_history_grows():
+    cache = ThreadHistoryCache(10000, 60)
+    cache.put(("C1", "1.0"), [], "1.1")
+    cache.set_summary(("C1", "1.0"), "earlier talk", 4)
+    cache.put(("C1", "1.0"), [{"role": "user", "content": "more"}], "1.2")
+    assert cache.get_summary(("C1", "1.0")) == ("earlier talk", 4)
+
+def test_thread_cache_evicts_least_recently_used_threads_over_budget():
+    cache = ThreadHistoryCache(150, 60)
+    message = [{"role": "user", "content": "x" * 30}]
+    cache.put(("C1", "1.0"), message, "1.1")
+    cache.put(("C1", "2.0"), message, "2.1")
+    cache.get(("C1", "1.0"))
+    cache.put(("C1", "3.0"), message, "3.1")
+    assert cache.get(("C1", "2.0")) is None
+    assert cache.get(("C1", "1.0")) is not None
+
+def test_thread_cache_expires_idle_threads():
+    cache = ThreadHistoryCache(10000, 0.05)
+    cache.put(("C1", "1.0"), [], "1.1")
+    time.sleep(0.06)
+    assert cache.get(("C1", "1.0")) is None
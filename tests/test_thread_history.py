@@ -0,0 +1,78 @@
+import asyncio
+import pytest
+import async_conversation_processor
+import conversation_processor
+from config import Config
+from slack_reply import SlackReply, AsyncSlackReply
+
+class FakeSlack:
+    # One thread kept in memory, with the parts of the Web API the history and the streamed reply use
+    def __init__(self):
+        self.messages = []
+        self.clock = 100
+
+    def post(self, text, **fields):
+        self.clock += 1
+        ts = f"{self.clock}.000100"
+        self.messages.append({"ts": ts, "text": text, **fields})
+        return ts
+
+    def chat_postMessage(self, channel, text, thread_ts=None):
+        return {"ts": self.post(text, bot_id="BBOT")}
+
+    def chat_update(self, channel, ts, text):
+        next(msg for msg in self.messages if msg["ts"] == ts)["text"] = text
+
+    def chat_delete(self, channel, ts):
+        self.messages = [msg for msg in self.messages if msg["ts"] != ts]
+
+    def conversations_replies(self, channel, ts, oldest=None):
+        return {"messages": [dict(msg) for msg in self.messages if oldest is None or float(msg["ts"]) >= float(oldest)]}
+
+class AsyncFakeSlack(FakeSlack):
+    async def chat_postMessage(self, channel, text, thread_ts=None):
+        return FakeSlack.chat_postMessage(self, channel, text, thread_ts)
+
+    async def chat_update(self, channel, ts, text):
+        FakeSlack.chat_update(self, channel, ts, text)
+
+    async def conversations_replies(self, channel, ts, oldest=None):
+        return FakeSlack.conversations_replies(self, channel, ts, oldest)
+
+@pytest.fixture(autouse=True)
+def thread_cache_enabled(monkeypatch):
+    monkeypatch.setattr(Config, "THREAD_CACHE_ENABLED", True)
+    conversation_processor.thread_cache.invalidate(("C1", "101.000100"))
+
+def user_says(slack, text):
+    slack.post(text, client_msg_id=text, user="U1")
+
+def test_streamed_answer_enters_the_cached_history():
+    slack = FakeSlack()
+    user_says(slack, "parent question")
+    user_says(slack, "first question")
+    reply = SlackReply(slack, "C1", "101.000100")
+    # The placeholder goes up before the history is read, as process_conversation does it
+    reply.start()
+    conversation_processor.get_thread_history(slack, "C1", "101.000100")
+    reply.finish("ANSWER ONE")
+    user_says(slack, "second question")
+
+    history = conversation_processor.get_thread_history(slack, "C1", "101.000100")
+    assert [msg["content"] for msg in history] == ["parent question", "first question", "ANSWER ONE", "second question"]
+
+def test_async_streamed_answer_enters_the_cached_history():
+    slack = AsyncFakeSlack()
+    user_says(slack, "parent question")
+    user_says(slack, "first question")
+
+    async def run():
+        reply = AsyncSlackReply(slack, "C1", "101.000100")
+        await reply.start()
+        await async_conversation_processor.get_thread_history(slack, "C1", "101.000100")
+        await reply.finish("ANSWER ONE")
+        user_says(slack, "second question")
+        return await async_conversation_processor.get_thread_history(slack, "C1", "101.000100")
+
+    history = asyncio.run(run())
+    assert [msg["content"] for msg in history] == ["parent question", "first question", "ANSWER ONE", "second question"]
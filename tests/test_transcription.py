@@ -0,0 +1,65 @@
+import asyncio
+import io
+import random
+import wave
+import pytest
+import transcription
+from config import Config
+from transcription import FakeTranscriptionClient, plan_chunks, stitch_transcripts, transcribe_audio, async_transcribe_audio
+
+def make_wav(seconds, rate=8000):
+    rng = random.Random(seconds)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as target:
+        target.setnchannels(1)
+        target.setsampwidth(2)
+        target.setframerate(rate)
+        target.writeframes(bytes(rng.getrandbits(8) for _ in range(rate * 2 * seconds)))
+    return buffer.getvalue()
+
+@pytest.fixture
+def chunking(monkeypatch):
+    # No ffmpeg needed: WAV input is split with the wave module
+    monkeypatch.setattr(transcription, "FFMPEG", None)
+    monkeypatch.setattr(Config, "STT_CHUNK_SECONDS", 60.0)
+    monkeypatch.setattr(Config, "STT_CHUNK_OVERLAP", 2.0)
+    monkeypatch.setattr(Config, "STT_CHUNK_MIN_BYTES", 0)
+
+def test_plan_chunks_overlap_and_cover_the_whole_recording():
+    chunks = plan_chunks(300, 60, 2)
+    assert chunks[0] == (0.0, 60)
+    for (start, length), (next_start, _) in zip(chunks, chunks[1:]):
+        assert next_start == start + length - 2
+    last_start, last_length = chunks[-1]
+    assert last_start + last_length == 300
+
+def test_plan_chunks_short_recording_is_one_window():
+    assert plan_chunks(45, 60, 2) == [(0.0, 45)]
+
+def test_stitch_transcripts_drops_the_repeated_overlap():
+    assert stitch_transcripts(["hello there how are you doing tod", "are you doing today, my friend?"]) == "hello there how are you doing today, my friend?"
+    assert stitch_transcripts(["one two", "three four"]) == "one two three four"
+
+def test_chunked_transcript_matches_a_single_pass(chunking):
+    audio = make_wav(300)
+    expected = FakeTranscriptionClient()._transcribe(("full.wav", io.BytesIO(audio)))
+    client = FakeTranscriptionClient()
+    partials = []
+    result = transcribe_audio(client, ("voice.wav", io.BytesIO(audio)), "whisper-1", partials.append)
+    assert result == expected
+    assert client.calls == len(plan_chunks(300, 60, 2))
+    assert partials and all(expected.startswith(partial) for partial in partials)
+
+def test_async_chunked_transcript_matches_a_single_pass(chunking):
+    audio = make_wav(200)
+    expected = FakeTranscriptionClient()._transcribe(("full.wav", io.BytesIO(audio)))
+    client = FakeTranscriptionClient(use_async=True)
+    result = asyncio.run(async_transcribe_audio(client, ("voice.wav", io.BytesIO(audio)), "whisper-1"))
+    assert result == expected
+    assert client.calls == len(plan_chunks(200, 60, 2))
+
+def test_short_note_is_sent_in_one_upload(chunking, monkeypatch):
+    monkeypatch.setattr(transcription, "audio_path", None)
+    client = FakeTranscriptionClient()
+    transcribe_audio(client, ("voice.wav", io.BytesIO(make_wav(300))), "whisper-1", duration=30)
+    assert client.calls == 1